@@ -0,0 +1,130 @@
+"""
+Benchmark file serving through Python against the offloaded (X-Accel-Redirect)
+path: throughput and server CPU seconds per GB served.
+
+Start the stack twice (FILE_SERVING_MODE=python, then x-accel-redirect behind
+deploy/nginx/docstorage.conf) or run both side by side on different ports,
+mint a signed URL for a large document, and pass one URL per mode:
+
+    python benchmarks/file_serving.py \
+        --target python=http://127.0.0.1:5000/docs/signed/<token> \
+        --target x-accel=http://127.0.0.1:8080/docs/signed/<token> \
+        --pid <gateway pid> --pid <docs service pid> --requests 200 --concurrency 8
+
+Server CPU is read from /proc for each --pid and its child processes (so
+gunicorn masters cover their workers); nginx workers can be added the same
+way. Linux only.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def _process_tree(pid):
+    """Return pid and all of its descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Fields after the command name, which may contain spaces
+                fields = f.read().rsplit(')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError):
+            continue
+
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def cpu_seconds(pids):
+    """Total user + system CPU seconds used by the given processes and their children"""
+    total = 0
+    for root in pids:
+        for pid in _process_tree(root):
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+                total += int(fields[11]) + int(fields[12])
+            except (OSError, IndexError):
+                continue
+    return total / CLOCK_TICKS
+
+
+def fetch(session, url, chunk_size):
+    received = 0
+    with session.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received += len(chunk)
+    return received
+
+
+def run_target(name, url, args):
+    local = threading.local()
+
+    def worker(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return fetch(local.session, url, args.chunk_size)
+
+    # Warm up connections and the page cache
+    for _ in range(min(args.concurrency, args.requests)):
+        worker(None)
+
+    cpu_before = cpu_seconds(args.pid)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        total_bytes = sum(pool.map(worker, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    cpu_used = cpu_seconds(args.pid) - cpu_before
+
+    gigabytes = total_bytes / 1024 ** 3
+    return {
+        'name': name,
+        'requests': args.requests,
+        'gigabytes': gigabytes,
+        'seconds': elapsed,
+        'mb_per_s': total_bytes / 1024 ** 2 / elapsed if elapsed else 0,
+        'req_per_s': args.requests / elapsed if elapsed else 0,
+        'cpu_s_per_gb': cpu_used / gigabytes if gigabytes and args.pid else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True,
+                        help='name=url of a file to download, once per serving mode')
+    parser.add_argument('--pid', action='append', type=int, default=[],
+                        help='server process to measure CPU for (repeatable)')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target:
+        name, _, url = target.partition('=')
+        results.append(run_target(name, url, args))
+
+    print(f"{'mode':<12} {'requests':>9} {'GB':>8} {'seconds':>9} {'MB/s':>9} {'req/s':>8} {'CPU s/GB':>9}")
+    for r in results:
+        cpu = f"{r['cpu_s_per_gb']:.2f}" if r['cpu_s_per_gb'] is not None else 'n/a'
+        print(f"{r['name']:<12} {r['requests']:>9} {r['gigabytes']:>8.3f} {r['seconds']:>9.2f} "
+              f"{r['mb_per_s']:>9.1f} {r['req_per_s']:>8.1f} {cpu:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+Code shared by the API gateway (main.py) and the services.
+
+Each service's app package puts the repository root on sys.path before
+importing from here, so the services still run from their own directories.
+"""
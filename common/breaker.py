@@ -0,0 +1,135 @@
+"""
+Circuit breakers for calls to other services.
+
+A breaker watches the last ``window`` calls to one service. Calls that
+raise, that the caller classifies as failed (e.g. a 5xx response) or that
+take longer than ``slow_seconds`` count as failures. Once at least
+``min_calls`` were seen and the failure rate reaches ``error_rate`` the
+breaker opens: calls fail immediately with CircuitOpen for
+``open_seconds``, instead of tying up a worker on a service that is down
+or hanging. After that one probe call at a time is let through
+(half-open); a success closes the breaker, a failure opens it again.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+ERROR_RATE = float(os.getenv('BREAKER_ERROR_RATE', 0.5))
+MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', 10))
+WINDOW = int(os.getenv('BREAKER_WINDOW', 20))
+SLOW_SECONDS = float(os.getenv('BREAKER_SLOW_SECONDS', 5))
+OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+
+# Default for CircuitBreaker.call's slow_seconds: the breaker's own threshold
+_BREAKER_DEFAULT = object()
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling a service whose breaker is open.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Breaker for the calls to one service. Thread-safe.
+    """
+
+    def __init__(self, name, error_rate=ERROR_RATE, min_calls=MIN_CALLS, window=WINDOW,
+                 slow_seconds=SLOW_SECONDS, open_seconds=OPEN_SECONDS, is_failure=None):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.is_failure = is_failure or (lambda result: False)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._calls = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        self._probing = False
+
+    def _acquire(self):
+        """
+        Whether this call may go ahead; the return value marks a half-open probe.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            now = time.monotonic()
+            retry_after = self.opened_at + self.open_seconds - now
+            if self.state == OPEN and retry_after <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            raise CircuitOpen(self.name, max(retry_after, 0.0))
+
+    def _record(self, failed, probe):
+        with self._lock:
+            if probe:
+                if failed:
+                    self._open(time.monotonic())
+                else:
+                    self.state = CLOSED
+                    self._probing = False
+                    self._calls.clear()
+                return
+            if self.state != CLOSED:
+                # A call started before the breaker opened
+                return
+            self._calls.append(failed)
+            if len(self._calls) >= self.min_calls and sum(self._calls) >= self.error_rate * len(self._calls):
+                self._open(time.monotonic())
+
+    def call(self, fn, *args, slow_seconds=_BREAKER_DEFAULT, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` through the breaker. Raises CircuitOpen
+        without calling ``fn`` while the breaker is open. ``slow_seconds``
+        overrides the breaker's latency threshold for this call; None
+        exempts it (long exports and bulk requests).
+        """
+        probe = self._acquire()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._record(True, probe)
+            raise
+        elapsed = time.perf_counter() - started
+        limit = self.slow_seconds if slow_seconds is _BREAKER_DEFAULT else slow_seconds
+        slow = limit is not None and elapsed > limit
+        self._record(slow or self.is_failure(result), probe)
+        return result
+
+    def snapshot(self):
+        """
+        The breaker's state, for health views.
+        """
+        with self._lock:
+            snapshot = {
+                'state': self.state,
+                'recent_calls': len(self._calls),
+                'recent_failures': sum(self._calls),
+                'times_opened': self.times_opened
+            }
+            if self.state != CLOSED:
+                snapshot['retry_in'] = round(max(self.opened_at + self.open_seconds - time.monotonic(), 0.0), 1)
+            return snapshot
@@ -0,0 +1,50 @@
+"""
+Searchable text extraction for stored documents.
+
+The docs service runs it on upload and the search service on reindex, so
+both produce the same content for a file.
+"""
+import threading
+
+_local = threading.local()
+
+
+def get_mime_detector():
+    """
+    Return a libmagic handle for this thread. Opening one loads the magic
+    database, so it is created once per thread instead of once per file.
+    """
+    detector = getattr(_local, 'mime', None)
+    if detector is None:
+        # Only the docs service detects MIME types, so only it needs python-magic
+        import magic
+        detector = magic.Magic(mime=True)
+        _local.mime = detector
+    return detector
+
+
+def extract_content_text(file_path, file_type, original_filename, description=None):
+    """
+    Build the text the search service indexes for a document: the filename
+    followed by whatever text can be pulled out of the file.
+    """
+    # Include filename in searchable content
+    content_text = f"{original_filename} "
+
+    if file_type.startswith('text/'):
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            content_text += f.read()
+    elif file_type == 'application/pdf':
+        import pdfplumber
+        with pdfplumber.open(file_path) as pdf:
+            # Pages are separated by form feeds so long documents can be chunked by page
+            content_text += '\f'.join(page.extract_text() or '' for page in pdf.pages)
+    elif file_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
+        from docx import Document as DocxDocument
+        doc = DocxDocument(file_path)
+        content_text += ' '.join(paragraph.text for paragraph in doc.paragraphs)
+    elif file_type.startswith('image/'):
+        # For images, include filename and any description
+        content_text += f"{description or ''} image"
+
+    return content_text
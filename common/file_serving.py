@@ -0,0 +1,142 @@
+"""
+Sending stored files, either through Python or offloaded to a front web server.
+
+FILE_SERVING_MODE selects how file bytes leave the service:
+- python: send_file streams the bytes from this process (default)
+- x-accel-redirect: return an empty response with an X-Accel-Redirect header
+  (X_ACCEL_PREFIX + path relative to the storage root) for nginx to serve
+- x-sendfile: return an empty response with the absolute path in X-Sendfile
+  for Apache/lighttpd
+
+In the offload modes this service only authorizes the request and sets
+headers; the front server serves the file with sendfile(2) and handles Range.
+"""
+import mimetypes
+import os
+import time
+from urllib.parse import quote
+
+from flask import Response, current_app, request, send_file
+
+PYTHON = 'python'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+FILE_SERVING_MODES = (PYTHON, X_ACCEL_REDIRECT, X_SENDFILE)
+
+
+class OutsideStorageRoot(ValueError):
+    """Raised when a file to offload is not under the storage root."""
+
+
+def send_stored_file(file_path, storage_root, mimetype=None, download_name=None,
+                     as_attachment=False, etag=True, last_modified=None):
+    """
+    Send a file from ``storage_root`` with Range and conditional GET support,
+    using the configured FILE_SERVING_MODE. Raises OutsideStorageRoot in
+    x-accel-redirect mode for a file the front server can't map.
+    """
+    mode = current_app.config.get('FILE_SERVING_MODE', PYTHON)
+    if mode == PYTHON:
+        return send_file(
+            file_path,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            conditional=True,
+            etag=etag,
+            last_modified=last_modified
+        )
+
+    download_name = download_name or os.path.basename(file_path)
+    response = Response(
+        mimetype=mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    )
+    response.headers.set(
+        'Content-Disposition',
+        'attachment' if as_attachment else 'inline',
+        filename=download_name
+    )
+    if isinstance(etag, str):
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    # Answer revalidations here; only changed files go to the front server
+    response.make_conditional(request.environ)
+    if response.status_code == 304:
+        return response
+
+    if mode == X_SENDFILE:
+        response.headers['X-Sendfile'] = os.path.abspath(file_path)
+    elif mode == X_ACCEL_REDIRECT:
+        relative_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(storage_root))
+        if relative_path.startswith('..'):
+            raise OutsideStorageRoot(f"{file_path} is outside the storage root")
+        prefix = current_app.config['X_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative_path)}"
+    else:
+        raise ValueError(f"Unknown FILE_SERVING_MODE: {mode}")
+
+    return response
+
+
+def send_signed_file(file_path, claims, storage_root, chunk_size=64 * 1024):
+    """
+    Serve ``file_path`` for verified signed-URL ``claims``, restricted to the
+    signed byte range if there is one. Responses are cacheable until the token
+    expires.
+    """
+    max_age = max(0, int(claims['expires'] - time.time()))
+    byte_range = claims['byte_range']
+
+    if byte_range is None:
+        response = send_stored_file(
+            file_path,
+            storage_root,
+            mimetype=claims['mimetype'],
+            download_name=claims['filename'] or os.path.basename(file_path),
+            as_attachment=claims['attachment']
+        )
+    else:
+        # A range-bound token is always served here, so the client cannot
+        # widen it with its own Range header
+        file_size = os.path.getsize(file_path)
+        start, end = byte_range
+        if start >= file_size:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{file_size}'
+            return response
+        end = min(end, file_size - 1)
+        length = end - start + 1
+
+        def generate():
+            with open(file_path, 'rb') as f:
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        response = Response(
+            generate(),
+            status=206,
+            mimetype=claims['mimetype'] or 'application/octet-stream',
+            direct_passthrough=True
+        )
+        response.content_length = length
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        response.headers['Accept-Ranges'] = 'bytes'
+        if claims['filename']:
+            response.headers.set(
+                'Content-Disposition',
+                'attachment' if claims['attachment'] else 'inline',
+                filename=claims['filename']
+            )
+
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
@@ -0,0 +1,201 @@
+"""
+Liveness and readiness endpoints for the gateway and every service.
+
+GET /health answers as long as the process can serve a request and does no
+I/O, so it stays cheap enough to poll often. GET /ready runs the service's
+readiness checks (database connections, free disk space, requests in
+flight) and answers 503 when any fails, so load balancers and
+start_services.py only route to instances that can do work.
+
+UpstreamHealth polls the /ready endpoints of several services concurrently
+and caches the combined result, for the gateway's /health/all.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, current_app, g, jsonify
+
+# Readiness fails when a disk has less free space than this
+MIN_FREE_BYTES = int(os.getenv('READY_MIN_FREE_MB', 512)) * 1024 * 1024
+# Readiness fails when this many requests are in flight in the process (0: never)
+MAX_IN_FLIGHT = int(os.getenv('READY_MAX_IN_FLIGHT', 0))
+
+
+class InFlight:
+    """
+    Requests currently being handled by this process.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.count += 1
+            self.peak = max(self.peak, self.count)
+        g._health_in_flight = True
+
+    def leave(self, exc=None):
+        # Only requests that were counted; an earlier before_request hook
+        # can answer before enter() runs
+        if g.pop('_health_in_flight', False):
+            with self._lock:
+                self.count -= 1
+
+
+def database_check():
+    """
+    SELECT 1 on every Flask-SQLAlchemy engine of the app, with pool usage.
+    """
+    def check():
+        extension = current_app.extensions.get('sqlalchemy')
+        if extension is None:
+            return True, {}
+        ok = True
+        details = {}
+        for bind, engine in extension.engines.items():
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql('SELECT 1')
+                entry = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+            except Exception as e:
+                ok = False
+                entry = {'ok': False, 'error': str(e)}
+            pool = engine.pool
+            if hasattr(pool, 'checkedout'):
+                entry['pool'] = {'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': pool.overflow()}
+            details[bind or 'default'] = entry
+        return ok, details
+    return 'database', check
+
+
+def disk_check(path, min_free_bytes=MIN_FREE_BYTES):
+    """
+    Free space on the filesystem holding ``path`` (a directory, or a
+    callable returning one once the app is configured).
+    """
+    def check():
+        directory = path() if callable(path) else path
+        try:
+            usage = shutil.disk_usage(directory)
+        except OSError as e:
+            return False, {'path': str(directory), 'error': str(e)}
+        return usage.free >= min_free_bytes, {
+            'path': str(directory),
+            'free_bytes': usage.free,
+            'total_bytes': usage.total,
+            'min_free_bytes': min_free_bytes
+        }
+    return 'disk', check
+
+
+def health_blueprint(service, checks=(), max_in_flight=MAX_IN_FLIGHT):
+    """
+    Blueprint with /health and /ready for ``service``. ``checks`` are
+    (name, callable) pairs; each callable returns (ok, details).
+    """
+    bp = Blueprint('health', __name__)
+    started = time.time()
+    in_flight = InFlight()
+    bp.before_app_request(in_flight.enter)
+    bp.teardown_app_request(in_flight.leave)
+
+    def requests_check():
+        # Not counting the /ready request itself
+        busy = in_flight.count - 1
+        return max_in_flight <= 0 or busy < max_in_flight, {
+            'in_flight': busy,
+            'peak': in_flight.peak,
+            'max_in_flight': max_in_flight or None
+        }
+
+    @bp.route('/health', methods=['GET'])
+    def health():
+        return jsonify({
+            'status': 'healthy',
+            'service': service,
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - started, 1)
+        }), 200
+
+    @bp.route('/ready', methods=['GET'])
+    def ready():
+        results = {}
+        all_ok = True
+        for name, check in list(checks) + [('requests', requests_check)]:
+            try:
+                ok, details = check()
+            except Exception as e:
+                ok, details = False, {'error': str(e)}
+            results[name] = {'ok': ok, **details}
+            all_ok = all_ok and ok
+        return jsonify({
+            'status': 'ready' if all_ok else 'unavailable',
+            'service': service,
+            'checks': results
+        }), 200 if all_ok else 503
+
+    return bp
+
+
+class UpstreamHealth:
+    """
+    Combined readiness of the services in ``urls`` (name -> base URL),
+    polled concurrently and cached for ``ttl`` seconds.
+    """
+
+    def __init__(self, urls, ttl=5.0, timeout=2.0):
+        self.urls = dict(urls)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._cached = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(self.urls) or 1, thread_name_prefix='health-poll')
+
+    def _poll(self, url):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            return {'status': 'down', 'error': str(getattr(e, 'reason', e)),
+                    'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+        try:
+            checks = json.loads(body).get('checks')
+        except ValueError:
+            checks = None
+        return {
+            'status': 'ready' if status == 200 else 'unavailable',
+            'http_status': status,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            'checks': checks
+        }
+
+    def get(self):
+        """
+        The cached summary, refreshed by one caller at a time once stale.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._cached is None or now >= self._expires:
+                futures = {name: self._pool.submit(self._poll, url) for name, url in self.urls.items()}
+                services = {name: future.result() for name, future in futures.items()}
+                self._cached = {
+                    'status': 'ready' if all(s['status'] == 'ready' for s in services.values()) else 'degraded',
+                    'checked_at': time.time(),
+                    'services': services
+                }
+                self._expires = time.monotonic() + self.ttl
+            return self._cached
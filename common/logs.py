@@ -0,0 +1,187 @@
+"""
+Structured logging for the gateway and every service.
+
+setup_logging(service) routes all records through a QueueHandler to a
+listener thread that writes one JSON object per line to stdout, so request
+threads never block on a terminal or a pipe. Each record carries the
+service, the current request id (see common.tracing) and any ``extra``
+fields.
+
+LOG_LEVEL sets the root level (default INFO). LOG_LEVELS sets levels per
+logger, e.g. ``LOG_LEVELS=app.routes.search=DEBUG,werkzeug=WARNING``. A
+disabled level costs one isEnabledFor() check, as long as callers pass
+arguments (``logger.debug("Found %s", n)``) rather than formatting the
+message themselves.
+
+Enabled DEBUG records are sampled at LOG_DEBUG_SAMPLE_RATE and
+rate-limited to LOG_DEBUG_PER_SECOND per call site, so turning debug on for
+a hot path under load doesn't flood the output. LOG_FORMAT=text prints
+plain lines instead of JSON, for development.
+
+(Named logs, not logging, so it doesn't shadow the standard library.)
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from common.tracing import current_request_id
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))
+DEBUG_PER_SECOND = float(os.getenv('LOG_DEBUG_PER_SECOND', 20))
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id', 'suppressed'}
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'service': self.service
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, service):
+        super().__init__(f'%(asctime)s %(levelname)s {service} %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        request_id = getattr(record, 'request_id', None)
+        return f"{line} [{request_id}]" if request_id else line
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps a ``rate`` share of DEBUG records and at most ``per_second`` per
+    call site; the next record let through counts the ones dropped.
+    """
+
+    def __init__(self, rate=DEBUG_SAMPLE_RATE, per_second=DEBUG_PER_SECOND, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.per_second = per_second
+        self._clock = clock
+        self._sites = {}  # (pathname, lineno) -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.rate < 1 and random.random() >= self.rate:
+            return False
+        if self.per_second <= 0:
+            return True
+        now = self._clock()
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self._sites[(record.pathname, record.lineno)] = [self.per_second, now, 0]
+            site[0] = min(self.per_second, site[0] + (now - site[1]) * self.per_second)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                return False
+            site[0] -= 1
+            record.suppressed, site[2] = site[2], 0
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        """
+        Resolve the message and traceback in the calling thread, where the
+        arguments and request id are still current; the formatting to JSON
+        and the write happen on the listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = current_request_id()
+        return record
+
+
+def parse_levels(spec):
+    """
+    {'logger.name': level} from 'logger.name=LEVEL,other=LEVEL'.
+    """
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_listener = None
+_handler = None
+
+
+def _start_listener(output):
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+    _listener.start()
+
+
+def setup_logging(service, stream=None):
+    """
+    Configure the root logger of this process for ``service``. Only the
+    first call in a process has an effect.
+    """
+    global _handler
+    if _handler is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter(service) if LOG_FORMAT == 'text' else JsonFormatter(service))
+
+    _handler = _QueueHandler(queue.SimpleQueue())
+    _handler.addFilter(DebugSampler())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _start_listener(output)
+    # The listener thread does not survive a fork (gunicorn workers)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _start_listener(output))
+    import atexit
+    atexit.register(lambda: _listener.stop())
@@ -0,0 +1,461 @@
+"""
+Prometheus-style metrics for the gateway and every service.
+
+init_metrics(app) counts requests and their latency per route, tracks
+requests in flight, measures the SQL each request runs, and serves
+everything at GET /metrics in the text exposition format. Services add
+their own Counter, Gauge and Histogram objects (or callback metrics read
+at scrape time, e.g. for cache statistics); they all land in REGISTRY.
+
+Recording is a dict lookup and an addition under a lock, so the cost per
+request stays in the microseconds.
+
+Under gunicorn a service runs in several worker processes and a scrape
+reaches whichever one accepts it. With METRICS_DIR set (start_services.py
+--prod sets one per service), every worker writes its values to
+``<METRICS_DIR>/<pid>.json`` each METRICS_FLUSH_SECONDS and on a scrape,
+and the scraped worker merges all of them: counters and histograms are
+summed, and gauges combined over the live workers by their
+``multiprocess_mode`` (sum, min, max or mean). The gunicorn master folds
+the counters and histograms of each exited worker into archive.json (see
+mark_process_dead()), so recycling workers doesn't reset them.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, g, has_app_context, request
+
+try:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+except ImportError:  # the gateway does not need SQLAlchemy
+    Engine = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 1))
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = '.lock'
+GAUGE_MODES = ('sum', 'min', 'max', 'mean')
+
+# Seconds, from cache hits to slow exports
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _combine(kind, mode, current, value):
+    if current is None:
+        return value
+    if kind == 'histogram':
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+    if kind == 'gauge' and mode == 'min':
+        return min(current, value)
+    if kind == 'gauge' and mode == 'max':
+        return max(current, value)
+    # Counters, and gauges summed (or summed before dividing, for mean)
+    return current + value
+
+
+@contextmanager
+def _locked(directory, exclusive=False):
+    """
+    Keep mark_process_dead() from moving a worker's values into the archive
+    while a scrape reads the two files. POSIX only, like gunicorn.
+    """
+    import fcntl
+
+    with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def mark_process_dead(pid, directory=METRICS_DIR):
+    """
+    Fold the counters and histograms worker ``pid`` last wrote into the
+    archive and drop its file, whose gauges no longer apply. Called by the
+    gunicorn master when a worker exits.
+    """
+    if not directory or not os.path.isdir(directory):
+        return
+    path = os.path.join(directory, f"{pid}.json")
+    with _locked(directory, exclusive=True):
+        snapshot = _read_json(path)
+        if snapshot is None:
+            return
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = _read_json(archive_path) or {}
+        for name, metric in snapshot.items():
+            if metric['kind'] == 'gauge':
+                continue
+            values = {tuple(labels): value for labels, value in archive.get(name, {}).get('values', [])}
+            for labels, value in metric['values']:
+                labels = tuple(labels)
+                values[labels] = _combine(metric['kind'], None, values.get(labels), value)
+            archive[name] = {'kind': metric['kind'], 'values': [[list(k), v] for k, v in values.items()]}
+        _write_json(archive_path, archive)
+        os.remove(path)
+
+
+class Registry:
+    def __init__(self, directory=''):
+        """
+        ``directory``, when given, is shared with the other worker processes
+        of the same service (see the module docstring).
+        """
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.directory = directory
+        self._flusher_pid = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def snapshot(self):
+        """
+        {name: {'kind', 'values': [[label values, value]]}} for this process.
+        """
+        return {
+            metric.name: {
+                'kind': metric.kind,
+                'values': [[list(labels), value] for labels, value in metric.values().items() if value is not None]
+            }
+            for metric in list(self._metrics.values())
+        }
+
+    def flush(self):
+        """
+        Write this process's values for the other workers to merge.
+        """
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(os.path.join(self.directory, f"{os.getpid()}.json"), self.snapshot())
+
+    def start_flusher(self):
+        """
+        Flush every FLUSH_SECONDS on a daemon thread, once per process (the
+        thread doesn't survive a fork, so each worker starts its own).
+        """
+        pid = os.getpid()
+        if not self.directory or self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning('Could not write metrics to %s: %s', self.directory, e)
+
+    def reset(self):
+        """
+        Forget the values recorded so far; a forked worker would otherwise
+        report the master's as its own.
+        """
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def _merged(self):
+        """
+        {name: {label values: value}} over every worker's file.
+        """
+        self.flush()
+        kinds = {name: metric.kind for name, metric in self._metrics.items()}
+        modes = {name: metric.multiprocess_mode for name, metric in self._metrics.items()}
+        merged, counts = {}, {}
+        with _locked(self.directory):
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+            for file_name in names:
+                snapshot = _read_json(os.path.join(self.directory, file_name)) or {}
+                for name, metric in snapshot.items():
+                    if name not in kinds:
+                        continue
+                    values = merged.setdefault(name, {})
+                    for labels, value in metric['values']:
+                        labels = tuple(labels)
+                        values[labels] = _combine(kinds[name], modes[name], values.get(labels), value)
+                        counts[name, labels] = counts.get((name, labels), 0) + 1
+        for name, values in merged.items():
+            if kinds[name] == 'gauge' and modes[name] == 'mean':
+                for labels in values:
+                    values[labels] /= counts[name, labels]
+        return merged
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format, merged over
+        the service's workers when there is a directory.
+        """
+        merged = self._merged() if self.directory else None
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(None if merged is None else merged.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry(METRICS_DIR)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None, registry=REGISTRY,
+                 multiprocess_mode='sum'):
+        """
+        ``callback``, when given, is called at scrape time and returns the
+        value, or a dict of label value tuples to values.
+        ``multiprocess_mode`` says how a gauge's values from several worker
+        processes combine: sum, min, max or mean.
+        """
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"Unknown multiprocess_mode: {multiprocess_mode}")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.multiprocess_mode = multiprocess_mode
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def values(self):
+        """
+        {label values: value} in this process.
+        """
+        if self.callback is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.callback()
+        return value if isinstance(value, dict) else {(): value}
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self, values=None):
+        values = self.values() if values is None else values
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in values.items()
+            if value is not None
+        ]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, labels=()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, labels)
+
+    def values(self):
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._values.items()}
+
+    def samples(self, values=None):
+        values = self.values() if values is None else values
+        lines = []
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+_started = time.time()
+Gauge('process_start_time_seconds', 'Start time of the process since the epoch, in seconds.',
+      callback=lambda: _started, multiprocess_mode='min')
+
+http_requests = Counter('http_requests_total', 'HTTP requests handled.', ['method', 'route', 'status'])
+http_latency = Histogram('http_request_duration_seconds', 'Time to handle an HTTP request.', ['method', 'route'])
+http_in_flight = Gauge('http_requests_in_flight', 'HTTP requests being handled.')
+db_queries = Histogram('db_queries_per_request', 'SQL statements run per HTTP request.', ['route'],
+                       buckets=COUNT_BUCKETS)
+db_time = Histogram('db_time_per_request_seconds', 'Time spent in SQL per HTTP request.', ['route'])
+db_statements = Histogram('db_statement_duration_seconds', 'Time to run one SQL statement.')
+# Thumbnails, text extraction and other background work
+job_duration = Histogram('job_duration_seconds', 'Time to run a job.', ['job'], buckets=JOB_BUCKETS)
+
+_sql_hooks_installed = False
+
+
+def _after_fork():
+    global _started
+    _started = time.time()
+    REGISTRY.reset()
+
+
+if METRICS_DIR and hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _install_sql_hooks():
+    global _sql_hooks_installed
+    if Engine is None or _sql_hooks_installed:
+        return
+    _sql_hooks_installed = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_metrics_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        db_statements.observe(elapsed)
+        # Statements outside a request (background sync) have no g to add to
+        stats = g.get('_metrics_db') if has_app_context() else None
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def _route():
+    rule = request.url_rule
+    # Unmatched paths share one label so scanners can't grow the series
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def init_metrics(app):
+    """
+    Record request metrics for ``app`` and serve them at /metrics.
+    """
+    _install_sql_hooks()
+
+    @app.before_request
+    def start_request_metrics():
+        REGISTRY.start_flusher()
+        g._metrics_started = time.perf_counter()
+        g._metrics_db = [0, 0.0]
+        http_in_flight.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('_metrics_started')
+        if started is not None:
+            route = _route()
+            http_latency.observe(time.perf_counter() - started, (request.method, route))
+            http_requests.inc((request.method, route, str(response.status_code)))
+            count, seconds = g._metrics_db
+            db_queries.observe(count, (route,))
+            if count:
+                db_time.observe(seconds, (route,))
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        if g.pop('_metrics_started', None) is not None:
+            http_in_flight.dec()
+
+    bp = Blueprint('metrics', __name__)
+
+    @bp.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+    app.register_blueprint(bp)
+    return app
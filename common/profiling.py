@@ -0,0 +1,293 @@
+"""
+On-demand profiling of single requests, for the gateway and every service.
+
+A request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` (only
+if PROFILE_TOKEN is set), or at random with probability PROFILE_SAMPLE_RATE
+(default 0, off). Two profilers:
+
+- cprofile: every function call, with call counts. Used for header requests
+  unless ``X-Profile-Mode: sample`` is sent. Slows the request down several
+  times, and one request per process is profiled this way at a time.
+- sample: a thread reads the request thread's stack every
+  PROFILE_INTERVAL seconds (default 0.005). Used for sampled requests and
+  cheap enough to leave on at a low rate in production.
+
+Each profile is written to PROFILE_DIR (default <tmp>/docstorage-profiles)
+as ``<service>-<METHOD>-<route>-<ms>ms-<request id>.json``, a summary of
+the functions seen with their self and cumulative time; cprofile also
+writes the full pstats data next to it as ``.prof`` (for pstats or
+snakeviz). Only the newest PROFILE_MAX_FILES (default 200) are kept. The
+gateway forwards the headers it was sent, so a profiled gateway request is
+profiled in the services it calls as well. To read them:
+
+    python -m common.profiling                          # top functions per route
+    python -m common.profiling --route /search --sort self
+"""
+import argparse
+import cProfile
+import glob
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'docstorage-profiles'))
+MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+
+PROFILE_HEADER = 'X-Profile'
+MODE_HEADER = 'X-Profile-Mode'
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+# Functions kept per profile summary, by cumulative time
+MAX_FUNCTIONS = 500
+MAX_STACK_DEPTH = 200
+
+# cProfile can't run for two threads at once on newer Pythons
+_cprofile_lock = threading.Lock()
+
+
+def _function_name(filename, lineno, name):
+    if filename.startswith(ROOT_DIR + os.sep):
+        filename = os.path.relpath(filename, ROOT_DIR)
+    return f"{filename}:{lineno}({name})"
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread from a background thread.
+    """
+
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                # Keyed by function, not line, so the lines of one function add up
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def functions(self):
+        """
+        [{'function', 'self', 'cumulative', 'calls'}], in seconds.
+        """
+        own, cumulative = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                cumulative[function] += count
+        return [
+            {'function': _function_name(*function), 'self': own[function] * self.interval,
+             'cumulative': cumulative[function] * self.interval, 'calls': None}
+            for function in cumulative
+        ]
+
+
+def _cprofile_functions(profile):
+    stats = pstats.Stats(profile).stats
+    return [
+        {'function': _function_name(*function), 'self': own, 'cumulative': cumulative, 'calls': calls}
+        for function, (_, calls, own, cumulative, _) in stats.items()
+    ]
+
+
+def _slug(route):
+    return re.sub(r'[^\w.-]+', '_', route).strip('_') or 'root'
+
+
+def write_profile(directory, meta, functions, profile=None):
+    """
+    Write a profile summary, and the raw cProfile data when given; returns
+    the summary's path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, '-'.join([
+        meta['service'], meta['method'], _slug(meta['route']),
+        f"{round(meta['duration'] * 1000)}ms", _slug(meta['request_id'])
+    ]))
+    functions = sorted(functions, key=lambda f: f['cumulative'], reverse=True)[:MAX_FUNCTIONS]
+    with open(stem + '.json', 'w') as f:
+        json.dump(dict(meta, functions=functions), f)
+    if profile is not None:
+        profile.dump_stats(stem + '.prof')
+    return stem + '.json'
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+def prune_profiles(directory, keep=MAX_FILES):
+    """
+    Delete all but the newest ``keep`` profiles (and their .prof data).
+    """
+    summaries = glob.glob(os.path.join(directory, '*.json'))
+    for path in sorted(summaries, key=_mtime)[:max(len(summaries) - keep, 0)]:
+        for name in (path, path[:-len('.json')] + '.prof'):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass  # Never written, or another process pruned it first
+
+
+def _requested_mode(request):
+    token = request.headers.get(PROFILE_HEADER)
+    if token and PROFILE_TOKEN and hmac.compare_digest(token, PROFILE_TOKEN):
+        return SAMPLE if request.headers.get(MODE_HEADER) == SAMPLE else CPROFILE
+    return None
+
+
+def init_profiling(app, service, sample_rate=SAMPLE_RATE, directory=None, max_files=MAX_FILES):
+    """
+    Profile requests to ``app`` that ask for it, and a ``sample_rate``
+    share of the rest, keeping the newest ``max_files`` profiles.
+    """
+    from flask import g, request
+
+    from common.tracing import current_request_id
+
+    @app.before_request
+    def start_profile():
+        mode = _requested_mode(request)
+        if mode is None:
+            if not sample_rate or random.random() >= sample_rate:
+                return
+            mode = SAMPLE
+        if mode == CPROFILE and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            mode, profiler = SAMPLE, StackSampler(threading.get_ident()).start()
+        g._profile = (mode, profiler, time.perf_counter())
+
+    @app.teardown_request
+    def finish_profile(exc=None):
+        started = g.pop('_profile', None)
+        if started is None:
+            return
+        mode, profiler, began = started
+        duration = time.perf_counter() - began
+        if mode == CPROFILE:
+            profiler.disable()
+            _cprofile_lock.release()
+            functions, raw = _cprofile_functions(profiler), profiler
+        else:
+            profiler.stop()
+            functions, raw = profiler.functions(), None
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        meta = {
+            'service': service,
+            'method': request.method,
+            'route': rule,
+            'path': request.path,
+            'duration': duration,
+            'mode': mode,
+            'request_id': current_request_id() or f"{os.getpid()}.{time.time_ns()}",
+            'timestamp': time.time()
+        }
+        try:
+            write_profile(directory or PROFILE_DIR, meta, functions, raw)
+            prune_profiles(directory or PROFILE_DIR, max_files)
+        except OSError as e:
+            app.logger.warning('Could not write profile: %s', e)
+
+    return app
+
+
+def load_profiles(paths):
+    """
+    Profile summaries from files and directories of them.
+    """
+    profiles = []
+    for path in paths:
+        files = glob.glob(os.path.join(path, '*.json')) if os.path.isdir(path) else glob.glob(path)
+        for name in sorted(files):
+            with open(name) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+def summarize(profiles, sort='cumulative', top=15):
+    """
+    {(service, 'METHOD route'): (profiles, [function rows])}, functions
+    summed over the profiles of each route.
+    """
+    routes = defaultdict(list)
+    for profile in profiles:
+        routes[(profile['service'], f"{profile['method']} {profile['route']}")].append(profile)
+    summary = {}
+    for key, group in routes.items():
+        totals = defaultdict(lambda: {'self': 0.0, 'cumulative': 0.0, 'calls': 0, 'profiles': 0})
+        for profile in group:
+            for row in profile['functions']:
+                total = totals[row['function']]
+                total['self'] += row['self']
+                total['cumulative'] += row['cumulative']
+                total['calls'] += row['calls'] or 0
+                total['profiles'] += 1
+        rows = sorted(
+            ({'function': name, **total} for name, total in totals.items()),
+            key=lambda row: row[sort], reverse=True
+        )
+        summary[key] = (group, rows[:top])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize request profiles by route.')
+    parser.add_argument('paths', nargs='*', default=[PROFILE_DIR], help=f'profile files or directories (default {PROFILE_DIR})')
+    parser.add_argument('--route', help='only routes containing this text')
+    parser.add_argument('--sort', choices=('cumulative', 'self', 'calls'), default='cumulative')
+    parser.add_argument('--top', type=int, default=15, help='functions per route')
+    args = parser.parse_args(argv)
+
+    summary = summarize(load_profiles(args.paths), args.sort, args.top)
+    if not summary:
+        print('No profiles found')
+        return
+    for (service, route), (group, rows) in sorted(summary.items()):
+        if args.route and args.route not in route:
+            continue
+        durations = [profile['duration'] * 1000 for profile in group]
+        print(f"{service} {route}: {len(group)} profiles, "
+              f"mean {sum(durations) / len(durations):.1f} ms, max {max(durations):.1f} ms")
+        print(f"  {'self s':>9} {'cum s':>9} {'calls':>8}  function")
+        for row in rows:
+            print(f"  {row['self']:9.3f} {row['cumulative']:9.3f} {row['calls'] or '-':>8}  {row['function']}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+HMAC-signed, expiring download tokens.
+
+A token carries everything needed to serve a stored file (document id,
+storage path, expiry and an optional byte range), so the serving endpoint can
+verify it without a database lookup. It also names the service it was minted
+for (its audience): the docs and share services may share a secret, and a
+token for one must not open a path in the other's storage.
+
+Tokens are bearer credentials: they are not bound to the user who asked for
+them, and anyone holding the URL can download the file until it expires.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import math
+import time
+
+
+class InvalidSignature(Exception):
+    """Raised when a download token is malformed or its signature does not match."""
+
+
+class SignatureExpired(InvalidSignature):
+    """Raised when a download token is past its expiry time."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    padding = '=' * (-len(data) % 4)
+    return base64.urlsafe_b64decode(data + padding)
+
+
+def _signature(secret, payload):
+    key = secret.encode('utf-8') if isinstance(secret, str) else secret
+    return hmac.new(key, payload.encode('ascii'), hashlib.sha256).digest()
+
+
+def parse_byte_range(value):
+    """
+    Parse a "start-end" byte range (inclusive) into a (start, end) tuple.
+    """
+    try:
+        start, end = (int(part) for part in value.split('-', 1))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid byte range: {value!r}")
+    if start < 0 or end < start:
+        raise ValueError(f"Invalid byte range: {value!r}")
+    return start, end
+
+
+def sign_download(secret, audience, doc_id, path, ttl=300, byte_range=None,
+                  filename=None, mimetype=None, attachment=False, bucket=60, now=None):
+    """
+    Mint a signed token for downloading ``path`` (relative to the storage root)
+    from the ``audience`` service. Returns the token and its expiry as a Unix timestamp.
+
+    The expiry is rounded up to a multiple of ``bucket`` seconds so repeated
+    requests for the same file within a window get the same, cacheable URL.
+    """
+    now = time.time() if now is None else now
+    expires = int(math.ceil((now + ttl) / bucket) * bucket) if bucket else int(now + ttl)
+
+    claims = {
+        'aud': audience,
+        'd': int(doc_id),
+        'p': path,
+        'e': expires
+    }
+    if byte_range is not None:
+        claims['r'] = [int(byte_range[0]), int(byte_range[1])]
+    if filename:
+        claims['n'] = filename
+    if mimetype:
+        claims['t'] = mimetype
+    if attachment:
+        claims['a'] = 1
+
+    payload = _b64encode(json.dumps(claims, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+    return f"{payload}.{_b64encode(_signature(secret, payload))}", expires
+
+
+def verify_download(secret, audience, token, now=None):
+    """
+    Verify a token minted by :func:`sign_download` for ``audience`` and
+    return its claims.
+
+    Raises InvalidSignature for tampered or malformed tokens and those
+    minted for another service, and SignatureExpired once the token is past
+    its expiry.
+    """
+    try:
+        payload, signature = token.split('.', 1)
+        expected = _signature(secret, payload)
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            raise InvalidSignature('Signature mismatch')
+        claims = json.loads(_b64decode(payload))
+    except InvalidSignature:
+        raise
+    except (ValueError, TypeError) as e:
+        raise InvalidSignature(f'Malformed token: {str(e)}')
+    if claims.get('aud') != audience:
+        raise InvalidSignature('Token is for another service')
+
+    now = time.time() if now is None else now
+    if claims.get('e', 0) < now:
+        raise SignatureExpired('Token has expired')
+
+    return {
+        'doc_id': claims['d'],
+        'path': claims['p'],
+        'expires': claims['e'],
+        'byte_range': tuple(claims['r']) if 'r' in claims else None,
+        'filename': claims.get('n'),
+        'mimetype': claims.get('t'),
+        'attachment': bool(claims.get('a'))
+    }
+
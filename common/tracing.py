@@ -0,0 +1,492 @@
+"""
+Request tracing across the gateway and the services.
+
+Every request gets a request id: the X-Request-ID header the gateway was
+sent, or a new one. It is returned on the response and forwarded, with a
+W3C traceparent header, on every call to another service, so a user action
+that fans out (gateway -> docs -> share) can be followed end to end. Each
+service opens a server span per request, and child spans around upstream
+HTTP calls, SQL statements, file I/O, extraction and thumbnails.
+
+Sampling is decided once, at the head: the gateway (the edge, so clients
+can't force sampling with their own traceparent), or the first service to
+see a request without a traceparent, samples it with probability
+TRACE_SAMPLE_RATE, and every service downstream follows the flag in the
+traceparent. Unsampled requests still carry their request id but record
+nothing, so span() costs one context variable lookup.
+
+A background thread writes finished spans as OTLP/JSON lines (one
+ExportTraceServiceRequest per line, like the OpenTelemetry collector's
+file exporter) to TRACE_DIR/<service>.<pid>.jsonl, and also POSTs them to
+OTEL_EXPORTER_OTLP_ENDPOINT/v1/traces when that is set. A file is rotated
+at TRACE_FILE_BYTES, and only the newest TRACE_MAX_FILES are kept. To read
+them:
+
+    python -m common.tracing                                   # slowest traces
+    python -m common.tracing --trace <trace or request id>
+"""
+import argparse
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+except ImportError:  # the gateway does not need SQLAlchemy
+    Engine = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+TRACE_DIR = os.getenv('TRACE_DIR', os.path.join(tempfile.gettempdir(), 'docstorage-traces'))
+TRACE_FILE_BYTES = int(os.getenv('TRACE_FILE_BYTES', 16 * 1024 * 1024))
+TRACE_MAX_FILES = int(os.getenv('TRACE_MAX_FILES', 20))
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+# Spans waiting for export; more are dropped rather than slowing requests
+QUEUE_SIZE = 10000
+BATCH_SIZE = 512
+FLUSH_SECONDS = 1.0
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+TRACEPARENT_HEADER = 'traceparent'
+VALID_REQUEST_ID = re.compile(r'[\w.:-]{1,128}')
+# Longer SQL is cut in span attributes
+MAX_STATEMENT_LENGTH = 500
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_current = ContextVar('trace_span', default=None)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        value = {'boolValue': value}
+    elif isinstance(value, int):
+        value = {'intValue': str(value)}
+    elif isinstance(value, float):
+        value = {'doubleValue': value}
+    else:
+        value = {'stringValue': str(value)}
+    return {'key': key, 'value': value}
+
+
+class Span:
+    __slots__ = ('service', 'name', 'kind', 'trace_id', 'span_id', 'parent_id', 'sampled', 'request_id',
+                 'attributes', 'error', 'start_ns', 'end_ns')
+
+    def __init__(self, service, name, trace_id, parent_id, sampled, request_id, kind=INTERNAL, attributes=None):
+        self.service = service
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.request_id = request_id
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def child(self, name, kind=INTERNAL, attributes=None):
+        return Span(self.service, name, self.trace_id, self.span_id, self.sampled, self.request_id, kind, attributes)
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            exporter.export(self)
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 0}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Exporter:
+    """
+    Writes spans from a background thread, started lazily in each process
+    (so gunicorn workers forked from a preloaded master get their own).
+    """
+
+    def __init__(self, directory=TRACE_DIR, endpoint=OTLP_ENDPOINT,
+                 max_bytes=TRACE_FILE_BYTES, max_files=TRACE_MAX_FILES):
+        # Names the output file; the first service set up in the process
+        self.name = None
+        self.directory = directory
+        self.endpoint = endpoint
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.dropped = 0
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='trace-export', daemon=True).start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            # None is flush()'s marker: write what we have now
+            while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            spans = [span for span in batch if span is not None]
+            if spans:
+                self._write(spans)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Wait until every span queued so far is written.
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._queue.join()
+
+    def _write(self, spans):
+        by_service = {}
+        for span in spans:
+            by_service.setdefault(span.service, []).append(span.to_otlp())
+        payload = json.dumps({'resourceSpans': [{
+            'resource': {'attributes': [
+                _attribute('service.name', service),
+                _attribute('process.pid', os.getpid())
+            ]},
+            'scopeSpans': [{'scope': {'name': 'docstorage'}, 'spans': otlp_spans}]
+        } for service, otlp_spans in by_service.items()]}, separators=(',', ':'))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{self.name or 'traces'}.{os.getpid()}.jsonl")
+            with open(path, 'a') as f:
+                f.write(payload + '\n')
+                size = f.tell()
+            if size >= self.max_bytes:
+                self._rotate(path)
+            if self.endpoint:
+                export_request = urllib.request.Request(
+                    f"{self.endpoint.rstrip('/')}/v1/traces",
+                    data=payload.encode('utf-8'),
+                    headers={'Content-Type': 'application/json'}
+                )
+                urllib.request.urlopen(export_request, timeout=5).close()
+        except Exception as e:
+            logger.warning('Trace export failed: %s', e)
+
+    def _rotate(self, path):
+        """
+        Move a full file aside, then drop the oldest files beyond max_files
+        (of every process writing to the directory).
+        """
+        os.replace(path, f"{path[:-len('.jsonl')]}.{time.time_ns()}.jsonl")
+        paths = glob.glob(os.path.join(self.directory, '*.jsonl'))
+        if len(paths) <= self.max_files:
+            return
+        for old in sorted(paths, key=_mtime)[:len(paths) - self.max_files]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass  # Another process pruned it first
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+exporter = Exporter()
+atexit.register(exporter.flush)
+
+
+def current_span():
+    return _current.get()
+
+
+def current_request_id():
+    span = _current.get()
+    return span.request_id if span is not None else None
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """
+    Time the block as a child of the current span. Yields the span, or None
+    when the request is not sampled.
+    """
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    child = parent.child(name, kind, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def outgoing_headers(headers=None):
+    """
+    ``headers`` (a dict) plus the request id and traceparent to send to
+    another service, replacing any copies forwarded from the incoming request.
+    """
+    headers = dict(headers or {})
+    current = _current.get()
+    if current is None:
+        return headers
+    headers = {
+        key: value for key, value in headers.items()
+        if key.lower() not in (TRACEPARENT_HEADER, REQUEST_ID_HEADER.lower())
+    }
+    headers[TRACEPARENT_HEADER] = current.traceparent()
+    headers[REQUEST_ID_HEADER] = current.request_id
+    return headers
+
+
+def parse_traceparent(value):
+    """
+    (trace_id, parent_span_id, sampled) from a traceparent header, or None.
+    """
+    parts = (value or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+_sql_hooks_installed = False
+
+
+def _install_sql_hooks():
+    global _sql_hooks_installed
+    if Engine is None or _sql_hooks_installed:
+        return
+    _sql_hooks_installed = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        child = None
+        if parent is not None and parent.sampled:
+            child = parent.child('sql', CLIENT, {
+                'db.system': conn.dialect.name,
+                'db.statement': statement[:MAX_STATEMENT_LENGTH]
+            })
+        conn.info.setdefault('_trace_spans', []).append(child)
+
+    def finish(conn, error=None):
+        spans = conn.info.get('_trace_spans')
+        child = spans.pop() if spans else None
+        if child is not None:
+            child.error = error
+            child.finish()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        finish(conn)
+
+    @event.listens_for(Engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None:
+            finish(context.connection, f"{type(context.original_exception).__name__}: {context.original_exception}")
+
+
+def init_tracing(app, service, sample_rate=SAMPLE_RATE, edge=False):
+    """
+    Open a server span for every request to ``app`` and propagate the
+    request id and trace context. An ``edge`` app (the gateway) ignores any
+    traceparent it is sent and always makes the sampling decision itself.
+    """
+    from flask import g, request
+
+    exporter.name = exporter.name or service
+    _install_sql_hooks()
+
+    @app.before_request
+    def start_trace():
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not VALID_REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        parent = None if edge else parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < sample_rate
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        root = Span(service, f"{request.method} {rule}", trace_id, parent_id, sampled, request_id, SERVER)
+        if sampled:
+            root.attributes.update({
+                'http.method': request.method,
+                'http.route': rule,
+                'http.target': request.path,
+                'request.id': request_id
+            })
+        g._trace_span = root
+        _current.set(root)
+
+    @app.after_request
+    def tag_response(response):
+        root = g.get('_trace_span')
+        if root is not None:
+            response.headers[REQUEST_ID_HEADER] = root.request_id
+            if root.sampled:
+                root.set('http.status_code', response.status_code)
+                if response.status_code >= 500:
+                    root.error = f"HTTP {response.status_code}"
+        return response
+
+    @app.teardown_request
+    def finish_trace(exc=None):
+        root = g.pop('_trace_span', None)
+        if root is not None:
+            if exc is not None:
+                root.error = f"{type(exc).__name__}: {str(exc)}"
+            root.finish()
+        _current.set(None)
+
+    return app
+
+
+def load_spans(paths):
+    """
+    Spans from OTLP/JSON line files, each with its service name added.
+    """
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for resource_spans in json.loads(line).get('resourceSpans', []):
+                    attributes = {a['key']: a['value'] for a in resource_spans.get('resource', {}).get('attributes', [])}
+                    service = attributes.get('service.name', {}).get('stringValue', '?')
+                    for scope_spans in resource_spans.get('scopeSpans', []):
+                        for raw in scope_spans.get('spans', []):
+                            raw['service'] = service
+                            raw['attributes'] = {
+                                a['key']: next(iter(a['value'].values())) for a in raw.get('attributes', [])
+                            }
+                            spans.append(raw)
+    return spans
+
+
+def _duration_ms(span):
+    return (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+
+
+def print_trace(spans):
+    by_id = {span['spanId']: span for span in spans}
+    children = {}
+    for span in spans:
+        parent = span.get('parentSpanId')
+        children.setdefault(parent if parent in by_id else None, []).append(span)
+    start = min(int(span['startTimeUnixNano']) for span in spans)
+
+    def show(span, depth):
+        offset = (int(span['startTimeUnixNano']) - start) / 1e6
+        status = f"  ERROR {span['status'].get('message', '')}" if span.get('status', {}).get('code') == 2 else ''
+        detail = span['attributes'].get('db.statement', '')
+        print(f"{offset:9.1f}ms {_duration_ms(span):9.1f}ms  {'  ' * depth}{span['name']} [{span['service']}]"
+              f"{'  ' + detail[:80] if detail else ''}{status}")
+        for child in sorted(children.get(span['spanId'], []), key=lambda s: int(s['startTimeUnixNano'])):
+            show(child, depth + 1)
+
+    for root in sorted(children.get(None, []), key=lambda s: int(s['startTimeUnixNano'])):
+        show(root, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize exported traces')
+    parser.add_argument('paths', nargs='*', help='OTLP/JSON line files (default: TRACE_DIR/*.jsonl)')
+    parser.add_argument('--trace', help='show one trace, by trace id or request id')
+    parser.add_argument('--limit', type=int, default=20, help='number of slowest traces to list')
+    args = parser.parse_args()
+
+    spans = load_spans(args.paths or sorted(glob.glob(os.path.join(TRACE_DIR, '*.jsonl'))))
+    traces = {}
+    for span in spans:
+        traces.setdefault(span['traceId'], []).append(span)
+
+    if args.trace:
+        for trace_id, trace in traces.items():
+            if args.trace == trace_id or any(s['attributes'].get('request.id') == args.trace for s in trace):
+                print(f"trace {trace_id}")
+                print_trace(trace)
+                return
+        parser.error(f"no trace {args.trace}")
+
+    rows = []
+    for trace_id, trace in traces.items():
+        start = min(int(s['startTimeUnixNano']) for s in trace)
+        end = max(int(s['endTimeUnixNano']) for s in trace)
+        root = min(trace, key=lambda s: int(s['startTimeUnixNano']))
+        request_id = next((s['attributes']['request.id'] for s in trace if 'request.id' in s['attributes']), '')
+        services = sorted({s['service'] for s in trace})
+        rows.append(((end - start) / 1e6, trace_id, request_id, len(trace), root['name'], services))
+    rows.sort(reverse=True)
+    print(f"{'duration':>10}  {'trace id':32}  {'request id':32}  {'spans':>5}  root")
+    for duration, trace_id, request_id, count, name, services in rows[:args.limit]:
+        print(f"{duration:8.1f}ms  {trace_id}  {request_id:32}  {count:5}  {name} ({', '.join(services)})")
+
+
+if __name__ == '__main__':
+    main()
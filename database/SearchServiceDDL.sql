@@ -10,12 +10,19 @@ CREATE TABLE documentindex (
     content_text TEXT DEFAULT '',
     doc_metadata JSONB DEFAULT '{}',
     last_indexed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Promoted from doc_metadata for search filters and facets
+    owner_id INTEGER,
+    file_type VARCHAR(100),
+    file_family VARCHAR(20),
+    upload_date TIMESTAMP,
+    -- Non-zero when the content is stored in documentindex_chunks instead
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    -- Weighted by field for ranking: filename A, description B, content C
     search_vector tsvector GENERATED ALWAYS AS (
-        to_tsvector('english',
-            coalesce(content_text, '') || ' ' ||
-            regexp_replace(coalesce(doc_metadata->>'filename', ''), '[_.]', ' ', 'g') || ' ' ||
-            coalesce(doc_metadata->>'description', '')
-        )
+        setweight(to_tsvector('english', regexp_replace(
+            coalesce(doc_metadata->>'original_filename', doc_metadata->>'filename', ''), '[_.]', ' ', 'g')), 'A') ||
+        setweight(to_tsvector('english', coalesce(doc_metadata->>'description', '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(content_text, '')), 'C')
     ) STORED
 );
 
@@ -46,6 +53,125 @@ $$ LANGUAGE plpgsql;
 -- Recreate the search index
 CREATE INDEX idx_document_search ON documentindex USING gin(search_vector);
 
+-- Migration for existing databases: add and backfill the promoted columns
+-- (file_family mirrors mime_family() in app/utils/metadata.py)
+ALTER TABLE documentindex ADD COLUMN IF NOT EXISTS owner_id INTEGER;
+ALTER TABLE documentindex ADD COLUMN IF NOT EXISTS file_type VARCHAR(100);
+ALTER TABLE documentindex ADD COLUMN IF NOT EXISTS file_family VARCHAR(20);
+ALTER TABLE documentindex ADD COLUMN IF NOT EXISTS upload_date TIMESTAMP;
+UPDATE documentindex SET
+    owner_id = (doc_metadata->>'user_id')::INTEGER,
+    file_type = LEFT(doc_metadata->>'file_type', 100),
+    file_family = CASE
+        WHEN doc_metadata->>'file_type' = 'application/pdf' THEN 'pdf'
+        WHEN doc_metadata->>'file_type' IN ('application/msword',
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document') THEN 'document'
+        WHEN doc_metadata->>'file_type' LIKE 'image/%' THEN 'image'
+        WHEN doc_metadata->>'file_type' LIKE 'text/%' THEN 'text'
+        ELSE 'other'
+    END,
+    upload_date = (doc_metadata->>'upload_date')::TIMESTAMP
+WHERE owner_id IS NULL;
+
+-- Filter and facet indexes on the promoted metadata columns
+CREATE INDEX IF NOT EXISTS idx_documentindex_owner_date ON documentindex (owner_id, upload_date);
+CREATE INDEX IF NOT EXISTS idx_documentindex_family_date ON documentindex (file_family, upload_date);
+
+-- Migration for existing databases: re-create search_vector with field weights.
+-- A generated column's expression can't be altered before PostgreSQL 17, so the
+-- column (and its GIN index) is dropped and re-added, rewriting the table.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'documentindex'
+          AND column_name = 'search_vector'
+          AND generation_expression LIKE '%setweight%'
+    ) THEN
+        ALTER TABLE documentindex DROP COLUMN IF EXISTS search_vector;
+        ALTER TABLE documentindex ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', regexp_replace(
+                coalesce(doc_metadata->>'original_filename', doc_metadata->>'filename', ''), '[_.]', ' ', 'g')), 'A') ||
+            setweight(to_tsvector('english', coalesce(doc_metadata->>'description', '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(content_text, '')), 'C')
+        ) STORED;
+        CREATE INDEX idx_document_search ON documentindex USING gin(search_vector);
+    END IF;
+END $$;
+
+-- Chunked content for long documents (app/chunks.py): content_text is left
+-- empty and the text is stored one page (or SEARCH_CHUNK_SIZE characters)
+-- per row, each with its own search_vector
+ALTER TABLE documentindex ADD COLUMN IF NOT EXISTS chunk_count INTEGER NOT NULL DEFAULT 0;
+CREATE TABLE IF NOT EXISTS documentindex_chunks (
+    doc_id INTEGER NOT NULL REFERENCES documentindex (doc_id) ON DELETE CASCADE,
+    chunk_no INTEGER NOT NULL,
+    page INTEGER,
+    content TEXT NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (setweight(to_tsvector('english', content), 'C')) STORED,
+    PRIMARY KEY (doc_id, chunk_no)
+);
+CREATE INDEX IF NOT EXISTS idx_documentindex_chunks_search ON documentindex_chunks USING gin(search_vector);
+
+-- Prefix lookups for /search/suggest on normalized filenames
+CREATE INDEX IF NOT EXISTS idx_documentindex_filename_prefix ON documentindex
+    (owner_id, (replace(lower(doc_metadata->>'original_filename'), '_', ' ')) text_pattern_ops);
+
+-- Typo tolerance (app/fuzzy.py): trigram similarity and edit distance
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS fuzzystrmatch;
+
+-- Trigram index on the normalized filename /search matches against
+-- (FILENAME_EXPR in app/search_query.py), for LIKE and word_similarity (<%)
+CREATE INDEX IF NOT EXISTS idx_documentindex_filename_trgm ON documentindex USING gin
+    ((replace(lower(COALESCE(doc_metadata->>'original_filename', '')), '_', ' ')) gin_trgm_ops);
+
+-- Dictionary of search_vector lexemes that misspelled query words are
+-- corrected against; kept up to date by indexing, rebuilt by POST /index/terms
+CREATE TABLE IF NOT EXISTS search_terms (
+    term TEXT PRIMARY KEY,
+    ndoc INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_search_terms_trgm ON search_terms USING gin (term gin_trgm_ops);
+INSERT INTO search_terms (term, ndoc)
+SELECT word, ndoc
+FROM ts_stat('SELECT search_vector FROM documentindex')
+WHERE length(word) >= 3 AND word ~ '^[[:alpha:]]+$'
+ON CONFLICT (term) DO NOTHING;
+
+
+-- Reindex jobs: progress and resume checkpoint for rebuilding documentindex
+-- into documentindex_shadow (created by the reindex job itself)
+CREATE TABLE IF NOT EXISTS reindex_jobs (
+    job_id SERIAL PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_doc_id INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Documents deleted from documentindex while a reindex job was unfinished,
+-- dropped from documentindex_shadow when the job swaps it in
+CREATE TABLE IF NOT EXISTS reindex_deletions (
+    job_id INTEGER NOT NULL REFERENCES reindex_jobs (job_id) ON DELETE CASCADE,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (job_id, doc_id)
+);
+
+-- Incremental sync high-water mark (documents.last_modified, doc_id)
+CREATE TABLE IF NOT EXISTS index_sync_state (
+    name VARCHAR(50) PRIMARY KEY,
+    last_modified TIMESTAMP,
+    last_doc_id INTEGER NOT NULL DEFAULT 0,
+    last_run_at TIMESTAMP,
+    last_indexed_count INTEGER NOT NULL DEFAULT 0,
+    last_deleted_count INTEGER NOT NULL DEFAULT 0
+);
 
 -- Table schema for Search Service                                                         
 ---------------+-----------------------------+-----------+----------+-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -54,8 +180,19 @@ CREATE INDEX idx_document_search ON documentindex USING gin(search_vector);
  content_text  | text                        |           |          | ''::text
  doc_metadata  | jsonb                       |           |          | '{}'::jsonb
  last_indexed  | timestamp without time zone |           |          | CURRENT_TIMESTAMP
- search_vector | tsvector                    |           |          | generated always as (to_tsvector('english'::regconfig, (((COALESCE(content_text, ''::text) || ' '::text) || regexp_replace(COALESCE(doc_metadata ->> 'filename'::text, ''::text), '[_.]'::text, ' '::text, 'g'::text)) || ' '::text) || COALESCE(doc_metadata ->> 'description'::text, ''::text))) stored
+ owner_id      | integer                     |           |          | 
+ file_type     | character varying(100)      |           |          | 
+ file_family   | character varying(20)       |           |          | 
+ upload_date   | timestamp without time zone |           |          | 
+ chunk_count   | integer                     |           | not null | 0
+ search_vector | tsvector                    |           |          | generated always as ((setweight(to_tsvector('english'::regconfig, regexp_replace(COALESCE(doc_metadata ->> 'original_filename'::text, doc_metadata ->> 'filename'::text, ''::text), '[_.]'::text, ' '::text, 'g'::text)), 'A'::"char") || setweight(to_tsvector('english'::regconfig, COALESCE(doc_metadata ->> 'description'::text, ''::text)), 'B'::"char")) || setweight(to_tsvector('english'::regconfig, COALESCE(content_text, ''::text)), 'C'::"char")) stored
 Indexes:
     "documentindex_pkey" PRIMARY KEY, btree (index_id)
     "documentindex_doc_id_key" UNIQUE CONSTRAINT, btree (doc_id)
     "idx_document_search" gin (search_vector)
+    "idx_documentindex_family_date" btree (file_family, upload_date)
+    "idx_documentindex_filename_trgm" gin (replace(lower(COALESCE(doc_metadata ->> 'original_filename'::text, ''::text)), '_'::text, ' '::text) gin_trgm_ops)
+    "idx_documentindex_filename_prefix" btree (owner_id, replace(lower(doc_metadata ->> 'original_filename'::text), '_'::text, ' '::text) text_pattern_ops)
+    "idx_documentindex_owner_date" btree (owner_id, upload_date)
+Referenced by:
+    TABLE "documentindex_chunks" CONSTRAINT "documentindex_chunks_doc_id_fkey" FOREIGN KEY (doc_id) REFERENCES documentindex(doc_id) ON DELETE CASCADE
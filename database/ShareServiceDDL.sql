@@ -18,7 +18,8 @@ CREATE TABLE SharedDocuments (
     last_accessed TIMESTAMP,
     expiry_date TIMESTAMP,              -- Optional expiration date for sharing
     status VARCHAR(20) NOT NULL DEFAULT 'active',  -- active, revoked, expired
-    file_path VARCHAR(255) NOT NULL
+    file_path VARCHAR(255) NOT NULL,
+    content_hash CHAR(64)               -- SHA-256 of the shared copy, used as a strong ETag
 );
 
 -- Add indexes for faster queries
@@ -30,6 +31,9 @@ CREATE INDEX idx_shared_docs_status ON SharedDocuments(status);
 CREATE INDEX idx_recipient_id ON SharedDocuments(recipient_id);
 CREATE INDEX idx_owner_id ON SharedDocuments(owner_id);
 
+-- Migration for existing databases
+ALTER TABLE SharedDocuments ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+
 -- Add unique constraint to prevent duplicate shares
 CREATE UNIQUE INDEX idx_unique_share 
 ON SharedDocuments(doc_id, owner_id, recipient_id) 
@@ -72,6 +76,7 @@ CREATE TRIGGER trigger_update_last_accessed
  expiry_date       | timestamp without time zone |           |          | 
  status            | character varying(20)       |           | not null | 'active'::character varying
  file_path         | character varying(255)      |           | not null | 
+ content_hash      | character(64)               |           |          | 
 Indexes:
     "shareddocuments_pkey" PRIMARY KEY, btree (share_id)
     "idx_owner_id" btree (owner_id)
@@ -17,7 +17,8 @@ CREATE TABLE Documents (
     file_path VARCHAR(255) NOT NULL,
     upload_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     last_modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    description TEXT
+    description TEXT,
+    content_hash CHAR(64)                    -- SHA-256 of the stored file, used as a strong ETag
     
     -- Removed the foreign key constraint since we will be using a different database
     -- Referential integrity will be handled at the application level
@@ -26,6 +27,12 @@ CREATE TABLE Documents (
 -- Add index for faster user-based queries
 CREATE INDEX idx_documents_user_id ON Documents(user_id);
 
+-- Watermark scans for incremental search index sync
+CREATE INDEX IF NOT EXISTS idx_documents_last_modified ON Documents(last_modified, doc_id);
+
+-- Migration for existing databases
+ALTER TABLE Documents ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+
 -- Table schema for Document Management Service
       Column       |            Type             | Collation | Nullable |                  Default                  
 -------------------+-----------------------------+-----------+----------+-------------------------------------------
@@ -39,6 +46,8 @@ CREATE INDEX idx_documents_user_id ON Documents(user_id);
  upload_date       | timestamp without time zone |           | not null | CURRENT_TIMESTAMP
  last_modified     | timestamp without time zone |           | not null | CURRENT_TIMESTAMP
  description       | text                        |           |          | 
+ content_hash      | character(64)               |           |          | 
 Indexes:
     "documents_pkey" PRIMARY KEY, btree (doc_id)
+    "idx_documents_last_modified" btree (last_modified, doc_id)
     "idx_documents_user_id" btree (user_id)
\ No newline at end of file
@@ -0,0 +1,94 @@
+# Gunicorn settings shared by the gateway and the Flask services.
+#
+# start_services.py --prod runs each service as
+#   python -m gunicorn --config deploy/gunicorn.conf.py run:app
+# and sets the GUNICORN_* variables below per service. To run one by hand:
+#   cd services/auth_service
+#   GUNICORN_BIND=127.0.0.1:3001 python -m gunicorn -c ../../deploy/gunicorn.conf.py run:app
+#
+# kill -HUP <master pid> restarts the workers gracefully with re-read settings.
+# With GUNICORN_PRELOAD=true (the default) they keep the code loaded by the
+# master; set it to false to have HUP pick up new code as well.
+import glob
+import multiprocessing
+import os
+import sys
+
+# For common.metrics in the hooks below
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker; the services spend most of their time in Postgres and
+# in calls to each other, so a few threads per process help
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Load the app once in the master and fork it into the workers
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+
+# Recycle workers after this many requests (jittered so they don't all
+# restart at once), bounding slow leaks and memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', max(max_requests // 10, 1)))
+
+# Uploads, exports and reindex requests can take a while
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = os.getenv('GUNICORN_ERRORLOG', '-')
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+proc_name = os.getenv('GUNICORN_PROC_NAME')
+
+
+def on_starting(server):
+    """
+    Start the service's metrics from zero: drop what the workers of a
+    previous run left in METRICS_DIR.
+    """
+    directory = os.getenv('METRICS_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.remove(path)
+
+
+def worker_exit(server, worker):
+    """
+    Write the worker's last metrics for child_exit to archive.
+    """
+    from common.metrics import REGISTRY
+    REGISTRY.flush()
+
+
+def child_exit(server, worker):
+    """
+    Keep an exited worker's counters in the service totals (see
+    common/metrics.py), so recycling workers doesn't reset them.
+    """
+    from common.metrics import mark_process_dead
+    mark_process_dead(worker.pid, os.getenv('METRICS_DIR', ''))
+
+
+def post_fork(server, worker):
+    """
+    Drop database connections inherited from the preloaded master, so no two
+    workers share a socket. The pools reconnect on first use.
+    """
+    if not preload_app:
+        return
+    app = worker.app.wsgi()
+    extension = getattr(app, 'extensions', {}).get('sqlalchemy')
+    if extension is None:
+        return
+    with app.app_context():
+        for engine in extension.engines.values():
+            engine.dispose(close=False)
@@ -3,59 +3,146 @@ from flask_cors import CORS, cross_origin
 import requests
 import os
 from dotenv import load_dotenv
-import traceback
+import logging
 import jwt
 import base64
 import json
 from datetime import datetime
 import mimetypes
+import time
+from common.health import health_blueprint, UpstreamHealth
+from common.breaker import CircuitBreaker, CircuitOpen
+from common.metrics import init_metrics, Counter, Gauge, Histogram
+from common.tracing import init_tracing, span, outgoing_headers, CLIENT
+from common.logs import setup_logging
+from common.profiling import init_profiling
 
 load_dotenv()
+setup_logging('gateway')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "X-User-Id", "Accept"],
+        "allow_headers": ["Content-Type", "Authorization", "X-User-Id", "Accept",
+                          "Range", "If-Range", "If-None-Match", "If-Modified-Since"],
         "supports_credentials": True,
-        "expose_headers": ["Content-Type", "Authorization"]
+        "expose_headers": ["Content-Type", "Authorization", "Content-Disposition", "Content-Range",
+                           "Accept-Ranges", "ETag", "Last-Modified"]
     }
 })
 
+# Overridable so the services can run on other hosts or ports
 SERVICES = {
-    'auth': 'http://localhost:3001',
-    'docs': 'http://localhost:3002',
-    'search': 'http://localhost:3003',
-    'share': 'http://localhost:3004'
+    'auth': os.getenv('AUTH_SERVICE_URL', f"http://localhost:{os.getenv('AUTH_SERVICE_PORT', 3001)}"),
+    'docs': os.getenv('DOC_SERVICE_URL', f"http://localhost:{os.getenv('DOC_SERVICE_PORT', 3002)}"),
+    'search': os.getenv('SEARCH_SERVICE_URL', f"http://localhost:{os.getenv('SEARCH_SERVICE_PORT', 3003)}"),
+    'share': os.getenv('SHARE_SERVICE_URL', f"http://localhost:{os.getenv('SHARE_SERVICE_PORT', 3004)}")
 }
 
+# Deadline for upstream calls that don't set their own: (connect, read) seconds
+UPSTREAM_TIMEOUT = (
+    float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+    float(os.getenv('UPSTREAM_READ_TIMEOUT', 30))
+)
+# Uploads extract and index every file before the docs service answers,
+# which can take well over the default read timeout for a batch
+UPLOAD_TIMEOUT = (UPSTREAM_TIMEOUT[0], float(os.getenv('UPLOAD_READ_TIMEOUT', 180)))
+
+# One breaker per service; 5xx responses count as failures along with
+# connection errors, timeouts and slow calls
+breakers = {
+    name: CircuitBreaker(name, is_failure=lambda response: response.status_code >= 500)
+    for name in SERVICES
+}
+
+upstream_latency = Histogram(
+    'upstream_request_duration_seconds', 'Time for a backend service to answer the gateway.', ['service']
+)
+upstream_requests = Counter(
+    'upstream_requests_total', 'Gateway calls to backend services by outcome.', ['service', 'outcome']
+)
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+Gauge(
+    'upstream_circuit_state', 'Circuit breaker state per service (0 closed, 1 half-open, 2 open).', ['service'],
+    callback=lambda: {(name,): BREAKER_STATES[breaker.state] for name, breaker in breakers.items()},
+    # Each worker has its own breakers; report the most open one
+    multiprocess_mode='max'
+)
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """Raised without calling a service whose circuit is open"""
+
+def upload_call_options(method):
+    """
+    Extra call_upstream arguments for a proxied docs request: POSTs are
+    uploads, so they get UPLOAD_TIMEOUT and no latency threshold rather
+    than timing out at the gateway (while the upload still commits) or
+    opening the docs circuit.
+    """
+    if method == 'POST':
+        return {'timeout': UPLOAD_TIMEOUT, 'slow_seconds': None}
+    return {}
+
+def call_upstream(service, method, url, **kwargs):
+    """
+    Call a backend service through its circuit breaker, with a default
+    deadline, in a client span and carrying the request id. Fails fast
+    with UpstreamUnavailable (a RequestException, so the routes answer 503
+    as for any unreachable service) while the service's circuit is open.
+    Pass slow_seconds=None for calls that are expected to take long, to
+    exempt them from the latency threshold.
+    """
+    kwargs.setdefault('timeout', UPSTREAM_TIMEOUT)
+    started = time.perf_counter()
+    try:
+        with span(f"{method} {service}", kind=CLIENT, **{'peer.service': service, 'http.url': url}) as client:
+            kwargs['headers'] = outgoing_headers(kwargs.get('headers'))
+            response = breakers[service].call(requests.request, method, url, **kwargs)
+            if client is not None:
+                client.set('http.status_code', response.status_code)
+    except CircuitOpen as e:
+        upstream_requests.inc((service, 'circuit_open'))
+        raise UpstreamUnavailable(str(e)) from e
+    except requests.exceptions.Timeout:
+        upstream_requests.inc((service, 'timeout'))
+        raise
+    except requests.exceptions.RequestException:
+        upstream_requests.inc((service, 'error'))
+        raise
+    upstream_latency.observe(time.perf_counter() - started, (service,))
+    upstream_requests.inc((service, f"{response.status_code // 100}xx"))
+    return response
+
+app.register_blueprint(health_blueprint('gateway'))
+init_metrics(app)
+init_tracing(app, 'gateway', edge=True)
+init_profiling(app, 'gateway')
+# Readiness of every service, polled at most once per HEALTH_CACHE_SECONDS
+upstream_health = UpstreamHealth(SERVICES, ttl=float(os.getenv('HEALTH_CACHE_SECONDS', 5)))
+
 def get_forwarded_headers(request):
     """Forward relevant headers from the original request"""
     headers = {
         key: value for (key, value) in request.headers if key != 'Host'
     }
     
-    print("Original headers:", headers)  # Debug print
-    
     # Get the authorization header
     auth_header = headers.get('Authorization')
     if auth_header and auth_header.startswith('Bearer '):
         token = auth_header.split(' ')[1]
-        print("Original token:", token)  # Debug print
         
         try:
             # Decode the token using SECRET_KEY from .env
             secret_key = os.getenv('SECRET_KEY')
-            print("Using secret key:", secret_key)  # Debug print
             
             decoded = jwt.decode(token, secret_key, algorithms=['HS256'])
-            print("Decoded token:", decoded)  # Debug print
             
             # Add sub claim if missing
             if 'user_id' in decoded and 'sub' not in decoded:
                 decoded['sub'] = str(decoded['user_id'])  # Convert to string for sub claim
-                print("Added sub claim:", decoded)  # Debug print
                 
                 # Create new token with sub claim using the same SECRET_KEY
                 new_token = jwt.encode(
@@ -66,13 +153,10 @@ def get_forwarded_headers(request):
                 
                 # Update the Authorization header with the new token
                 headers['Authorization'] = f'Bearer {new_token}'
-                print("New token created:", new_token)  # Debug print
         except Exception as e:
-            print(f"Gateway: Error processing token: {str(e)}")
-            print(f"Error type: {type(e)}")  # Debug print
-            traceback.print_exc()  # Print full traceback
+            # Never log the token or the key, only why decoding failed
+            logger.warning('Could not process token: %s', e)
     
-    print("Final headers:", headers)  # Debug print
     return headers
 
 def get_search_headers(request):
@@ -86,6 +170,43 @@ def get_search_headers(request):
     # Remove None values
     return {k: v for k, v in headers.items() if v is not None}
 
+# Request headers file routes accept for byte-range and conditional GETs
+FILE_REQUEST_HEADERS = 'Content-Type,Authorization,Range,If-Range,If-None-Match,If-Modified-Since'
+
+# Statuses a file fetch can legitimately return (full, partial, not modified)
+FILE_OK_STATUSES = (200, 206, 304)
+
+# Upstream headers passed through unchanged on file responses. X-Accel-Redirect
+# and X-Sendfile reach the front web server when file serving is offloaded.
+FILE_RESPONSE_HEADERS = (
+    'Content-Type', 'Content-Length', 'Content-Disposition', 'Content-Range',
+    'Accept-Ranges', 'Cache-Control', 'Expires', 'ETag', 'Last-Modified',
+    'X-Accel-Redirect', 'X-Sendfile'
+)
+
+def file_response(upstream):
+    """Stream an upstream file response to the client, keeping its status and caching headers"""
+    headers = {
+        key: upstream.headers[key] for key in FILE_RESPONSE_HEADERS if key in upstream.headers
+    }
+    headers['Access-Control-Allow-Origin'] = 'http://localhost:3000'
+    headers['Access-Control-Allow-Credentials'] = 'true'
+    return Response(
+        upstream.iter_content(chunk_size=64 * 1024),
+        status=upstream.status_code,
+        headers=headers,
+        direct_passthrough=True
+    )
+
+@app.route('/health/all', methods=['GET'])
+def health_all():
+    """Readiness of the gateway's upstream services"""
+    summary = {
+        **upstream_health.get(),
+        'breakers': {name: breaker.snapshot() for name, breaker in breakers.items()}
+    }
+    return jsonify(summary), 200 if summary['status'] == 'ready' else 503
+
 @app.route('/auth/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
 def auth_service(path):
     if request.method == 'OPTIONS':
@@ -97,7 +218,8 @@ def auth_service(path):
 
     try:
         service_url = SERVICES['auth']
-        response = requests.request(
+        response = call_upstream(
+            'auth',
             method=request.method,
             url=f"{service_url}/auth/{path}",
             headers={key: value for key, value in request.headers if key != 'Host'},
@@ -125,20 +247,20 @@ def docs_service(path):
         if path:
             target_url = f"{target_url}/{path}"
             
-        print(f"Gateway: Forwarding {request.method} request to: {target_url}")
-        print(f"Gateway: Headers: {dict(request.headers)}")
+        logger.debug('Forwarding %s request to: %s', request.method, target_url)
         
-        response = requests.request(
+        response = call_upstream(
+            'docs',
             method=request.method,
             url=target_url,
             headers={k: v for k, v in request.headers.items() if k != 'Host'},
             data=request.get_data(),
             cookies=request.cookies,
-            allow_redirects=False
+            allow_redirects=False,
+            **upload_call_options(request.method)
         )
         
-        print(f"Gateway: Response status: {response.status_code}")
-        print(f"Gateway: Response content: {response.content.decode()[:200]}")
+        logger.debug('Response status: %s', response.status_code)
         
         gateway_response = make_response(response.content)
         gateway_response.status_code = response.status_code
@@ -146,7 +268,7 @@ def docs_service(path):
         return gateway_response
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in docs_service: %s', e)
         return jsonify({'error': 'Document service unavailable'}), 503
 
 @app.route('/docs/file/<path:path>', methods=['GET', 'PUT', 'OPTIONS'])
@@ -154,7 +276,7 @@ def get_document(path):
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', FILE_REQUEST_HEADERS)
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
@@ -170,36 +292,39 @@ def get_document(path):
         
         # Handle both GET and PUT requests
         if request.method == 'GET':
-            response = requests.get(
+            # Range and conditional headers are forwarded, and 206/304 come back unchanged
+            response = call_upstream(
+                'docs', 'GET',
                 target_url,
                 headers=get_forwarded_headers(request),
                 cookies=request.cookies,
                 stream=True
             )
-        elif request.method == 'PUT':
-            response = requests.put(
-                target_url,
-                headers=get_forwarded_headers(request),
-                data=request.get_data(),
-                cookies=request.cookies
-            )
+            return file_response(response)
+
+        response = call_upstream(
+            'docs', 'PUT',
+            target_url,
+            headers=get_forwarded_headers(request),
+            data=request.get_data(),
+            cookies=request.cookies
+        )
         
         return Response(
-            response.iter_content(chunk_size=8192) if request.method == 'GET' else response.content,
+            response.content,
             status=response.status_code,
             headers={
                 'Content-Type': response.headers.get('Content-Type', 'application/octet-stream'),
                 'Access-Control-Allow-Origin': 'http://localhost:3000',
                 'Access-Control-Allow-Credentials': 'true'
-            },
-            direct_passthrough=request.method == 'GET'
+            }
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in get_document: {str(e)}")
+        logger.error('Error in get_document: %s', e)
         return jsonify({'error': 'Document service unavailable'}), 503
     except Exception as e:
-        print(f"Unexpected error in get_document: {str(e)}")
+        logger.error('Unexpected error in get_document: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/docs/documents', methods=['GET'])
@@ -208,17 +333,16 @@ def get_documents():
         service_url = SERVICES['docs']
         target_url = f"{service_url}/docs/documents"
         
-        print(f"Gateway: Forwarding GET request to: {target_url}")
-        print(f"Gateway: Headers being forwarded: {get_forwarded_headers(request)}")
+        logger.debug('Forwarding GET request to: %s', target_url)
         
-        response = requests.get(
+        response = call_upstream(
+            'docs', 'GET',
             target_url,
             headers=get_forwarded_headers(request)
         )
         
-        print(f"Gateway: Response status: {response.status_code}")
         if response.status_code != 200:
-            print(f"Gateway: Error response: {response.text}")
+            logger.warning('Docs service returned %s for %s', response.status_code, target_url)
         
         return Response(
             response.content,
@@ -227,7 +351,7 @@ def get_documents():
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_documents: %s', e)
         return jsonify({'error': 'Document service unavailable'}), 503
 
 @app.route('/docs/recent', methods=['GET', 'OPTIONS'])
@@ -244,17 +368,16 @@ def get_recent_files():
         service_url = SERVICES['docs']
         target_url = f"{service_url}/docs/recent"
         
-        print(f"Gateway: Forwarding GET request to: {target_url}")
-        print(f"Gateway: Headers being forwarded: {get_forwarded_headers(request)}")
+        logger.debug('Forwarding GET request to: %s', target_url)
         
-        response = requests.get(
+        response = call_upstream(
+            'docs', 'GET',
             target_url,
             headers=get_forwarded_headers(request)
         )
         
-        print(f"Gateway: Response status: {response.status_code}")
         if response.status_code != 200:
-            print(f"Gateway: Error response: {response.text}")
+            logger.warning('Docs service returned %s for %s', response.status_code, target_url)
         
         gateway_response = make_response(response.content)
         gateway_response.headers['Access-Control-Allow-Credentials'] = 'true'
@@ -264,7 +387,7 @@ def get_recent_files():
         return gateway_response
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_recent_files: %s', e)
         return jsonify({'error': 'Document service unavailable'}), 503
 
 @app.route('/search', methods=['GET', 'OPTIONS'])
@@ -287,14 +410,14 @@ def search_service():
         service_url = SERVICES['search']
         target_url = f"{service_url}/search"
         
-        print("=== Search Request Debug ===")
-        print(f"Query params: {dict(request.args)}")
+        logger.debug('Query params: %s', dict(request.args))
         
         # Create headers with user ID
         headers = get_search_headers(request)
         
         # Get search results
-        search_response = requests.get(
+        search_response = call_upstream(
+            'search', 'GET',
             target_url,
             headers=headers,
             params=request.args
@@ -311,17 +434,27 @@ def search_service():
                 }
             )
 
-        # Now get shared files metadata
+        # Now get shared files metadata. Without the share service (down, or
+        # its circuit open) the user still gets their own results.
         share_url = f"{SERVICES['share']}/share/file/metadata"
-        share_response = requests.get(
-            share_url,
-            headers=headers,
-            params={'user_id': user_id}
-        )
+        degraded = []
+        try:
+            share_response = call_upstream(
+                'share', 'GET',
+                share_url,
+                headers=headers,
+                params={'user_id': user_id},
+                timeout=(1, 5)
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning('Searching without shared files: %s', e)
+            share_response = None
+        if share_response is None or share_response.status_code >= 500:
+            degraded.append('share')
 
         # Combine results
         search_results = search_response.json()
-        if share_response.status_code == 200:
+        if share_response is not None and share_response.status_code == 200:
             shared_files = share_response.json().get('files', [])
             # Add shared files to search results
             search_results['results'].extend([
@@ -333,11 +466,83 @@ def search_service():
         
         return jsonify({
             'results': search_results['results'],
-            'total': len(search_results['results'])
+            'total': len(search_results['results']),
+            # Paging of the indexed matches (shared file metadata is appended unpaged)
+            'total_matches': search_results.get('total'),
+            'page': search_results.get('page'),
+            'per_page': search_results.get('per_page'),
+            'facets': search_results.get('facets'),
+            # Services whose part of the results is missing
+            'degraded': degraded
         })
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in search_service: %s', e)
+        return jsonify({'error': 'Search service unavailable'}), 503
+
+@app.route('/search/suggest', methods=['GET', 'OPTIONS'])
+def search_suggest():
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, Accept')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response
+
+    # Fired on every keystroke: a straight pass-through, no share lookup here
+    try:
+        response = call_upstream(
+            'search', 'GET',
+            f"{SERVICES['search']}/search/suggest",
+            headers=get_search_headers(request),
+            params=request.args,
+            timeout=2
+        )
+        return Response(
+            response.content,
+            status=response.status_code,
+            headers={
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': 'http://localhost:3000',
+                'Access-Control-Allow-Credentials': 'true'
+            }
+        )
+
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in search_suggest: %s', e)
+        return jsonify({'error': 'Search service unavailable'}), 503
+
+@app.route('/search/similar/<int:doc_id>', methods=['GET', 'OPTIONS'])
+def search_similar(doc_id):
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, Accept')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response
+
+    try:
+        response = call_upstream(
+            'search', 'GET',
+            f"{SERVICES['search']}/search/similar/{doc_id}",
+            headers=get_search_headers(request),
+            params=request.args,
+            timeout=10
+        )
+        return Response(
+            response.content,
+            status=response.status_code,
+            headers={
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': 'http://localhost:3000',
+                'Access-Control-Allow-Credentials': 'true'
+            }
+        )
+
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in search_similar: %s', e)
         return jsonify({'error': 'Search service unavailable'}), 503
 
 @app.route('/search/index', methods=['POST', 'OPTIONS'])
@@ -354,9 +559,10 @@ def index_document():
         service_url = SERVICES['search']
         target_url = f"{service_url}/index"
         
-        print(f"Gateway: Forwarding POST request to: {target_url}")
+        logger.debug('Forwarding POST request to: %s', target_url)
         
-        response = requests.post(
+        response = call_upstream(
+            'search', 'POST',
             target_url,
             headers=get_forwarded_headers(request),
             json=request.get_json()
@@ -370,7 +576,7 @@ def index_document():
         return gateway_response
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in index_document: %s', e)
         return jsonify({'error': 'Search service unavailable'}), 503
 
 @app.route('/docs/documents/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'])
@@ -390,13 +596,15 @@ def docs_service_with_path(path):
         headers = get_forwarded_headers(request)
         headers['Accept'] = request.headers.get('Accept', 'application/json')
         
-        response = requests.request(
+        response = call_upstream(
+            'docs',
             method=request.method,
             url=target_url,
             headers=headers,
             data=request.get_data(),
             cookies=request.cookies,
-            allow_redirects=False
+            allow_redirects=False,
+            **upload_call_options(request.method)
         )
         
         # Create response with proper headers
@@ -415,9 +623,44 @@ def docs_service_with_path(path):
         return gateway_response
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in docs_service_with_path: %s', e)
         return jsonify({'error': 'Service unavailable'}), 503
 
+@app.route('/search/index/bulk', methods=['POST', 'OPTIONS'])
+def index_documents_bulk():
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response
+
+    try:
+        target_url = f"{SERVICES['search']}/index/bulk"
+        logger.debug('Forwarding bulk index request to: %s', target_url)
+
+        response = call_upstream(
+            'search', 'POST',
+            target_url,
+            headers=get_forwarded_headers(request),
+            data=request.get_data(),
+            timeout=60,
+            slow_seconds=None
+        )
+
+        gateway_response = make_response(response.content)
+        gateway_response.headers['Content-Type'] = response.headers.get('Content-Type', 'application/json')
+        gateway_response.headers['Access-Control-Allow-Credentials'] = 'true'
+        gateway_response.headers['Access-Control-Allow-Origin'] = 'http://localhost:3000'
+        gateway_response.status_code = response.status_code
+
+        return gateway_response
+
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in index_documents_bulk: %s', e)
+        return jsonify({'error': 'Search service unavailable'}), 503
+
 @app.route('/search/delete/<path:path>', methods=['DELETE', 'OPTIONS'])
 def delete_search_index(path):
     if request.method == 'OPTIONS':
@@ -432,9 +675,10 @@ def delete_search_index(path):
         service_url = SERVICES['search']
         target_url = f"{service_url}/search/delete/{path}"
         
-        print(f"Gateway: Forwarding DELETE request to search service: {target_url}")
+        logger.debug('Forwarding DELETE request to search service: %s', target_url)
         
-        response = requests.delete(
+        response = call_upstream(
+            'search', 'DELETE',
             target_url,
             headers=get_forwarded_headers(request)
         )
@@ -450,14 +694,15 @@ def delete_search_index(path):
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in delete_search_index: %s', e)
         return jsonify({'error': 'Search service unavailable'}), 503
 
 def get_user_id_from_email(email):
     try:
         # Forward request to auth service to get user ID from email
         auth_url = f"{SERVICES['auth']}/auth/user/by-email"
-        response = requests.post(
+        response = call_upstream(
+            'auth', 'POST',
             auth_url,
             headers={'Content-Type': 'application/json'},
             json={'email': email}
@@ -467,12 +712,11 @@ def get_user_id_from_email(email):
             data = response.json()
             return data.get('user_id')
         else:
-            print(f"Error getting user ID from email: {response.status_code}")
-            print(f"Response: {response.text}")
+            logger.warning('Error getting user ID from email: %s', response.status_code)
             return None
             
     except Exception as e:
-        print(f"Error in get_user_id_from_email: {str(e)}")
+        logger.error('Error in get_user_id_from_email: %s', e)
         return None
 
 @app.route('/share', methods=['POST', 'OPTIONS'])
@@ -487,27 +731,25 @@ def create_share():
 
     try:
         data = request.get_json()
-        print(f"Gateway: Received share request data: {data}")
         
         # Get document metadata from docs service
         docs_url = f"{SERVICES['docs']}/docs/file/{data['doc_id']}/metadata"
         headers = get_forwarded_headers(request)
         
-        print(f"Gateway: Fetching document details from: {docs_url}")
-        print(f"Gateway: Using headers: {headers}")
+        logger.debug('Fetching document details from: %s', docs_url)
         
-        docs_response = requests.get(
+        docs_response = call_upstream(
+            'docs', 'GET',
             docs_url,
             headers=headers,
             timeout=5
         )
         
-        print(f"Gateway: Docs service response status: {docs_response.status_code}")
-        print(f"Gateway: Docs service response content: {docs_response.content.decode('utf-8', errors='replace')}")
+        logger.debug('Docs service response status: %s', docs_response.status_code)
         
         if docs_response.status_code != 200:
             error_msg = f"Document not found: {docs_response.text}"
-            print(f"Gateway: {error_msg}")
+            logger.warning('Docs service returned %s for %s', docs_response.status_code, docs_url)
             response = jsonify({'error': error_msg})
             response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
             response.headers.add('Access-Control-Allow-Credentials', 'true')
@@ -522,18 +764,17 @@ def create_share():
             
         # Forward to share service
         share_url = f"{SERVICES['share']}/share"
-        print(f"Gateway: Forwarding to share service: {share_url}")
-        print(f"Gateway: Share request data: {share_data}")
+        logger.debug('Forwarding to share service: %s', share_url)
         
-        share_response = requests.post(
+        share_response = call_upstream(
+            'share', 'POST',
             share_url,
             headers=headers,
             json=share_data,
             timeout=5
         )
         
-        print(f"Gateway: Share service response status: {share_response.status_code}")
-        print(f"Gateway: Share service response content: {share_response.content.decode('utf-8', errors='replace')}")
+        logger.debug('Share service response status: %s', share_response.status_code)
         
         # Create response with proper CORS headers
         response = Response(
@@ -550,14 +791,13 @@ def create_share():
         return response
             
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error (Request failed): {str(e)}")
+        logger.error('Upstream request failed in create_share: %s', e)
         error_response = jsonify({'error': f'Service unavailable: {str(e)}'})
         error_response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
         error_response.headers.add('Access-Control-Allow-Credentials', 'true')
         return error_response, 503
     except Exception as e:
-        print(f"Gateway error (Unexpected): {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception('Error in create_share: %s', e)
         error_response = jsonify({'error': 'Internal server error'})
         error_response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
         error_response.headers.add('Access-Control-Allow-Credentials', 'true')
@@ -577,7 +817,8 @@ def revoke_share(share_id):
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/{share_id}"
         
-        response = requests.delete(
+        response = call_upstream(
+            'share', 'DELETE',
             target_url,
             headers=get_forwarded_headers(request)
         )
@@ -593,7 +834,7 @@ def revoke_share(share_id):
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in revoke_share: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 @app.route('/share/shared-with-me', methods=['GET', 'OPTIONS'])
@@ -605,15 +846,15 @@ def get_shared_with_me():
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/shared-with-me"
         
-        print(f"Gateway: Forwarding shared-with-me request to: {target_url}")
+        logger.debug('Forwarding shared-with-me request to: %s', target_url)
         
-        share_response = requests.get(
+        share_response = call_upstream(
+            'share', 'GET',
             target_url,
             headers=get_forwarded_headers(request)
         )
         
-        print(f"Gateway: Share service response: {share_response.status_code}")
-        print(f"Gateway: Share service content: {share_response.content}")
+        logger.debug('Share service response: %s', share_response.status_code)
         
         return Response(
             share_response.content,
@@ -625,7 +866,7 @@ def get_shared_with_me():
             }
         )
     except Exception as e:
-        print(f"Gateway error in get_shared_with_me: {str(e)}")
+        logger.error('Error in get_shared_with_me: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 def handle_options_request():
@@ -645,15 +886,15 @@ def get_shared_by_me():
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/shared-by-me"
         
-        print(f"Gateway: Forwarding shared-by-me request to: {target_url}")
+        logger.debug('Forwarding shared-by-me request to: %s', target_url)
         
-        share_response = requests.get(
+        share_response = call_upstream(
+            'share', 'GET',
             target_url,
             headers=get_forwarded_headers(request)
         )
         
-        print(f"Gateway: Share service response: {share_response.status_code}")
-        print(f"Gateway: Share service content: {share_response.content}")
+        logger.debug('Share service response: %s', share_response.status_code)
         
         return Response(
             share_response.content,
@@ -665,7 +906,7 @@ def get_shared_by_me():
             }
         )
     except Exception as e:
-        print(f"Gateway error in get_shared_by_me: {str(e)}")
+        logger.error('Error in get_shared_by_me: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 @app.route('/share/<int:share_id>/permissions', methods=['PATCH', 'OPTIONS'])
@@ -682,7 +923,8 @@ def update_share_permissions(share_id):
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/{share_id}/permissions"
         
-        response = requests.patch(
+        response = call_upstream(
+            'share', 'PATCH',
             target_url,
             headers=get_forwarded_headers(request),
             json=request.get_json()
@@ -699,7 +941,7 @@ def update_share_permissions(share_id):
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in update_share_permissions: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 # Add new route for document previews
@@ -708,7 +950,7 @@ def preview_document(doc_id):
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', FILE_REQUEST_HEADERS)
         response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
@@ -723,38 +965,123 @@ def preview_document(doc_id):
         service_url = SERVICES['docs']
         target_url = f"{service_url}/docs/file/{doc_id}"  # Using the file endpoint since that's what has the content
         
-        print(f"Gateway: Forwarding preview request to: {target_url}")
+        logger.debug('Forwarding preview request to: %s', target_url)
         headers = get_forwarded_headers(request)
         
-        response = requests.get(
+        response = call_upstream(
+            'docs', 'GET',
             target_url,
             headers=headers,
             stream=True  # Important for handling file downloads
         )
         
-        if response.status_code != 200:
+        if response.status_code not in FILE_OK_STATUSES:
             return jsonify({'error': 'File not found'}), response.status_code
             
         # Get content type from response
         content_type = response.headers.get('Content-Type', 'application/octet-stream')
         
         # For now, we'll only support direct preview for images and PDFs
-        if not (content_type.startswith('image/') or content_type == 'application/pdf'):
+        if response.status_code != 304 and not (content_type.startswith('image/') or content_type == 'application/pdf'):
             return jsonify({'error': 'Unsupported file type for preview'}), 415
             
+        return file_response(response)
+        
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in preview: %s', e)
+        return jsonify({'error': 'Document service unavailable'}), 503
+
+@app.route('/docs/export', methods=['GET', 'POST', 'OPTIONS'])
+def export_documents():
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response
+
+    # The archive is built while it is sent, so stream it through instead of
+    # buffering it like the generic /docs/<path> proxy does.
+    try:
+        response = call_upstream(
+            'docs',
+            method=request.method,
+            url=f"{SERVICES['docs']}/docs/export",
+            headers={k: v for k, v in request.headers.items() if k != 'Host'},
+            params=request.args,
+            data=request.get_data(),
+            stream=True,
+            timeout=(5, 60),
+            slow_seconds=None
+        )
+        return file_response(response)
+
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in export_documents: %s', e)
+        return jsonify({'error': 'Document service unavailable'}), 503
+
+@app.route('/docs/signed/<token>', methods=['GET'])
+def get_signed_document(token):
+    # The signed token is the authorization; the docs service verifies it
+    # without a database lookup, so there is no access check round trip here.
+    try:
+        response = call_upstream(
+            'docs', 'GET',
+            f"{SERVICES['docs']}/docs/signed/{token}",
+            headers={k: v for k, v in request.headers.items() if k != 'Host'},
+            stream=True,
+            timeout=10
+        )
+        return file_response(response)
+
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in get_signed_document: %s', e)
+        return jsonify({'error': 'Document service unavailable'}), 503
+
+@app.route('/share/signed/<token>', methods=['GET'])
+def get_signed_shared_document(token):
+    try:
+        response = call_upstream(
+            'share', 'GET',
+            f"{SERVICES['share']}/share/signed/{token}",
+            headers={k: v for k, v in request.headers.items() if k != 'Host'},
+            stream=True,
+            timeout=10
+        )
+        return file_response(response)
+
+    except requests.exceptions.RequestException as e:
+        logger.error('Error in get_signed_shared_document: %s', e)
+        return jsonify({'error': 'Share service unavailable'}), 503
+
+@app.route('/share/preview/<int:share_id>/signed-url', methods=['GET', 'OPTIONS'])
+def get_shared_signed_url(share_id):
+    if request.method == 'OPTIONS':
+        return handle_options_request()
+
+    try:
+        response = call_upstream(
+            'share', 'GET',
+            f"{SERVICES['share']}/share/preview/{share_id}/signed-url",
+            headers=get_forwarded_headers(request),
+            params=request.args,
+            timeout=5
+        )
+
         return Response(
             response.content,
             status=response.status_code,
             headers={
-                'Content-Type': content_type,
+                'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': 'http://localhost:3000',
                 'Access-Control-Allow-Credentials': 'true'
             }
         )
-        
+
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in preview: {str(e)}")
-        return jsonify({'error': 'Document service unavailable'}), 503
+        logger.error('Error in get_shared_signed_url: %s', e)
+        return jsonify({'error': 'Share service unavailable'}), 503
 
 def get_user_id_from_token(auth_header):
     if not auth_header or not auth_header.startswith('Bearer '):
@@ -765,16 +1092,16 @@ def get_user_id_from_token(auth_header):
         # Get JWT secret from environment
         jwt_secret = os.getenv('SECRET_KEY')
         if not jwt_secret:
-            print("Warning: SECRET_KEY not found in environment")
+            logger.warning('SECRET_KEY not found in environment')
             return None
             
         decoded = jwt.decode(token, jwt_secret, algorithms=['HS256'])
         return decoded.get('user_id')
     except jwt.InvalidTokenError as e:
-        print(f"Token validation error: {str(e)}")
+        logger.error('Token validation error: %s', e)
         return None
     except Exception as e:
-        print(f"Unexpected error decoding token: {str(e)}")
+        logger.error('Unexpected error decoding token: %s', e)
         return None
 
 @app.route('/auth/users/lookup', methods=['GET', 'OPTIONS'])
@@ -793,7 +1120,8 @@ def lookup_user():
         target_url = f"{service_url}/auth/users/lookup"
         
         # Forward the email parameter and headers
-        response = requests.get(
+        response = call_upstream(
+            'auth', 'GET',
             target_url,
             headers=get_forwarded_headers(request),
             params={'email': request.args.get('email')}
@@ -810,7 +1138,7 @@ def lookup_user():
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in lookup_user: {str(e)}")
+        logger.error('Error in lookup_user: %s', e)
         return jsonify({'error': 'Auth service unavailable'}), 503
 
 @app.route('/share/preview/<doc_id>', methods=['GET', 'OPTIONS'])
@@ -828,7 +1156,8 @@ def preview_shared_document(doc_id):
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/preview/{doc_id}"
         
-        response = requests.get(
+        response = call_upstream(
+            'share', 'GET',
             target_url,
             headers=get_forwarded_headers(request)
         )
@@ -844,7 +1173,7 @@ def preview_shared_document(doc_id):
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in preview_shared_document: {str(e)}")
+        logger.error('Error in preview_shared_document: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 @app.route('/share/file/<doc_id>', methods=['GET', 'OPTIONS'])
@@ -852,7 +1181,7 @@ def get_shared_file(doc_id):
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', FILE_REQUEST_HEADERS)
         response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
@@ -865,39 +1194,32 @@ def get_shared_file(doc_id):
 
         # Check access through share service
         share_service_url = SERVICES['share']
-        access_check = requests.get(
+        access_check = call_upstream(
+            'share', 'GET',
             f"{share_service_url}/share/check-access/{doc_id}",
             headers=get_forwarded_headers(request)
         )
 
         if access_check.status_code != 200:
-            print(f"Access denied: {access_check.text}")
+            logger.debug('Access denied: %s', access_check.text)
             return jsonify({'error': 'Access denied'}), 403
 
         # Access granted, get file from docs service
         docs_service_url = SERVICES['docs']
-        file_response = requests.get(
+        upstream_file = call_upstream(
+            'docs', 'GET',
             f"{docs_service_url}/docs/file/{doc_id}",
             headers=get_forwarded_headers(request),
             stream=True
         )
 
-        if file_response.status_code != 200:
-            return jsonify({'error': 'File not found'}), file_response.status_code
+        if upstream_file.status_code not in FILE_OK_STATUSES:
+            return jsonify({'error': 'File not found'}), upstream_file.status_code
 
-        return Response(
-            file_response.content,
-            status=file_response.status_code,
-            headers={
-                'Content-Type': file_response.headers.get('Content-Type', 'application/octet-stream'),
-                'Content-Disposition': file_response.headers.get('Content-Disposition', ''),
-                'Access-Control-Allow-Origin': 'http://localhost:3000',
-                'Access-Control-Allow-Credentials': 'true'
-            }
-        )
+        return file_response(upstream_file)
 
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in get_shared_file: {str(e)}")
+        logger.error('Error in get_shared_file: %s', e)
         return jsonify({'error': 'Service unavailable'}), 503
 
 @app.route('/share/file/<doc_id>/thumbnail', methods=['GET', 'OPTIONS'])
@@ -918,7 +1240,8 @@ def get_shared_file_thumbnail(doc_id):
 
         # First check if user has access to this shared file
         share_service_url = SERVICES['share']
-        access_check = requests.get(
+        access_check = call_upstream(
+            'share', 'GET',
             f"{share_service_url}/share/check-access/{doc_id}",
             headers=get_forwarded_headers(request),
             params={'user_id': user_id}
@@ -929,7 +1252,8 @@ def get_shared_file_thumbnail(doc_id):
 
         # If access is granted, get the thumbnail from docs service
         docs_service_url = SERVICES['docs']
-        thumbnail_response = requests.get(
+        thumbnail_response = call_upstream(
+            'docs', 'GET',
             f"{docs_service_url}/docs/file/{doc_id}/thumbnail",
             headers=get_forwarded_headers(request),
             stream=True
@@ -946,7 +1270,7 @@ def get_shared_file_thumbnail(doc_id):
         )
 
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in get_shared_file_thumbnail: {str(e)}")
+        logger.error('Error in get_shared_file_thumbnail: %s', e)
         return jsonify({'error': 'Service unavailable'}), 503
 
 # Add new routes for share preview and content
@@ -955,7 +1279,7 @@ def get_shared_content(doc_id):
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', FILE_REQUEST_HEADERS)
         response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
@@ -968,29 +1292,22 @@ def get_shared_content(doc_id):
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/preview/{doc_id}/content"
         
-        print(f"Gateway: Forwarding content request to: {target_url}")
+        logger.debug('Forwarding content request to: %s', target_url)
         
-        response = requests.get(
+        response = call_upstream(
+            'share', 'GET',
             target_url,
             headers=get_forwarded_headers(request),
             stream=True
         )
         
-        if response.status_code != 200:
+        if response.status_code not in FILE_OK_STATUSES:
             return make_response(response.content, response.status_code)
 
-        return Response(
-            response.content,
-            status=200,
-            headers={
-                'Content-Type': response.headers.get('Content-Type', 'application/octet-stream'),
-                'Access-Control-Allow-Origin': 'http://localhost:3000',
-                'Access-Control-Allow-Credentials': 'true'
-            }
-        )
+        return file_response(response)
 
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_shared_content: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 @app.route('/share/preview/<path:doc_id>/thumbnail', methods=['GET', 'OPTIONS'])
@@ -1022,9 +1339,10 @@ def get_shared_thumbnail(doc_id):
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/preview/{doc_id}/thumbnail"
         
-        print(f"Gateway: Forwarding thumbnail request to: {target_url}")
+        logger.debug('Forwarding thumbnail request to: %s', target_url)
         
-        response = requests.get(
+        response = call_upstream(
+            'share', 'GET',
             target_url,
             headers=get_forwarded_headers(request)
         )
@@ -1053,7 +1371,7 @@ def get_shared_thumbnail(doc_id):
         return gateway_response
 
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_shared_thumbnail: %s', e)
         # Return placeholder for any error
         transparent_pixel = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
         return Response(
@@ -1082,7 +1400,8 @@ def rename_document(doc_id):
         service_url = SERVICES['docs']
         target_url = f"{service_url}/docs/file/{doc_id}/rename"
         
-        response = requests.put(
+        response = call_upstream(
+            'docs', 'PUT',
             target_url,
             headers=get_forwarded_headers(request),
             json=request.get_json()
@@ -1099,7 +1418,7 @@ def rename_document(doc_id):
         )
         
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error in rename_document: {str(e)}")
+        logger.error('Error in rename_document: %s', e)
         return jsonify({'error': 'Document service unavailable'}), 503
 
 @app.route('/share/content/<int:share_id>', methods=['GET', 'OPTIONS'])
@@ -1107,7 +1426,7 @@ def get_share_content(share_id):
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', FILE_REQUEST_HEADERS)
         response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
@@ -1116,31 +1435,22 @@ def get_share_content(share_id):
         service_url = SERVICES['share']
         target_url = f"{service_url}/share/preview/{share_id}/content"
         
-        print(f"Gateway: Forwarding GET request to: {target_url}")
+        logger.debug('Forwarding GET request to: %s', target_url)
         
-        response = requests.get(
+        response = call_upstream(
+            'share', 'GET',
             target_url,
             headers=get_forwarded_headers(request),
             stream=True  # Important for file downloads
         )
         
-        if response.status_code != 200:
+        if response.status_code not in FILE_OK_STATUSES:
             return make_response(response.content, response.status_code)
 
-        gateway_response = Response(
-            response.content,
-            status=200,
-            headers={
-                'Content-Type': response.headers.get('Content-Type', 'application/octet-stream'),
-                'Access-Control-Allow-Origin': 'http://localhost:3000',
-                'Access-Control-Allow-Credentials': 'true'
-            }
-        )
-        
-        return gateway_response
+        return file_response(response)
 
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_share_content: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 @app.route('/docs/file/<int:doc_id>/metadata', methods=['GET', 'OPTIONS'])
@@ -1160,20 +1470,27 @@ def get_file_metadata(doc_id):
 
         # Try to get metadata from docs service first
         docs_url = f"{SERVICES['docs']}/docs/file/{doc_id}/metadata"
-        docs_response = requests.get(
+        docs_response = call_upstream(
+            'docs', 'GET',
             docs_url,
             headers=get_forwarded_headers(request)
         )
 
-        # If not found in docs, try shared files
+        # If not found in docs, try shared files; the docs 404 stands when
+        # the share service is unavailable
         if docs_response.status_code == 404:
             share_url = f"{SERVICES['share']}/share/file/{doc_id}/metadata"
-            share_response = requests.get(
-                share_url,
-                headers=get_forwarded_headers(request)
-            )
-            
-            if share_response.status_code == 200:
+            try:
+                share_response = call_upstream(
+                    'share', 'GET',
+                    share_url,
+                    headers=get_forwarded_headers(request)
+                )
+            except requests.exceptions.RequestException as e:
+                logger.warning('Shared metadata unavailable: %s', e)
+                share_response = None
+
+            if share_response is not None and share_response.status_code == 200:
                 return Response(
                     share_response.content,
                     status=200,
@@ -1196,7 +1513,7 @@ def get_file_metadata(doc_id):
         )
 
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_file_metadata: %s', e)
         return jsonify({'error': 'Service unavailable'}), 503
 
 @app.route('/share/file/metadata', methods=['GET', 'OPTIONS'])
@@ -1232,7 +1549,8 @@ def get_all_shared_metadata():
             
             # Forward to share service
             share_url = f"{SERVICES['share']}/share/file/metadata"
-            response = requests.get(
+            response = call_upstream(
+                'share', 'GET',
                 share_url,
                 headers=headers
             )
@@ -1248,12 +1566,12 @@ def get_all_shared_metadata():
             )
             
         except jwt.InvalidTokenError as e:
-            print(f"Token validation error: {str(e)}")
+            logger.error('Token validation error: %s', e)
             return jsonify({'error': 'Invalid token'}), 401
             
     except requests.exceptions.RequestException as e:
-        print(f"Gateway error: {str(e)}")
+        logger.error('Error in get_all_shared_metadata: %s', e)
         return jsonify({'error': 'Share service unavailable'}), 503
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=5000)
\ No newline at end of file
+    app.run(host='127.0.0.1', port=int(os.getenv('GATEWAY_PORT', 5000)))
\ No newline at end of file
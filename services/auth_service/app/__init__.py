@@ -1,8 +1,22 @@
+import os
+import sys
 from flask import Flask
 from .extensions import db
 from .config import Config
 
+# The repository root, for the shared common/ package
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from common.health import health_blueprint, database_check
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.logs import setup_logging
+from common.profiling import init_profiling
+
 def create_app():
+    setup_logging('auth')
     app = Flask(__name__)
     
     # Configure your app
@@ -12,8 +26,11 @@ def create_app():
     db.init_app(app)
     
     # Register blueprints - move these imports here to avoid circular imports
-    from .routes import main_bp, auth_bp
-    app.register_blueprint(main_bp)
+    from .routes import auth_bp
+    app.register_blueprint(health_blueprint('auth', checks=[database_check()]))
+    init_metrics(app)
+    init_tracing(app, 'auth')
+    init_profiling(app, 'auth')
     app.register_blueprint(auth_bp, url_prefix='/auth')
 
     # Create database tables
@@ -7,7 +7,9 @@ import os
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.exc import IntegrityError
 from functools import wraps
-import traceback
+import logging
+
+logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -18,37 +20,30 @@ def jwt_required():
             token = None
             auth_header = request.headers.get('Authorization')
             
-            print("Debug - Auth header:", auth_header)
-            
             if auth_header and auth_header.startswith('Bearer '):
                 token = auth_header.split(' ')[1]
-                print("Debug - Token found:", token[:20] + "...")
             
             if not token:
-                print("Debug - No token found")
+                logger.debug('No token found')
                 return jsonify({'error': 'Token is missing'}), 401
             
             try:
-                # Log the secret key being used (first few chars only)
                 secret_key = os.getenv('SECRET_KEY')
-                print("Debug - Secret key starts with:", secret_key[:10] if secret_key else None)
                 
                 # Try to decode the token
                 payload = jwt.decode(token, secret_key, algorithms=['HS256'])
-                print("Debug - Token successfully decoded")
-                print("Debug - Token payload:", payload)
+                logger.debug('Token successfully decoded')
                 
                 current_user_id = payload.get('user_id')
                 if not current_user_id:
-                    print("Debug - No user_id in token payload")
+                    logger.debug('No user_id in token payload')
                     return jsonify({'error': 'Invalid token structure'}), 401
                     
             except jwt.ExpiredSignatureError:
-                print("Debug - Token expired")
+                logger.debug('Token expired')
                 return jsonify({'error': 'Token has expired'}), 401
             except jwt.InvalidTokenError as e:
-                print("Debug - Invalid token:", str(e))
-                print("Debug - Token structure:", token.split('.') if token else None)
+                logger.debug('Invalid token: %s', e)
                 return jsonify({'error': f'Invalid token: {str(e)}'}), 401
                 
             return f(*args, current_user_id=current_user_id, **kwargs)
@@ -177,7 +172,7 @@ def get_user(current_user_id, user_id):
         }), 200
         
     except Exception as e:
-        print(f"Error fetching user: {str(e)}")
+        logger.error('Error fetching user: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @auth_bp.route('/users/by-email/<email>', methods=['GET'])
@@ -196,7 +191,7 @@ def get_user_by_email(current_user_id, email):
         }), 200
         
     except Exception as e:
-        print(f"Error fetching user by email: {str(e)}")
+        logger.error('Error fetching user by email: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @auth_bp.route('/user/by-email', methods=['POST'])
@@ -216,7 +211,7 @@ def get_user_id_from_email():
         }), 200
         
     except Exception as e:
-        print(f"Error in get_user_id_from_email: {str(e)}")
+        logger.error('Error in get_user_id_from_email: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @auth_bp.route('/user/by-id', methods=['POST'])
@@ -236,7 +231,7 @@ def get_user_by_id():
         }), 200
         
     except Exception as e:
-        print(f"Error in get_user_by_id: {str(e)}")
+        logger.error('Error in get_user_by_id: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @auth_bp.route('/users/lookup', methods=['GET'])
@@ -244,22 +239,21 @@ def get_user_by_id():
 def lookup_user(current_user_id):
     try:
         # Log request details
-        print("Debug - Headers:", dict(request.headers))
-        print(f"Debug - Current user ID: {current_user_id}")
+        logger.debug('Current user ID: %s', current_user_id)
         
         email = request.args.get('email')
         if not email:
-            print("Debug - No email provided")
+            logger.debug('No email provided')
             return jsonify({'error': 'Email parameter is required'}), 400
             
-        print(f"Debug - Looking up email: {email}")
+        logger.debug('Looking up email: %s', email)
             
         user = User.query.filter_by(email=email).first()
         if not user:
-            print(f"Debug - No user found for email: {email}")
+            logger.debug('No user found for email: %s', email)
             return jsonify({'error': 'User not found'}), 404
             
-        print(f"Debug - Found user: {user.user_id}")
+        logger.debug('Found user: %s', user.user_id)
         return jsonify({
             'user_id': user.user_id,
             'email': user.email,
@@ -268,6 +262,5 @@ def lookup_user(current_user_id):
         }), 200
         
     except Exception as e:
-        print(f"Debug - Lookup error: {str(e)}")
-        print("Debug - Full traceback:", traceback.format_exc())
+        logger.exception('Lookup error: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
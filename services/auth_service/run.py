@@ -1,6 +1,7 @@
+import os
 from app import create_app
 
 app = create_app()
 
 if __name__ == '__main__':
-     app.run(host='127.0.0.1', port=3001)
\ No newline at end of file
+     app.run(host='127.0.0.1', port=int(os.getenv('AUTH_SERVICE_PORT', 3001)))
\ No newline at end of file
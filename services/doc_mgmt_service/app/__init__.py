@@ -1,14 +1,27 @@
+import os
+import sys
+
+# The repository root, for the shared common/ package
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
 from flask import Flask
 from .extensions import db
 from .routes.documents import docs_bp
 from .config import Config
-import os
 from dotenv import load_dotenv
+from common.health import health_blueprint, database_check, disk_check
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.logs import setup_logging
+from common.profiling import init_profiling
 
 # Load environment variables
 load_dotenv()
 
 def create_app():
+    setup_logging('docs')
     app = Flask(__name__)
     
     # Initialize configuration (this will also init SQLAlchemy)
@@ -17,5 +30,12 @@ def create_app():
     # Register blueprints and other app setup
     from .routes.documents import docs_bp
     app.register_blueprint(docs_bp)
+    app.register_blueprint(health_blueprint('docs', checks=[
+        database_check(),
+        disk_check(app.config['UPLOAD_FOLDER'])
+    ]))
+    init_metrics(app)
+    init_tracing(app, 'docs')
+    init_profiling(app, 'docs')
     
     return app
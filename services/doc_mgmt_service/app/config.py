@@ -4,12 +4,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-print(f"DB_URL: {os.getenv('DB_URL')}")
-print(f"SECRET_KEY: {os.getenv('SECRET_KEY')}")
 print(f"UPLOAD_FOLDER from env: {os.getenv('UPLOAD_FOLDER')}")
 
 class Config:
@@ -21,6 +17,14 @@ class Config:
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'DocStorageDocuments'))
     print(f"Configured UPLOAD_FOLDER: {UPLOAD_FOLDER}")
     print(f"UPLOAD_FOLDER absolute path: {os.path.abspath(UPLOAD_FOLDER)}")
+
+    # Signed download URLs (verified without a database lookup)
+    SIGNED_URL_SECRET = os.getenv('SIGNED_URL_SECRET', SECRET_KEY)
+    SIGNED_URL_TTL = int(os.getenv('SIGNED_URL_TTL', 300))
+
+    # File serving: 'python', 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+    FILE_SERVING_MODE = os.getenv('FILE_SERVING_MODE', 'python')
+    X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '/_protected/documents')
     
     @classmethod
     def init_app(cls, app):
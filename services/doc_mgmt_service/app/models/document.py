@@ -12,6 +12,7 @@ class Document(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     user_id = db.Column(db.Integer, nullable=False)
     description = db.Column(db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the stored file
     upload_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     last_modified = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
@@ -25,6 +26,7 @@ class Document(db.Model):
             'file_path': self.file_path,
             'user_id': self.user_id,
             'description': self.description,
+            'content_hash': self.content_hash,
             'upload_date': self.upload_date.isoformat(),
             'last_modified': self.last_modified.isoformat()
         }
@@ -1,21 +1,29 @@
 from flask import Blueprint, request, jsonify, send_file, current_app, make_response
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import os
-import magic
+import hashlib
 import jwt
 from datetime import datetime
+from sqlalchemy import insert
 from ..models.document import Document
 from ..extensions import db
+from common.signing import (
+    sign_download, verify_download, parse_byte_range, InvalidSignature, SignatureExpired
+)
+from common.file_serving import send_stored_file, send_signed_file
+from ..utils.zip_stream import stream_zip
+from common.extraction import get_mime_detector, extract_content_text
 from flask_cors import cross_origin
 from pdf2image import convert_from_path
-from docx import Document as DocxDocument
 from wand.image import Image as WandImage
 import io
 from PIL import Image
-import traceback
 from io import BytesIO
 import logging
 import requests
+from common.metrics import job_duration
+from common.tracing import span, outgoing_headers, CLIENT
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +32,13 @@ docs_bp = Blueprint('documents', __name__)
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))), 'DocStorageDocuments')
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+EXPORT_CHUNK_SIZE = 1024 * 1024  # 1MB read size per file when exporting
 
 def get_user_id_from_token():
     try:
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            print("Debug - No Bearer token found")
+            logger.debug('No Bearer token found')
             return None
             
         token = auth_header.split(' ')[1]
@@ -44,19 +53,18 @@ def get_user_id_from_token():
                 options={"verify_sub": False}  # Don't verify the 'sub' claim
             )
             user_id = payload.get('user_id')
-            print(f"Debug - Token payload: {payload}")
-            print(f"Debug - Extracted user_id: {user_id}")
+            logger.debug('Extracted user_id: %s', user_id)
             return user_id
             
         except jwt.ExpiredSignatureError:
-            print("Debug - Token has expired")
+            logger.debug('Token has expired')
             return None
         except jwt.InvalidTokenError as e:
-            print(f"Debug - Invalid token: {str(e)}")
+            logger.debug('Invalid token: %s', e)
             return None
             
     except Exception as e:
-        print(f"Debug - Token processing error: {str(e)}")
+        logger.error('Token processing error: %s', e)
         return None
 
 def allowed_file(filename):
@@ -65,6 +73,34 @@ def allowed_file(filename):
     """
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def compute_content_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 hex digest of a stored file.
+    """
+    sha256 = hashlib.sha256()
+    with span('file.hash'), open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def send_document(file_path, document, as_attachment=False):
+    """
+    Send a stored document with Range and conditional GET support, through
+    Python or the front web server depending on FILE_SERVING_MODE.
+    The strong ETag comes from the stored content hash (documents uploaded
+    before hashing fall back to Werkzeug's weak file ETag) and Last-Modified
+    from the document record.
+    """
+    return send_stored_file(
+        file_path,
+        current_app.config['UPLOAD_FOLDER'],
+        mimetype=document.file_type,
+        as_attachment=as_attachment,
+        download_name=document.original_filename,
+        etag=document.content_hash or True,
+        last_modified=document.last_modified
+    )
+
 def generate_pdf_thumbnail(pdf_path):
     """
     Generate a thumbnail for a PDF file.
@@ -79,10 +115,7 @@ def generate_pdf_thumbnail(pdf_path):
             img_byte_arr.seek(0)
             return img_byte_arr.getvalue()
     except Exception as e:
-        print(f"PDF Thumbnail Error - File: {pdf_path}")
-        print(f"Error Type: {type(e).__name__}")
-        print(f"Error Message: {str(e)}")
-        print(f"Stack Trace:", traceback.format_exc())
+        logger.exception('PDF thumbnail failed for %s: %s', pdf_path, e)
     return None
 
 def generate_docx_thumbnail(docx_path):
@@ -101,14 +134,14 @@ def generate_docx_thumbnail(docx_path):
         
         # Convert in the temp directory
         conversion_command = f'soffice --headless --convert-to pdf "{temp_docx}" --outdir "{temp_dir}"'
-        print(f"Running conversion command: {conversion_command}")
+        logger.debug('Running conversion command: %s', conversion_command)
         
         result = os.system(conversion_command)
-        print(f"LibreOffice conversion result: {result}")
+        logger.debug('LibreOffice conversion result: %s', result)
         
         temp_pdf = os.path.join(temp_dir, 'temp.pdf')
         if os.path.exists(temp_pdf):
-            print(f"PDF created successfully at: {temp_pdf}")
+            logger.debug('PDF created successfully at: %s', temp_pdf)
             # Use the PDF thumbnail generation method
             thumbnail = generate_pdf_thumbnail(temp_pdf)
             # Clean up temporary files
@@ -117,16 +150,16 @@ def generate_docx_thumbnail(docx_path):
             if thumbnail:
                 return thumbnail
             
-        print("LibreOffice conversion failed or PDF not created")
+        logger.error('LibreOffice conversion failed or PDF not created')
 
         # Fallback: Try direct DOCX conversion with ImageMagick
-        print("Attempting ImageMagick conversion...")
+        logger.debug('Attempting ImageMagick conversion...')
         with WandImage() as img:
             # Copy to temp location for ImageMagick as well
             img.read(filename=temp_docx, format='docx')
             img.format = 'jpeg'
             img.compression_quality = 80
-            print("Successfully converted DOCX to image")
+            logger.debug('Successfully converted DOCX to image')
             
             # Clean up
             os.remove(temp_docx)
@@ -138,23 +171,19 @@ def generate_docx_thumbnail(docx_path):
             return img.make_blob()
 
     except Exception as e:
-        print(f"DOCX Thumbnail Error - File: {docx_path}")
-        print(f"Error Type: {type(e).__name__}")
-        print(f"Error Message: {str(e)}")
-        print(f"Stack Trace:", traceback.format_exc())
+        logger.exception('DOCX thumbnail failed for %s: %s', docx_path, e)
         
-        # Additional debugging information
-        try:
-            print("Checking file existence:", os.path.exists(docx_path))
-            print("File size:", os.path.getsize(docx_path))
-            print("File permissions:", oct(os.stat(docx_path).st_mode)[-3:])
-            print("LibreOffice version:", os.popen('soffice --version').read())
-            print("ImageMagick version:", os.popen('convert -version').read())
-            print("Temp directory exists:", os.path.exists(temp_dir))
-            if os.path.exists(temp_dir):
-                print("Temp directory contents:", os.listdir(temp_dir))
-        except Exception as debug_e:
-            print("Debug info error:", str(debug_e))
+        # Additional debugging information; this shells out, so only when asked for
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                logger.debug('File size: %s', os.path.getsize(docx_path))
+                logger.debug('File permissions: %s', oct(os.stat(docx_path).st_mode)[-3:])
+                logger.debug('LibreOffice version: %s', os.popen('soffice --version').read())
+                logger.debug('ImageMagick version: %s', os.popen('convert -version').read())
+                if os.path.exists(temp_dir):
+                    logger.debug('Temp directory contents: %s', os.listdir(temp_dir))
+            except Exception as debug_e:
+                logger.debug('Debug info error: %s', debug_e)
         
         # Clean up temp files in case of error
         try:
@@ -189,131 +218,155 @@ def upload_document():
 
     uploaded_documents = []
     errors = []
+    # Per-file outcome in request order, for clients that upload many files at once
+    results = [{'filename': file.filename, 'success': False} for file in files]
+
+    user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user_id))
+    os.makedirs(user_folder, exist_ok=True)
+    description = request.form.get('description', '')
+    mime = get_mime_detector()
 
-    for file in files:
+    # Stage every file on disk first, then insert all rows in one statement
+    staged = []
+    for position, file in enumerate(files):
         if not allowed_file(file.filename):
             errors.append(f"{file.filename}: File type not allowed")
+            results[position]['error'] = 'File type not allowed'
             continue
 
+        file_path = None
         try:
             filename = secure_filename(file.filename)
-            user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user_id))
-            os.makedirs(user_folder, exist_ok=True)
-            
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             unique_filename = f"{timestamp}_{filename}"
+            # Files with the same name in one batch share a timestamp
+            counter = 1
+            while os.path.exists(os.path.join(user_folder, unique_filename)):
+                counter += 1
+                unique_filename = f"{timestamp}_{counter}_{filename}"
             file_path = os.path.join(user_folder, unique_filename)
-            
+
             # Save the file
-            file.save(file_path)
-            
-            # Get file type and size
-            mime = magic.Magic(mime=True)
-            file_type = mime.from_file(file_path)
-            file_size = os.path.getsize(file_path)
-            
-            # Store relative path
-            relative_path = os.path.join(str(user_id), unique_filename)
-            
-            # Create document record
-            document = Document(
-                filename=unique_filename,
-                original_filename=filename,
-                file_type=file_type,
-                file_size=file_size,
-                file_path=relative_path,
-                user_id=user_id,
-                description=request.form.get('description', ''),
-                upload_date=datetime.utcnow(),
-                last_modified=datetime.utcnow()
-            )
-            
-            db.session.add(document)
-            db.session.commit()
-            
-            # After successful upload, index the document through the API gateway
-            try:
-                # Extract searchable content based on file type
-                content_text = ''
-                
-                # Include filename in searchable content
-                content_text = f"{document.original_filename} "
-                
-                if document.file_type.startswith('text/'):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content_text += f.read()
-                elif document.file_type == 'application/pdf':
-                    import pdfplumber
-                    with pdfplumber.open(file_path) as pdf:
-                        content_text += ' '.join(page.extract_text() or '' for page in pdf.pages)
-                elif document.file_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-                    doc = DocxDocument(file_path)
-                    content_text += ' '.join(paragraph.text for paragraph in doc.paragraphs)
-                elif document.file_type.startswith('image/'):
-                    # For images, include filename and any description
-                    content_text += f"{document.description} image"
-                
-                print(f"Extracted content: {content_text[:100]}...")  # Debug log
-                
-                index_payload = {
-                    'doc_id': document.doc_id,
-                    'content_text': content_text,
-                    'doc_metadata': {
-                        'filename': document.filename,
-                        'original_filename': document.original_filename,
-                        'upload_date': document.upload_date.isoformat(),
-                        'file_type': document.file_type,
-                        'description': document.description,
-                        'user_id': document.user_id,
-                        'last_modified': document.last_modified.isoformat() if document.last_modified else None
-                    }
-                }
-                print(f"Sending index request with payload: {index_payload}")  # Debug log
-                
-                index_response = requests.post(
-                    'http://127.0.0.1:5000/search/index',
-                    json=index_payload,
-                    headers={
-                        'Authorization': request.headers.get('Authorization'),
-                        'Content-Type': 'application/json'
-                    }
-                )
-                
-                print(f"Index response status: {index_response.status_code}")  # Debug log
-                print(f"Index response text: {index_response.text}")  # Debug log
-                
-                if not index_response.ok:
-                    print(f"Warning: Failed to index document {document.doc_id}: {index_response.text}")
-            except Exception as index_error:
-                print(f"Error indexing document {document.doc_id}: {str(index_error)}")
-                # Don't fail the upload if indexing fails
-            
-            uploaded_documents.append({
-                'id': document.doc_id,
-                'filename': document.original_filename,
-                'file_type': document.file_type,
-                'upload_date': document.upload_date.isoformat(),
-                'success': True
-            })
-            
+            with span('file.write', path=unique_filename):
+                file.save(file_path)
+
+            now = datetime.utcnow()
+            staged.append((position, file_path, {
+                'filename': unique_filename,
+                'original_filename': filename,
+                'file_type': mime.from_file(file_path),
+                'file_size': os.path.getsize(file_path),
+                # Store relative path
+                'file_path': os.path.join(str(user_id), unique_filename),
+                'user_id': user_id,
+                'description': description,
+                'content_hash': compute_content_hash(file_path),
+                'upload_date': now,
+                'last_modified': now
+            }))
         except Exception as e:
-            print(f"Error uploading {file.filename}: {str(e)}")
+            logger.error('Error staging %s: %s', file.filename, e)
             errors.append(f"{file.filename}: Upload failed")
-            # Rollback the session for this file
-            db.session.rollback()
+            results[position]['error'] = 'Upload failed'
             # Try to clean up the file if it was saved
-            if os.path.exists(file_path):
+            if file_path and os.path.exists(file_path):
                 try:
                     os.remove(file_path)
-                except:
+                except OSError:
                     pass
 
+    doc_ids = []
+    if staged:
+        try:
+            # One multi-row INSERT ... RETURNING and one commit for the batch
+            doc_ids = db.session.scalars(
+                insert(Document).returning(Document.doc_id, sort_by_parameter_order=True),
+                [row for _, _, row in staged]
+            ).all()
+            db.session.commit()
+            logger.debug('Inserted %s documents in one batch', len(doc_ids))
+        except Exception as e:
+            logger.exception('Error inserting upload batch: %s', e)
+            db.session.rollback()
+            doc_ids = []
+            for position, file_path, _ in staged:
+                errors.append(f"{files[position].filename}: Upload failed")
+                results[position]['error'] = 'Upload failed'
+                if os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+
+    # Hand the whole batch to the search service in one request
+    index_payloads = []
+    for (_, file_path, row), doc_id in zip(staged, doc_ids):
+        try:
+            with job_duration.time(('extraction',)), span('extraction', file_type=row['file_type']):
+                content_text = extract_content_text(
+                    file_path, row['file_type'], row['original_filename'], row['description']
+                )
+        except Exception as extract_error:
+            logger.error('Error extracting content from document %s: %s', doc_id, extract_error)
+            content_text = f"{row['original_filename']} "
+        index_payloads.append({
+            'doc_id': doc_id,
+            'content_text': content_text,
+            'doc_metadata': {
+                'filename': row['filename'],
+                'original_filename': row['original_filename'],
+                'upload_date': row['upload_date'].isoformat(),
+                'file_type': row['file_type'],
+                'description': row['description'],
+                'user_id': row['user_id'],
+                'last_modified': row['last_modified'].isoformat()
+            }
+        })
+
+    index_status = {}
+    if index_payloads:
+        try:
+            with span('POST /search/index/bulk', kind=CLIENT, documents=len(index_payloads)):
+                index_response = requests.post(
+                    'http://127.0.0.1:5000/search/index/bulk',
+                    json={'documents': index_payloads},
+                    headers=outgoing_headers({
+                        'Authorization': request.headers.get('Authorization'),
+                        'Content-Type': 'application/json'
+                    }),
+                    timeout=60
+                )
+            logger.debug('Bulk index response status: %s', index_response.status_code)
+
+            if index_response.ok:
+                index_status = {
+                    item['doc_id']: item.get('status') != 'error'
+                    for item in index_response.json().get('results', [])
+                }
+            else:
+                logger.warning('Failed to index upload batch: search service returned %s', index_response.status_code)
+        except Exception as index_error:
+            logger.error('Error indexing upload batch: %s', index_error)
+            # Don't fail the upload if indexing fails
+
+    for (position, _, row), doc_id in zip(staged, doc_ids):
+        uploaded = {
+            'id': doc_id,
+            'filename': row['original_filename'],
+            'file_type': row['file_type'],
+            'upload_date': row['upload_date'].isoformat(),
+            'success': True
+        }
+        uploaded_documents.append(uploaded)
+        results[position].update(uploaded, indexed=index_status.get(doc_id, False))
+
     # Determine response based on results
     if not uploaded_documents and errors:
         # All files failed
         return jsonify({
             'error': 'All uploads failed',
             'errors': errors,
+            'results': results,
             'success': False
         }), 400
     elif errors:
@@ -322,6 +375,7 @@ def upload_document():
             'message': 'Some files uploaded successfully',
             'files': uploaded_documents,
             'errors': errors,
+            'results': results,
             'success': True
         }), 201
     else:
@@ -329,6 +383,7 @@ def upload_document():
         return jsonify({
             'message': 'All files uploaded successfully',
             'files': uploaded_documents,
+            'results': results,
             'success': True
         }), 201
 
@@ -345,8 +400,8 @@ def download_document(doc_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
 
-    file_path = os.path.join(UPLOAD_FOLDER, str(user_id), document.filename)
-    return send_file(file_path, as_attachment=True, download_name=document.original_filename)
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user_id), document.filename)
+    return send_document(file_path, document, as_attachment=True)
 
 @docs_bp.route('/docs/documents/<int:doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
@@ -371,7 +426,7 @@ def delete_document(doc_id):
         
         return jsonify({'message': 'Document deleted successfully'}), 200
     except Exception as e:
-        print(f"Error deleting document: {str(e)}")  # Add logging
+        logger.error('Error deleting document: %s', e)
         db.session.rollback()  # Add rollback on error
         return jsonify({'error': str(e)}), 500
 
@@ -413,7 +468,8 @@ def get_file_thumbnail(doc_id):
             # Generate thumbnail for image files
             if document.file_type.startswith('image/'):
                 try:
-                    with Image.open(file_path) as img:
+                    with job_duration.time(('thumbnail',)), span('thumbnail', file_type=document.file_type), \
+                            Image.open(file_path) as img:
                         # Increased height in target size
                         target_size = (200, 300)  # Changed from (200, 200)
                         
@@ -454,19 +510,18 @@ def get_file_thumbnail(doc_id):
                             as_attachment=False
                         )
                 except Exception as e:
-                    print(f"Thumbnail generation error: {str(e)}")
+                    logger.error('Thumbnail generation error: %s', e)
                     return jsonify({'error': 'Error generating thumbnail'}), 500
 
             # For non-image files, return a default icon or error
             return jsonify({'error': 'Not an image file'}), 400
 
         except jwt.InvalidTokenError as e:
-            print(f"Token decode error: {str(e)}")
+            logger.error('Token decode error: %s', e)
             return jsonify({'error': 'Invalid token'}), 401
 
     except Exception as e:
-        print(f"Error in get_file_thumbnail: {str(e)}")
-        print("Traceback:", traceback.format_exc())
+        logger.exception('Error in get_file_thumbnail: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @docs_bp.route('/docs/documents/<int:doc_id>', methods=['PATCH', 'OPTIONS'])
@@ -482,22 +537,22 @@ def update_document(doc_id):
         response.headers['Access-Control-Allow-Methods'] = 'PATCH'
         return response
         
-    print(f"Received PATCH request for document {doc_id}")  # Debug log
+    logger.debug('Received PATCH request for document %s', doc_id)
     user_id = get_user_id_from_token()
-    print(f"User ID from token: {user_id}")  # Debug log
+    logger.debug('User ID from token: %s', user_id)
     
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
 
     document = Document.query.filter_by(doc_id=doc_id, user_id=user_id).first()
-    print(f"Found document: {document}")  # Debug log
+    logger.debug('Found document: %s', document)
     
     if not document:
         return jsonify({'error': 'Document not found'}), 404
 
     try:
         data = request.get_json()
-        print(f"Received data: {data}")  # Debug log
+        logger.debug('Received data: %s', data)
         new_filename = data.get('filename')
         
         if not new_filename:
@@ -508,8 +563,8 @@ def update_document(doc_id):
         new_filename_with_timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secure_filename(new_filename)}"
         new_file_path = os.path.join(UPLOAD_FOLDER, str(user_id), new_filename_with_timestamp)
 
-        print(f"Old path: {old_file_path}")  # Debug log
-        print(f"New path: {new_file_path}")  # Debug log
+        logger.debug('Old path: %s', old_file_path)
+        logger.debug('New path: %s', new_file_path)
 
         if os.path.exists(old_file_path):
             os.rename(old_file_path, new_file_path)
@@ -528,7 +583,7 @@ def update_document(doc_id):
             return jsonify({'error': 'File not found in storage'}), 404
 
     except Exception as e:
-        print(f"Error during rename: {str(e)}")  # Debug log
+        logger.error('Error during rename: %s', e)
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
@@ -569,37 +624,32 @@ def get_recent_files():
             return jsonify({'files': files_data}), 200
 
         except jwt.InvalidTokenError as e:
-            print(f"Token decode error: {str(e)}")
+            logger.error('Token decode error: %s', e)
             return jsonify({'error': 'Invalid token'}), 401
 
     except Exception as e:
-        print(f"Error in get_recent_files: {str(e)}")
-        print("Traceback:", traceback.format_exc())
+        logger.exception('Error in get_recent_files: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @docs_bp.route('/docs/file/<int:doc_id>', methods=['GET'])
 def get_file_content(doc_id):
     try:
-        # Get user_id from token and add debug logging
         user_id = get_user_id_from_token()
-        print(f"Debug - Token user_id: {user_id}")
-        print(f"Debug - Requested doc_id: {doc_id}")
+        logger.debug('User %s requested content of document %s', user_id, doc_id)
         
         if not user_id:
             return jsonify({'error': 'Unauthorized'}), 401
 
         try:
-            # Get document and verify ownership with debug logging
+            # Get document and verify ownership
             document = Document.query.filter_by(doc_id=doc_id, user_id=user_id).first()
-            print(f"Debug - Document found: {document}")
-            print(f"Debug - Document details: {document.__dict__ if document else None}")
             
             if not document:
                 return jsonify({'error': 'File not found'}), 404
 
             # Get absolute path of UPLOAD_FOLDER
             upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
-            print(f"Debug - Upload folder: {upload_folder}")
+            logger.debug('Upload folder: %s', upload_folder)
 
             # Construct file path
             file_path = os.path.join(
@@ -607,31 +657,155 @@ def get_file_content(doc_id):
                 str(user_id),
                 document.filename
             )
-            print(f"Debug - Constructed file path: {file_path}")
+            logger.debug('Constructed file path: %s', file_path)
             
             if not os.path.exists(file_path):
-                print(f"Debug - File does not exist at path: {file_path}")
+                logger.debug('File does not exist at path: %s', file_path)
                 return jsonify({'error': 'File not found on disk'}), 404
 
-            print(f"Debug - File exists and attempting to send")
-            return send_file(
-                file_path,
-                as_attachment=False,
-                download_name=document.original_filename
-            )
+            logger.debug('File exists and attempting to send')
+            return send_document(file_path, document)
 
         except AttributeError as e:
-            print(f"Debug - Document attribute error: {str(e)}")
+            logger.error('Document attribute error: %s', e)
             return jsonify({'error': 'Invalid document data'}), 500
         except OSError as e:
-            print(f"Debug - File system error: {str(e)}")
+            logger.error('File system error: %s', e)
             return jsonify({'error': 'File system error'}), 500
 
     except Exception as e:
-        print(f"Debug - Unexpected error: {str(e)}")
-        print("Debug - Full traceback:", traceback.format_exc())
+        logger.exception('Unexpected error: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
+@docs_bp.route('/docs/file/<int:doc_id>/signed-url', methods=['GET'])
+def get_signed_url(doc_id):
+    """
+    Mint a short-lived signed URL for downloading or previewing a file.
+    """
+    user_id = get_user_id_from_token()
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    document = Document.query.filter_by(doc_id=doc_id, user_id=user_id).first()
+    if not document:
+        return jsonify({'error': 'Document not found'}), 404
+
+    byte_range = None
+    if request.args.get('range'):
+        try:
+            byte_range = parse_byte_range(request.args['range'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    max_ttl = current_app.config['SIGNED_URL_TTL']
+    ttl = min(request.args.get('ttl', max_ttl, type=int), max_ttl)
+
+    token, expires = sign_download(
+        current_app.config['SIGNED_URL_SECRET'],
+        'docs',
+        doc_id=document.doc_id,
+        path=os.path.join(str(document.user_id), document.filename),
+        ttl=ttl,
+        byte_range=byte_range,
+        filename=document.original_filename,
+        mimetype=document.file_type,
+        attachment=request.args.get('disposition') == 'attachment'
+    )
+
+    return jsonify({
+        'url': f"/docs/signed/{token}",
+        'expires_at': datetime.utcfromtimestamp(expires).isoformat()
+    }), 200
+
+@docs_bp.route('/docs/signed/<token>', methods=['GET'])
+def get_signed_file(token):
+    """
+    Serve a file from a signed URL. The token itself is the authorization,
+    so no database lookup is needed.
+    """
+    try:
+        claims = verify_download(current_app.config['SIGNED_URL_SECRET'], 'docs', token)
+    except SignatureExpired:
+        return jsonify({'error': 'Link has expired'}), 410
+    except InvalidSignature:
+        return jsonify({'error': 'Invalid signature'}), 403
+
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    file_path = safe_join(upload_folder, claims['path'])
+    if not file_path or not os.path.exists(file_path):
+        return jsonify({'error': 'File not found on disk'}), 404
+
+    return send_signed_file(file_path, claims, upload_folder)
+
+@docs_bp.route('/docs/export', methods=['GET', 'POST'])
+def export_documents():
+    """
+    Stream a ZIP archive of several documents for the user.
+
+    Takes doc_ids as a JSON list (POST) or a comma-separated query parameter
+    (GET), or "all" for every document the user owns.
+    """
+    user_id = get_user_id_from_token()
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    if request.method == 'POST':
+        doc_ids = (request.get_json(silent=True) or {}).get('doc_ids')
+    else:
+        doc_ids = request.args.get('doc_ids')
+        if doc_ids and doc_ids != 'all':
+            doc_ids = doc_ids.split(',')
+
+    try:
+        query = Document.query.filter(Document.user_id == user_id)
+        if doc_ids != 'all':
+            if not doc_ids or not isinstance(doc_ids, list):
+                return jsonify({'error': 'doc_ids must be a list of ids or "all"'}), 400
+            try:
+                requested = {int(doc_id) for doc_id in doc_ids}
+            except (TypeError, ValueError):
+                return jsonify({'error': 'doc_ids must be integers'}), 400
+
+            # One query for the whole set; anything missing is not the user's
+            query = query.filter(Document.doc_id.in_(requested))
+            documents = query.order_by(Document.doc_id).all()
+            not_found = requested - {doc.doc_id for doc in documents}
+            if not_found:
+                return jsonify({
+                    'error': 'Documents not found',
+                    'doc_ids': sorted(not_found)
+                }), 404
+        else:
+            documents = query.order_by(Document.doc_id).all()
+            if not documents:
+                return jsonify({'error': 'No documents to export'}), 404
+
+        # Plain values only, the generator runs after the session is gone
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        entries = [{
+            'path': os.path.join(upload_folder, str(user_id), doc.filename),
+            'name': doc.original_filename,
+            'mimetype': doc.file_type,
+            'modified': doc.last_modified or doc.upload_date
+        } for doc in documents]
+    except Exception as e:
+        logger.exception('Error in export_documents: %s', e)
+        return jsonify({'error': 'Internal server error'}), 500
+
+    logger.debug('Exporting %s documents for user %s', len(entries), user_id)
+    response = current_app.response_class(
+        stream_zip(entries, chunk_size=EXPORT_CHUNK_SIZE),
+        mimetype='application/zip',
+        direct_passthrough=True
+    )
+    response.headers.set(
+        'Content-Disposition',
+        'attachment',
+        filename=f"DocStorage_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
+    )
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @docs_bp.route('/docs/documents', methods=['GET'])
 def get_all_documents():
     """
@@ -656,8 +830,7 @@ def get_all_documents():
         return jsonify(files_data), 200
 
     except Exception as e:
-        print(f"Error in get_all_documents: {str(e)}")
-        print("Traceback:", traceback.format_exc())
+        logger.exception('Error in get_all_documents: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @docs_bp.route('/docs/file/<int:doc_id>/metadata', methods=['GET'])
@@ -676,11 +849,12 @@ def get_file_metadata(doc_id):
             'original_filename': document.original_filename,
             'file_path': document.file_path,
             'file_type': document.file_type,
+            'content_hash': document.content_hash,
             'upload_date': document.upload_date.isoformat() if document.upload_date else None
         })
         
     except Exception as e:
-        print(f"Error retrieving document metadata: {str(e)}")
+        logger.error('Error retrieving document metadata: %s', e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @docs_bp.route('/docs/file/<int:doc_id>/rename', methods=['PUT', 'OPTIONS'])
@@ -708,8 +882,8 @@ def rename_file(doc_id):
         old_path = os.path.join(UPLOAD_FOLDER, doc.file_path)
         new_path = os.path.join(UPLOAD_FOLDER, new_file_path)
         
-        print(f"Debug - Old path: {old_path}")
-        print(f"Debug - New path: {new_path}")
+        logger.debug('Old path: %s', old_path)
+        logger.debug('New path: %s', new_path)
         
         # Ensure the directory exists
         os.makedirs(os.path.dirname(new_path), exist_ok=True)
@@ -718,7 +892,7 @@ def rename_file(doc_id):
         try:
             os.rename(old_path, new_path)
         except OSError as e:
-            print(f"File system error: {str(e)}")
+            logger.error('File system error: %s', e)
             return jsonify({'error': 'Failed to rename file on disk'}), 500
         
         # Update database
@@ -734,7 +908,7 @@ def rename_file(doc_id):
                 os.rename(new_path, old_path)
             except OSError:
                 pass  # If restoration fails, we can't do much
-            print(f"Database error: {str(e)}")
+            logger.error('Database error: %s', e)
             return jsonify({'error': 'Failed to update database'}), 500
         
         # Update search index
@@ -753,19 +927,20 @@ def rename_file(doc_id):
         }
         
         try:
-            index_response = requests.post(
-                'http://127.0.0.1:5000/search/index',
-                json=index_payload,
-                headers={
-                    'Authorization': request.headers.get('Authorization'),
-                    'Content-Type': 'application/json'
-                }
-            )
+            with span('POST /search/index', kind=CLIENT):
+                index_response = requests.post(
+                    'http://127.0.0.1:5000/search/index',
+                    json=index_payload,
+                    headers=outgoing_headers({
+                        'Authorization': request.headers.get('Authorization'),
+                        'Content-Type': 'application/json'
+                    })
+                )
             
             if not index_response.ok:
-                print(f"Warning: Failed to update search index for document {doc.doc_id}")
+                logger.warning('Failed to update search index for document %s', doc.doc_id)
         except Exception as index_error:
-            print(f"Error updating search index: {str(index_error)}")
+            logger.error('Error updating search index: %s', index_error)
             # Don't fail the rename if indexing fails
         
         return jsonify({
@@ -775,7 +950,6 @@ def rename_file(doc_id):
         })
         
     except Exception as e:
-        print(f"Error in rename_file: {str(e)}")
-        print("Traceback:", traceback.format_exc())
+        logger.exception('Error in rename_file: %s', e)
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
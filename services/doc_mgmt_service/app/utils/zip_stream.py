@@ -0,0 +1,139 @@
+"""
+Streaming ZIP archives.
+
+zipfile writes to an unseekable sink here, so each member gets a data
+descriptor instead of a back-patched local header and the archive can be
+sent to the client as it is built. Only one read chunk (plus whatever the
+compressor holds back) is in memory at a time.
+"""
+import os
+import re
+import zipfile
+
+# Types that are already compressed gain nothing from deflate
+STORED_TYPES = (
+    'application/pdf',
+    'application/zip',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'image/',
+    'video/',
+    'audio/'
+)
+
+
+class _ChunkSink:
+    """Write-only file object that collects what zipfile writes until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def compress_type_for(mimetype):
+    """
+    Pick ZIP_STORED for already-compressed types and ZIP_DEFLATED otherwise.
+    """
+    if mimetype and mimetype.startswith(STORED_TYPES):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def safe_arcname(name):
+    """
+    Reduce a user-supplied filename to a bare member name, so no directory,
+    ``..`` or drive part can make the archive extract outside its folder.
+    """
+    name = name.replace('\\', '/').rsplit('/', 1)[-1]
+    # "C:name" keeps a drive-relative path on Windows
+    name = re.sub(r'^[A-Za-z]:', '', name).strip()
+    if name in ('', '.', '..'):
+        return 'file'
+    return name
+
+
+def unique_arcname(name, used):
+    """
+    Return ``name`` made safe, or "name (2).ext", "name (3).ext", ... if it
+    is already in ``used``.
+    """
+    name = safe_arcname(name)
+    candidate = name
+    base, ext = os.path.splitext(name)
+    counter = 2
+    while candidate.lower() in used:
+        candidate = f"{base} ({counter}){ext}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def stream_zip(entries, chunk_size=1024 * 1024):
+    """
+    Yield a ZIP archive of ``entries`` piece by piece.
+
+    Each entry is a dict with ``path`` (file on disk), ``name`` (name inside
+    the archive) and optional ``mimetype`` and ``modified`` (datetime).
+    Entries whose file is missing are skipped and listed in an
+    EXPORT_ERRORS.txt member at the end, since the response status has
+    already been sent by then.
+    """
+    sink = _ChunkSink()
+    used_names = set()
+    missing = []
+
+    with zipfile.ZipFile(sink, mode='w', allowZip64=True) as archive:
+        for entry in entries:
+            path = entry['path']
+            if not os.path.isfile(path):
+                missing.append(entry['name'])
+                continue
+
+            info = zipfile.ZipInfo(unique_arcname(entry['name'], used_names))
+            if entry.get('modified') is not None and entry['modified'].year >= 1980:
+                info.date_time = entry['modified'].timetuple()[:6]
+            info.compress_type = compress_type_for(entry.get('mimetype'))
+            info.external_attr = 0o644 << 16
+            # Lets zipfile decide on Zip64 up front, the stream cannot be rewound
+            info.file_size = os.path.getsize(path)
+
+            with open(path, 'rb') as source, archive.open(info, mode='w') as member:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            data = sink.drain()
+            if data:
+                yield data
+
+        if missing:
+            archive.writestr(
+                unique_arcname('EXPORT_ERRORS.txt', used_names),
+                'The following files could not be found and were not exported:\n'
+                + ''.join(f"{name}\n" for name in missing)
+            )
+
+    # Central directory
+    data = sink.drain()
+    if data:
+        yield data
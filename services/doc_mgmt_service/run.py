@@ -1,3 +1,4 @@
+import os
 from dotenv import load_dotenv
 load_dotenv()
 from app import create_app
@@ -5,4 +6,4 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=3002, debug=True)
+    app.run(host='127.0.0.1', port=int(os.getenv('DOC_SERVICE_PORT', 3002)), debug=True)
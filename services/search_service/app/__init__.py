@@ -2,6 +2,19 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 import os
+import sys
+import tempfile
+
+# The repository root, for the shared common/ package
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from common.health import health_blueprint, database_check, disk_check
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.logs import setup_logging
+from common.profiling import init_profiling
 
 # Load environment variables
 load_dotenv()
@@ -9,6 +22,7 @@ load_dotenv()
 db = SQLAlchemy()
 
 def create_app():
+    setup_logging('search')
     app = Flask(__name__)
 
     # Load config from .env file
@@ -34,12 +48,84 @@ def create_app():
         'share_db': share_db
     }
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Stored files, for re-extracting content when reindexing (same default as the docs service)
+    app.config['DOCUMENT_STORAGE_PATH'] = os.getenv(
+        'UPLOAD_FOLDER',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'DocStorageDocuments')
+    )
+    app.config['REINDEX_BATCH_SIZE'] = int(os.getenv('REINDEX_BATCH_SIZE', 200))
+    # Extraction processes; 0 extracts in the reindex thread itself
+    app.config['REINDEX_WORKERS'] = int(os.getenv('REINDEX_WORKERS', os.cpu_count() or 1))
+    # Seconds between incremental index syncs run inside the service; 0 disables
+    app.config['INDEX_SYNC_INTERVAL'] = int(os.getenv('INDEX_SYNC_INTERVAL', 0))
+    # postgres (full-text search in SEARCH_DB_URL) or inverted (embedded index files)
+    app.config['SEARCH_BACKEND'] = os.getenv('SEARCH_BACKEND', 'postgres')
+    app.config['INVERTED_INDEX_PATH'] = os.getenv(
+        'INVERTED_INDEX_PATH',
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), 'inverted_index')
+    )
+    app.config['INVERTED_INDEX_MERGE_FACTOR'] = int(os.getenv('INVERTED_INDEX_MERGE_FACTOR', 8))
+    # Relevance tuning for the postgres backend (see search_query.py)
+    app.config['SEARCH_RANKING'] = {
+        'weight_filename': float(os.getenv('SEARCH_WEIGHT_FILENAME', 1.0)),
+        'weight_description': float(os.getenv('SEARCH_WEIGHT_DESCRIPTION', 0.4)),
+        'weight_content': float(os.getenv('SEARCH_WEIGHT_CONTENT', 0.2)),
+        'filename_boost': float(os.getenv('SEARCH_FILENAME_BOOST', 1.0)),
+        'recency_weight': float(os.getenv('SEARCH_RECENCY_WEIGHT', 0.2)),
+        'recency_half_life_days': float(os.getenv('SEARCH_RECENCY_HALF_LIFE_DAYS', 180))
+    }
+    # Documents with more extracted text than this are stored in chunks (see chunks.py)
+    app.config['SEARCH_CHUNK_THRESHOLD'] = int(os.getenv('SEARCH_CHUNK_THRESHOLD', 100000))
+    app.config['SEARCH_CHUNK_SIZE'] = int(os.getenv('SEARCH_CHUNK_SIZE', 20000))
+    # Typo tolerance for the postgres backend (see fuzzy.py)
+    app.config['SEARCH_FUZZY'] = {
+        'enabled': os.getenv('SEARCH_FUZZY', 'true').lower() == 'true',
+        'threshold': float(os.getenv('SEARCH_FUZZY_THRESHOLD', 0.3)),
+        'max_edits': int(os.getenv('SEARCH_FUZZY_MAX_EDITS', 2)),
+        'expansions': int(os.getenv('SEARCH_FUZZY_EXPANSIONS', 3)),
+        'penalty': float(os.getenv('SEARCH_FUZZY_PENALTY', 0.5))
+    }
+    # "More like this" TF-IDF matrix (needs numpy and scipy); rebuilt from
+    # documentindex when missing, so it lives outside the source tree
+    app.config['SIMILARITY_INDEX_PATH'] = os.getenv(
+        'SIMILARITY_INDEX_PATH',
+        os.path.join(tempfile.gettempdir(), 'docstorage-similarity-index')
+    )
+    app.config['SIMILARITY_REFRESH_SECONDS'] = int(os.getenv('SIMILARITY_REFRESH_SECONDS', 30))
+    # Per-process search result cache; a TTL of 0 disables it
+    app.config['SEARCH_CACHE_TTL'] = int(os.getenv('SEARCH_CACHE_TTL', 60))
+    app.config['SEARCH_CACHE_MAX_ENTRIES'] = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 5000))
+    app.config['SEARCH_CACHE_MAX_BYTES'] = int(os.getenv('SEARCH_CACHE_MAX_BYTES', 64 * 1024 * 1024))
     
     # Initialize extensions
     db.init_app(app)
 
+    from .cache import init_cache
+    init_cache(app)
+    from .backends import init_backend
+    init_backend(app)
+
     # Register blueprints
     from .routes.search import search_bp
     app.register_blueprint(search_bp)
+    # Covers the doc_db and share_db binds as well
+    app.register_blueprint(health_blueprint('search', checks=[
+        database_check(),
+        disk_check(app.config['DOCUMENT_STORAGE_PATH'])
+    ]))
+    init_metrics(app)
+    init_tracing(app, 'search')
+    init_profiling(app, 'search')
+
+    if app.config['INDEX_SYNC_INTERVAL'] > 0:
+        from .sync import start_scheduler
+
+        # Started by the first request each worker serves, so it never runs
+        # in a preloading gunicorn master or in the CLI scripts that build
+        # the app
+        @app.before_request
+        def start_index_sync():
+            start_scheduler(app, app.config['INDEX_SYNC_INTERVAL'])
 
     return app 
\ No newline at end of file
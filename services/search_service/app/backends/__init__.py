@@ -0,0 +1,40 @@
+"""
+Search backends behind /index, /search and /delete.
+
+- postgres (default): documentindex with a tsvector column, searched with
+  websearch_to_tsquery and ts_rank_cd
+- inverted: an embedded, on-disk inverted index with BM25 scoring, for
+  small deployments, tests and benchmarks
+
+Both take the same documents and return search results in the same shape,
+so routes don't care which one is configured (SEARCH_BACKEND).
+"""
+import logging
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('postgres', 'inverted')
+
+
+def init_backend(app):
+    name = app.config['SEARCH_BACKEND']
+    if name == 'postgres':
+        from .postgres import PostgresBackend
+        backend = PostgresBackend()
+    elif name == 'inverted':
+        from .inverted import InvertedBackend
+        backend = InvertedBackend(
+            app.config['INVERTED_INDEX_PATH'],
+            merge_factor=app.config['INVERTED_INDEX_MERGE_FACTOR']
+        )
+    else:
+        raise ValueError(f"SEARCH_BACKEND must be one of {', '.join(BACKENDS)}")
+    app.extensions['search_backend'] = backend
+    logger.info('Search backend: %s', name)
+    return backend
+
+
+def get_backend():
+    return current_app.extensions['search_backend']
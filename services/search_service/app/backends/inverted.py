@@ -0,0 +1,62 @@
+"""
+Embedded inverted index backend (see utils/inverted_index.py).
+
+The index files live in INVERTED_INDEX_PATH and belong to one process (a
+second one fails with IndexLocked), so this backend is for single-worker
+deployments.
+"""
+from ..events import index_changed
+from ..indexing import dedupe_documents
+from ..utils.inverted_index import InvertedIndex
+from ..utils.metadata import promoted_columns
+
+
+class InvertedBackend:
+    name = 'inverted'
+
+    def __init__(self, path, merge_factor=8):
+        self.index_store = InvertedIndex(path, merge_factor=merge_factor)
+
+    def index(self, documents):
+        """
+        Same statuses as indexing.upsert_documents: inserted, updated,
+        superseded or error.
+        """
+        results, latest = dedupe_documents(documents)
+        for _, row in latest.values():
+            row.update(promoted_columns(row['doc_metadata']))
+
+        if latest:
+            statuses = self.index_store.add_documents([row for _, row in latest.values()])
+            index_changed(
+                (row['owner_id'] for _, row in latest.values()),
+                doc_ids=list(latest)
+            )
+            for doc_id, (position, _) in latest.items():
+                results[position] = {'doc_id': doc_id, 'status': statuses[doc_id]}
+        return results
+
+    def delete(self, doc_id):
+        removed = self.index_store.delete_documents([doc_id])
+        if doc_id not in removed:
+            return False
+        owner_id = removed[doc_id]
+        index_changed([owner_id] if owner_id is not None else None, doc_ids=[doc_id])
+        return True
+
+    def search(self, query, user_id, shared_ids, page, per_page, filters):
+        return self.index_store.search(
+            query,
+            user_id=int(user_id),
+            shared_ids=shared_ids,
+            page=page,
+            per_page=per_page,
+            families=filters['families'],
+            file_types=filters['file_types'],
+            date_from=filters['date_from'],
+            date_to=filters['date_to'],
+            scope=filters['scope']
+        )
+
+    def stats(self):
+        return {'backend': self.name, **self.index_store.stats()}
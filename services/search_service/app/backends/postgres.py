@@ -0,0 +1,90 @@
+"""
+Postgres full-text search over the documentindex table.
+"""
+from flask import current_app
+
+from .. import db, fuzzy
+from ..events import index_changed
+from ..indexing import upsert_documents
+from ..models.document_chunk import DocumentChunk
+from ..models.document_index import DocumentIndex
+from ..reindex import record_deletions
+from ..search_query import build_search
+from ..utils.highlight import parse_headline
+
+
+class PostgresBackend:
+    name = 'postgres'
+
+    def index(self, documents):
+        return upsert_documents(documents)
+
+    def delete(self, doc_id):
+        doc = DocumentIndex.query.filter_by(doc_id=doc_id).first()
+        if not doc:
+            return False
+        owner_id = doc.owner_id or (doc.doc_metadata or {}).get('user_id')
+        db.session.delete(doc)
+        record_deletions([doc_id])
+        db.session.commit()
+        index_changed([owner_id] if owner_id is not None else None, doc_ids=[doc_id])
+        return True
+
+    def corrections(self, query):
+        """
+        Fuzzy options for build_search(), or None when fuzzy matching is
+        off or nothing in the query is worth correcting.
+        """
+        config = current_app.config['SEARCH_FUZZY']
+        words = fuzzy.fuzzy_words(query) if config['enabled'] else []
+        if not words:
+            return None
+        fuzzy.set_thresholds(config['threshold'])
+        return {
+            'words': words,
+            'expansions': fuzzy.expand_words(words, config['max_edits'], config['expansions']),
+            'penalty': config['penalty']
+        }
+
+    def search(self, query, user_id, shared_ids, page, per_page, filters):
+        options = self.corrections(query)
+        # Ranked, filtered, paginated matches with snippets for this page
+        # only, and facet counts over all matches, in one statement
+        statement, params = build_search(
+            query, user_id, shared_ids, page=page, per_page=per_page, filters=filters,
+            ranking=current_app.config['SEARCH_RANKING'], fuzzy=options
+        )
+        rows = db.session.execute(statement, params).fetchall()
+
+        results = []
+        for row in rows:
+            if row.doc_id is None:
+                continue
+            snippet, highlights = parse_headline(row.headline)
+            results.append({
+                'doc_id': row.doc_id,
+                'doc_metadata': row.doc_metadata or {},
+                'filename_match': row.filename_match,
+                'page': row.matched_page,
+                'matched_chunks': row.matched_chunks,
+                'rank': float(row.rank),
+                'snippet': snippet,
+                'highlights': highlights
+            })
+        return {
+            'total': int(rows[0].total),
+            'facets': {
+                'file_type': rows[0].family_counts or {},
+                'upload_month': rows[0].month_counts or {}
+            },
+            'corrections': options['expansions'] if options else {},
+            'results': results
+        }
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'documents': db.session.query(DocumentIndex).count(),
+            'chunked_documents': db.session.query(DocumentIndex).filter(DocumentIndex.chunk_count > 0).count(),
+            'chunks': db.session.query(DocumentChunk).count()
+        }
@@ -0,0 +1,55 @@
+"""
+Cached /search responses.
+
+Each user's serialized responses live in a bounded QueryCache keyed by
+(user_id, normalized query, filters, page, per_page). Index writes, deletes
+and share changes invalidate only the users they affect: the owner of each
+changed document plus everyone it is shared with. The TTL bounds staleness
+for changes made by other worker processes, which this process never hears
+about.
+"""
+from common.metrics import Counter, Gauge
+
+from .events import on_index_changed
+from .utils.query_cache import QueryCache
+
+query_cache = QueryCache()
+
+Counter('search_cache_hits_total', 'Search responses served from the cache.', callback=lambda: query_cache.hits)
+Counter('search_cache_misses_total', 'Search cache lookups that missed.', callback=lambda: query_cache.misses)
+Counter('search_cache_evictions_total', 'Search cache entries evicted for space.', callback=lambda: query_cache.evictions)
+Gauge('search_cache_hit_ratio', 'Share of search cache lookups that hit.',
+      callback=lambda: query_cache.stats()['hit_ratio'], multiprocess_mode='mean')
+Gauge('search_cache_entries', 'Responses in the search cache.', callback=lambda: query_cache.stats()['entries'])
+Gauge('search_cache_bytes', 'Approximate size of the search cache.', callback=lambda: query_cache.stats()['bytes'])
+
+
+def init_cache(app):
+    query_cache.ttl = app.config['SEARCH_CACHE_TTL']
+    query_cache.max_entries = app.config['SEARCH_CACHE_MAX_ENTRIES']
+    query_cache.max_bytes = app.config['SEARCH_CACHE_MAX_BYTES']
+
+
+@on_index_changed
+def _invalidate(user_ids):
+    if user_ids is None:
+        query_cache.clear()
+    else:
+        query_cache.invalidate_users(user_ids)
+
+
+def search_cache_key(user_id, query, filters, page, per_page):
+    """
+    Queries differing only in case or whitespace share an entry.
+    """
+    return (
+        int(user_id),
+        ' '.join(query.lower().split()),
+        tuple(sorted(filters['families'])),
+        tuple(sorted(filters['file_types'])),
+        filters['date_from'],
+        filters['date_to'],
+        filters['scope'],
+        page,
+        per_page
+    )
@@ -0,0 +1,57 @@
+"""
+Chunked storage for long documents.
+
+A document whose extracted text is longer than SEARCH_CHUNK_THRESHOLD
+characters keeps an empty content_text in documentindex (and a chunk_count);
+its text goes to documentindex_chunks instead, one row per page or per
+SEARCH_CHUNK_SIZE characters, each with its own search_vector. Every
+tsvector then stays far below Postgres' 1MB limit, and /search ranks and
+highlights a long document by its best matching chunk rather than
+re-reading the whole text.
+"""
+from flask import current_app
+from sqlalchemy import text
+
+from . import db
+from .utils.chunking import chunk_text
+
+CHUNKS_TABLE = 'documentindex_chunks'
+
+
+def split_rows(rows):
+    """
+    Move the text of long documents out of documentindex ``rows``. Returns
+    the rows to upsert and the chunk rows for them.
+    """
+    threshold = current_app.config['SEARCH_CHUNK_THRESHOLD']
+    chunk_size = current_app.config['SEARCH_CHUNK_SIZE']
+    split = []
+    chunks = []
+    for row in rows:
+        content = row['content_text'] or ''
+        if len(content) <= threshold:
+            split.append({**row, 'chunk_count': 0})
+            continue
+        pieces = chunk_text(content, chunk_size)
+        chunks.extend(
+            {'doc_id': row['doc_id'], 'chunk_no': chunk_no, 'page': page, 'content': piece}
+            for chunk_no, (page, piece) in enumerate(pieces)
+        )
+        split.append({**row, 'content_text': '', 'chunk_count': len(pieces)})
+    return split, chunks
+
+
+def replace_chunks(doc_ids, chunks, table=CHUNKS_TABLE):
+    """
+    Replace the stored chunks of ``doc_ids`` with ``chunks``. Runs in the
+    caller's transaction, after the documentindex rows are written.
+    """
+    if not doc_ids:
+        return
+    db.session.execute(text(f"DELETE FROM {table} WHERE doc_id = ANY(:doc_ids)"), {'doc_ids': list(doc_ids)})
+    if chunks:
+        db.session.execute(
+            text(f"INSERT INTO {table} (doc_id, chunk_no, page, content) VALUES (:doc_id, :chunk_no, :page, :content)"),
+            chunks
+        )
+
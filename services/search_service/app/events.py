@@ -0,0 +1,46 @@
+"""
+Index change notifications inside the search service.
+
+Writers call index_changed() after committing; in-process caches register
+a listener to drop what the change made stale. ``user_ids`` names the
+affected users, or is None when the change cannot be attributed (reindex,
+bulk deletions) and everything should be dropped. Passing ``doc_ids`` as
+well adds every user those documents are actively shared with, since
+their search results include them too.
+
+Listeners only see changes made by this process, so per-process caches
+also need a TTL when the service runs with several workers.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+_listeners = []
+
+
+def on_index_changed(listener):
+    """
+    Register ``listener(user_ids)``. Usable as a decorator.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def index_changed(user_ids=None, doc_ids=None):
+    if user_ids is not None:
+        user_ids = {int(user_id) for user_id in user_ids if user_id is not None}
+        if doc_ids:
+            from .shares import get_share_recipients
+            try:
+                user_ids |= get_share_recipients(doc_ids)
+            except Exception as e:
+                # Recipients can't be resolved; drop everything rather than serve stale results
+                logger.error('Share recipient lookup failed: %s', e)
+                user_ids = None
+        if user_ids is not None and not user_ids:
+            return
+    for listener in _listeners:
+        try:
+            listener(user_ids)
+        except Exception as e:
+            logger.error('Index change listener failed: %s', e)
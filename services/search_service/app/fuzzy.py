@@ -0,0 +1,136 @@
+"""
+Typo tolerance for /search.
+
+search_terms is a dictionary of the lexemes in the search_vectors of
+documentindex and documentindex_chunks, with a trigram index on the term. A
+misspelled query word is expanded to the dictionary terms that are
+trigram-similar to it (the % operator, so the lookup uses the index) and
+within a few edits, and those terms are ORed into the query. Filenames are
+matched the same way with word_similarity against a trigram index on the
+normalized filename.
+
+New lexemes are added as documents are indexed; rebuild_terms() recomputes
+the dictionary (dropping terms of deleted documents) from ts_stat.
+"""
+import logging
+import re
+
+from sqlalchemy import text
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+MIN_WORD_LENGTH = 4
+# Dictionary terms worth keeping: alphabetic and not too short to be typos of
+TERM_FILTER = "length({column}) >= 3 AND {column} ~ '^[[:alpha:]]+$'"
+
+ADD_TERMS_QUERY = text(f"""
+    INSERT INTO search_terms (term, ndoc)
+    SELECT u.lexeme, COUNT(*)
+    FROM (
+        SELECT search_vector FROM documentindex WHERE doc_id = ANY(:doc_ids)
+        UNION ALL
+        SELECT search_vector FROM documentindex_chunks WHERE doc_id = ANY(:doc_ids)
+    ) v, unnest(v.search_vector) AS u(lexeme, positions, weights)
+    WHERE {TERM_FILTER.format(column='u.lexeme')}
+    GROUP BY u.lexeme
+    ON CONFLICT (term) DO NOTHING
+""")
+
+REBUILD_TERMS_QUERY = text(f"""
+    INSERT INTO search_terms (term, ndoc)
+    SELECT word, ndoc
+    FROM ts_stat('SELECT search_vector FROM documentindex
+                  UNION ALL SELECT search_vector FROM documentindex_chunks')
+    WHERE {TERM_FILTER.format(column='word')}
+""")
+
+# Words whose own stem is already a known term are left alone
+EXPANSIONS_QUERY = text("""
+    SELECT w.word, t.term
+    FROM unnest(CAST(:words AS text[])) AS w(word)
+    CROSS JOIN LATERAL (
+        SELECT term
+        FROM search_terms
+        WHERE term % w.word
+          AND levenshtein(term, w.word) <= :max_edits
+        ORDER BY similarity(term, w.word) DESC, ndoc DESC
+        LIMIT :per_word
+    ) t
+    WHERE ts_lexize('english_stem', w.word) <> '{}'
+      AND NOT EXISTS (
+          SELECT 1 FROM search_terms s
+          WHERE s.term = (ts_lexize('english_stem', w.word))[1]
+      )
+""")
+
+
+def add_terms(doc_ids):
+    """
+    Add the lexemes of the given (just written) documents to the dictionary.
+    Runs in the caller's transaction.
+    """
+    if doc_ids:
+        db.session.execute(ADD_TERMS_QUERY, {'doc_ids': list(doc_ids)})
+
+
+def rebuild_terms():
+    """
+    Recompute the dictionary from the whole index. Returns the term count.
+    """
+    db.session.execute(text("DELETE FROM search_terms"))
+    count = db.session.execute(REBUILD_TERMS_QUERY).rowcount
+    db.session.commit()
+    logger.info('Search terms rebuilt: %s terms', count)
+    return count
+
+
+def set_thresholds(threshold):
+    """
+    Similarity threshold for the % and <% operators, for this transaction.
+    """
+    db.session.execute(
+        text("""
+            SELECT set_config('pg_trgm.similarity_threshold', :threshold, true),
+                   set_config('pg_trgm.word_similarity_threshold', :threshold, true)
+        """),
+        {'threshold': str(threshold)}
+    )
+
+
+def fuzzy_words(query):
+    """
+    Words of a plain query worth correcting. Queries using search operators
+    (quotes, -exclusions, or) are matched exactly.
+    """
+    if '"' in query or re.search(r'(^|\s)-\S', query) or re.search(r'\bor\b', query, re.IGNORECASE):
+        return []
+    words = [word.lower() for word in re.findall(r'[^\W\d_]+', query)]
+    return [word for word in dict.fromkeys(words) if len(word) >= MIN_WORD_LENGTH]
+
+
+def expand_words(words, max_edits=2, per_word=3):
+    """
+    Map each misspelled word to up to ``per_word`` dictionary terms close
+    to it. Words that are spelled right or have no close terms are left out.
+    Call set_thresholds() first.
+    """
+    if not words:
+        return {}
+    rows = db.session.execute(EXPANSIONS_QUERY, {
+        'words': list(words),
+        'max_edits': max_edits,
+        'per_word': per_word
+    }).fetchall()
+    expansions = {}
+    for row in rows:
+        expansions.setdefault(row.word, []).append(row.term)
+    return expansions
+
+
+def tsquery_literal(terms):
+    """
+    to_tsquery('simple', ...) input ORing the given lexemes.
+    """
+    return ' | '.join("'" + term.replace("'", "''") + "'" for term in terms)
@@ -0,0 +1,207 @@
+"""
+Writing documents into the search index.
+
+Documents are upserted with INSERT ... ON CONFLICT (doc_id) DO UPDATE, one
+multi-row statement per batch, instead of a SELECT + INSERT/UPDATE per
+document as session.merge does.
+"""
+import logging
+import os
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from common.metrics import job_duration
+from common.tracing import span
+
+from . import db
+from .chunks import CHUNKS_TABLE, replace_chunks, split_rows
+from .events import index_changed
+from .fuzzy import add_terms
+from .models.document_index import DocumentIndex
+from .utils.extraction import extract_document
+from .utils.metadata import promoted_columns
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+
+
+def validate_document(item):
+    """
+    Turn one request item into a documentindex row, or raise ValueError.
+    """
+    if not isinstance(item, dict) or item.get('doc_id') is None:
+        raise ValueError('Missing doc_id')
+    try:
+        doc_id = int(item['doc_id'])
+    except (TypeError, ValueError):
+        raise ValueError('doc_id must be an integer')
+
+    content_text = item.get('content_text') or ''
+    doc_metadata = item.get('doc_metadata') or {}
+    if not isinstance(content_text, str):
+        raise ValueError('content_text must be a string')
+    if not isinstance(doc_metadata, dict):
+        raise ValueError('doc_metadata must be an object')
+
+    return {
+        'doc_id': doc_id,
+        # Postgres text cannot hold NUL bytes, which PDF extraction sometimes yields
+        'content_text': content_text.replace('\x00', ''),
+        'doc_metadata': doc_metadata
+    }
+
+
+def document_metadata(document):
+    """
+    The doc_metadata stored for a row of the documents table, in the same
+    shape the document service sends on upload.
+    """
+    return {
+        'filename': document.filename,
+        'original_filename': document.original_filename,
+        'upload_date': document.upload_date.isoformat() if document.upload_date else None,
+        'file_type': document.file_type,
+        'description': document.description,
+        'user_id': document.user_id,
+        'last_modified': document.last_modified.isoformat() if document.last_modified else None
+    }
+
+
+def extract_rows(documents, storage_path, pool=None, workers=1):
+    """
+    Re-extract content for rows of the documents table and return the
+    documentindex rows for them, plus the number that could not be read
+    (those are indexed by filename only). Extraction runs in ``pool`` when
+    one is given.
+    """
+    tasks = [(
+        document.doc_id,
+        os.path.join(storage_path, document.file_path or os.path.join(str(document.user_id), document.filename)),
+        document.file_type or '',
+        document.original_filename,
+        document.description
+    ) for document in documents]
+
+    # A whole batch, since extraction may run in other processes
+    with job_duration.time(('index_extraction_batch',)), span('index_extraction_batch', documents=len(tasks)):
+        if pool:
+            # Executor.map only submits; list() waits for the results inside the timing
+            extracted = list(pool.map(extract_document, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        else:
+            extracted = list(map(extract_document, tasks))
+
+    rows = []
+    failed = 0
+    for document, (doc_id, content_text, error) in zip(documents, extracted):
+        if error:
+            failed += 1
+            logger.warning('Could not extract document %s: %s', doc_id, error)
+        rows.append({
+            'doc_id': doc_id,
+            'content_text': content_text.replace('\x00', ''),
+            'doc_metadata': document_metadata(document)
+        })
+    return rows, failed
+
+
+def build_upsert(rows, table=None):
+    """
+    Build the multi-row upsert for ``rows`` into ``table`` (documentindex by
+    default), filling the promoted metadata columns from doc_metadata. Each
+    returned row has the doc_id and whether it was inserted (xmax = 0) or
+    updated.
+    """
+    table = DocumentIndex.__table__ if table is None else table
+    rows = [{'chunk_count': 0, **row, **promoted_columns(row['doc_metadata'])} for row in rows]
+    stmt = pg_insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.doc_id],
+        set_={
+            'content_text': stmt.excluded.content_text,
+            'doc_metadata': stmt.excluded.doc_metadata,
+            'owner_id': stmt.excluded.owner_id,
+            'file_type': stmt.excluded.file_type,
+            'file_family': stmt.excluded.file_family,
+            'upload_date': stmt.excluded.upload_date,
+            'chunk_count': stmt.excluded.chunk_count,
+            'last_indexed': func.now()
+        }
+    ).returning(table.c.doc_id, literal_column('(xmax = 0)').label('inserted'))
+
+
+def write_rows(rows, table=None, chunks_table=CHUNKS_TABLE):
+    """
+    Upsert ``rows`` into ``table`` (documentindex by default), storing the
+    text of long documents as chunks in ``chunks_table``. Returns the
+    upsert's (doc_id, inserted) rows.
+    """
+    rows, chunks = split_rows(rows)
+    returned = db.session.execute(build_upsert(rows, table=table)).fetchall()
+    replace_chunks([row['doc_id'] for row in rows], chunks, table=chunks_table)
+    return returned
+
+
+def dedupe_documents(documents):
+    """
+    Validate request items. Returns the per-item results list, filled in
+    for errors and superseded items (a later item in the same request has
+    the same doc_id), and {doc_id: (position, row)} for the rest.
+    """
+    results = [None] * len(documents)
+    latest = {}
+
+    for position, item in enumerate(documents):
+        try:
+            row = validate_document(item)
+        except ValueError as e:
+            doc_id = item.get('doc_id') if isinstance(item, dict) else None
+            results[position] = {'doc_id': doc_id, 'status': 'error', 'error': str(e)}
+            continue
+        # ON CONFLICT cannot touch the same row twice in one statement; last one wins
+        if row['doc_id'] in latest:
+            previous = latest[row['doc_id']][0]
+            results[previous] = {'doc_id': row['doc_id'], 'status': 'superseded'}
+        latest[row['doc_id']] = (position, row)
+
+    return results, latest
+
+
+def upsert_documents(documents, batch_size=BULK_BATCH_SIZE):
+    """
+    Upsert a list of request items into the index and return one status dict
+    per item, in order: inserted, updated, superseded or error.
+
+    Each batch is its own transaction, so a failing batch only marks its own
+    documents as errors.
+    """
+    results, latest = dedupe_documents(documents)
+
+    pending = sorted(latest.values(), key=lambda entry: entry[0])
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            returned = write_rows([row for _, row in batch])
+            add_terms([row['doc_id'] for _, row in batch])
+            db.session.commit()
+        except Exception as e:
+            logger.error('Bulk index batch failed: %s', e)
+            db.session.rollback()
+            for position, row in batch:
+                results[position] = {'doc_id': row['doc_id'], 'status': 'error', 'error': 'Batch failed'}
+            continue
+
+        index_changed(
+            (promoted_columns(row['doc_metadata'])['owner_id'] for _, row in batch),
+            doc_ids=[row['doc_id'] for _, row in batch]
+        )
+
+        inserted = {r.doc_id: r.inserted for r in returned}
+        for position, row in batch:
+            results[position] = {
+                'doc_id': row['doc_id'],
+                'status': 'inserted' if inserted.get(row['doc_id']) else 'updated'
+            }
+
+    return results
@@ -0,0 +1,30 @@
+from .. import db
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import text
+
+class DocumentChunk(db.Model):
+    __tablename__ = 'documentindex_chunks'
+
+    # Removed with their documentindex row
+    doc_id = db.Column(
+        db.Integer,
+        db.ForeignKey('documentindex.doc_id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    chunk_no = db.Column(db.Integer, primary_key=True)
+    # 1-based page for paged formats (PDF), else NULL
+    page = db.Column(db.Integer)
+    content = db.Column(db.Text, nullable=False)
+    search_vector = db.Column(
+        TSVECTOR,
+        # Same weight as content_text in documentindex.search_vector
+        server_default=text("setweight(to_tsvector('english', content), 'C')"),
+        nullable=False
+    )
+
+    __table_args__ = (
+        db.Index('idx_documentindex_chunks_search', 'search_vector', postgresql_using='gin'),
+    )
+
+    def __repr__(self):
+        return f'<DocumentChunk {self.doc_id}:{self.chunk_no}>'
@@ -10,17 +10,35 @@ class DocumentIndex(db.Model):
     content_text = db.Column(db.Text, server_default='')
     doc_metadata = db.Column(JSONB, server_default='{}')
     last_indexed = db.Column(db.DateTime, server_default=db.func.current_timestamp())
+    # Promoted from doc_metadata for filtering and facets (see utils/metadata.py)
+    owner_id = db.Column(db.Integer)
+    file_type = db.Column(db.String(100))
+    file_family = db.Column(db.String(20))
+    upload_date = db.Column(db.DateTime)
+    # Non-zero when content_text is stored in documentindex_chunks instead (see chunks.py)
+    chunk_count = db.Column(db.Integer, nullable=False, server_default='0')
     search_vector = db.Column(
         TSVECTOR,
+        # Weighted by field for ranking: filename A, description B, content C
         server_default=text("""
-            to_tsvector('english',
-                COALESCE(content_text, '') || ' ' ||
-                regexp_replace(COALESCE(doc_metadata->>'filename', ''), '[_.]', ' ', 'g') || ' ' ||
-                COALESCE(doc_metadata->>'description', '')
-            )
+            setweight(to_tsvector('english', regexp_replace(
+                COALESCE(doc_metadata->>'original_filename', doc_metadata->>'filename', ''), '[_.]', ' ', 'g')), 'A') ||
+            setweight(to_tsvector('english', COALESCE(doc_metadata->>'description', '')), 'B') ||
+            setweight(to_tsvector('english', COALESCE(content_text, '')), 'C')
         """),
         nullable=False
     )
 
+    __table_args__ = (
+        db.Index('idx_documentindex_owner_date', 'owner_id', 'upload_date'),
+        db.Index('idx_documentindex_family_date', 'file_family', 'upload_date'),
+        # Prefix lookups for /search/suggest
+        db.Index(
+            'idx_documentindex_filename_prefix',
+            'owner_id',
+            text("(replace(lower(doc_metadata->>'original_filename'), '_', ' ')) text_pattern_ops")
+        ),
+    )
+
     def __repr__(self):
         return f'<DocumentIndex {self.doc_id}>'
\ No newline at end of file
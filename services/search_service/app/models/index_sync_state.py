@@ -0,0 +1,22 @@
+from .. import db
+
+class IndexSyncState(db.Model):
+    __tablename__ = 'index_sync_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    # High-water mark: every document up to (last_modified, last_doc_id) is indexed
+    last_modified = db.Column(db.DateTime)
+    last_doc_id = db.Column(db.Integer, nullable=False, default=0)
+    last_run_at = db.Column(db.DateTime)
+    last_indexed_count = db.Column(db.Integer, nullable=False, default=0)
+    last_deleted_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'last_modified': self.last_modified.isoformat() if self.last_modified else None,
+            'last_doc_id': self.last_doc_id,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_indexed_count': self.last_indexed_count,
+            'last_deleted_count': self.last_deleted_count
+        }
@@ -0,0 +1,31 @@
+from .. import db
+
+class ReindexJob(db.Model):
+    __tablename__ = 'reindex_jobs'
+
+    job_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    # Checkpoint: every document up to this doc_id is in the shadow table
+    last_doc_id = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'failed': self.failed,
+            'last_doc_id': self.last_doc_id,
+            'progress': round(self.processed / self.total, 4) if self.total else (1.0 if self.status == 'completed' else 0.0),
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
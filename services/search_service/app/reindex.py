@@ -0,0 +1,312 @@
+"""
+Rebuilding the search index without taking search offline.
+
+A reindex streams the documents table (doc_db) through a server-side cursor
+in doc_id order, re-extracts file content in a process pool and upserts each
+batch into a shadow copy of documentindex (and of documentindex_chunks for
+long documents). The job's checkpoint in
+reindex_jobs is committed in the same transaction as each batch, so a
+crashed job resumes from the last doc_id it wrote. When the stream ends the
+shadow tables are swapped in with renames inside one transaction; searches
+keep hitting the old table until then. Documents removed from the index
+while a job is unfinished are recorded in reindex_deletions (see
+record_deletions()) and dropped from the shadow table in the swap, so the
+rebuild does not bring them back.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import MetaData, text
+
+from . import db
+from .events import index_changed
+from .fuzzy import rebuild_terms
+from .chunks import CHUNKS_TABLE
+from .indexing import extract_rows, write_rows
+from .models.document_index import DocumentIndex
+from .models.reindex_job import ReindexJob
+
+logger = logging.getLogger(__name__)
+
+LIVE_TABLE = 'documentindex'
+SHADOW_TABLE = 'documentindex_shadow'
+OLD_TABLE = 'documentindex_old'
+INDEX_ID_SEQUENCE = 'documentindex_index_id_seq'
+CHUNKS_SHADOW_TABLE = 'documentindex_chunks_shadow'
+CHUNKS_OLD_TABLE = 'documentindex_chunks_old'
+CHUNKS_FOREIGN_KEY = 'documentindex_chunks_doc_id_fkey'
+
+# A running job whose checkpoint has not moved for this long is treated as crashed
+STALE_AFTER = timedelta(minutes=10)
+
+DOCUMENTS_QUERY = text("""
+    SELECT doc_id, filename, original_filename, upload_date, file_type,
+           description, user_id, last_modified, file_path
+    FROM documents
+    WHERE doc_id > :last_doc_id
+    ORDER BY doc_id
+""")
+
+shadow_table = DocumentIndex.__table__.to_metadata(MetaData(), name=SHADOW_TABLE)
+
+# Only one reindex runs per process; other processes are kept out by the job row
+_run_lock = threading.Lock()
+
+
+class ReindexInProgress(Exception):
+    """Raised when a reindex is requested while another one is running."""
+
+
+def _db_now():
+    # Compared with last_indexed, which the database fills in, so use its clock
+    return db.session.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+
+
+def _shadow_exists():
+    return db.session.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL AND to_regclass(:chunks) IS NOT NULL"),
+        {'name': SHADOW_TABLE, 'chunks': CHUNKS_SHADOW_TABLE}
+    ).scalar()
+
+
+def latest_job():
+    return ReindexJob.query.order_by(ReindexJob.job_id.desc()).first()
+
+
+def start_job(resume=False):
+    """
+    Create a job and an empty shadow table, or with ``resume`` pick up the
+    last unfinished job where its checkpoint left off.
+    """
+    job = latest_job()
+    now = _db_now()
+
+    if job and job.status == 'running' and now - job.updated_at < STALE_AFTER:
+        raise ReindexInProgress(f"Reindex job {job.job_id} is already running")
+
+    if resume and job and job.status in ('running', 'failed') and _shadow_exists():
+        logger.info('Resuming reindex job %s after doc_id %s', job.job_id, job.last_doc_id)
+        job.status = 'running'
+        job.error = None
+        job.updated_at = now
+        db.session.commit()
+        return job
+
+    with db.engines['doc_db'].connect() as conn:
+        total = conn.execute(text("SELECT COUNT(*) FROM documents")).scalar()
+
+    # Deletions recorded for earlier jobs are of no use to a fresh rebuild
+    db.session.execute(text("DELETE FROM reindex_deletions"))
+    db.session.execute(text(f"DROP TABLE IF EXISTS {CHUNKS_SHADOW_TABLE}"))
+    db.session.execute(text(f"DROP TABLE IF EXISTS {SHADOW_TABLE}"))
+    db.session.execute(text(f"CREATE TABLE {SHADOW_TABLE} (LIKE {LIVE_TABLE} INCLUDING ALL)"))
+    db.session.execute(text(f"CREATE TABLE {CHUNKS_SHADOW_TABLE} (LIKE {CHUNKS_TABLE} INCLUDING ALL)"))
+    db.session.execute(text(f"""
+        ALTER TABLE {CHUNKS_SHADOW_TABLE} ADD CONSTRAINT {CHUNKS_FOREIGN_KEY}
+        FOREIGN KEY (doc_id) REFERENCES {SHADOW_TABLE} (doc_id) ON DELETE CASCADE
+    """))
+    job = ReindexJob(status='running', total=total, started_at=now, updated_at=now)
+    db.session.add(job)
+    db.session.commit()
+    logger.info('Started reindex job %s for %s documents', job.job_id, total)
+    return job
+
+
+def record_deletions(doc_ids):
+    """
+    Note ``doc_ids`` as removed from documentindex for an unfinished reindex
+    job, in the caller's transaction, so swap_in() drops them from the
+    shadow table too. Does nothing when no job is running or resumable.
+    """
+    if not doc_ids:
+        return
+    db.session.execute(text("""
+        INSERT INTO reindex_deletions (job_id, doc_id)
+        SELECT j.job_id, d.doc_id
+        FROM reindex_jobs j, unnest(CAST(:doc_ids AS INTEGER[])) AS d(doc_id)
+        WHERE j.status IN ('running', 'failed')
+        ON CONFLICT DO NOTHING
+    """), {'doc_ids': list(doc_ids)})
+
+
+def _index_definitions(table_name):
+    """
+    Map each index on ``table_name`` to its name, keyed by what it indexes
+    so the same index on the shadow table can be matched up.
+    """
+    rows = db.session.execute(text("""
+        SELECT c.relname AS name,
+               x.indisunique AS is_unique,
+               regexp_replace(pg_get_indexdef(c.oid), '^.* USING ', '') AS definition
+        FROM pg_index x
+        JOIN pg_class c ON c.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(:table_name)
+    """), {'table_name': table_name}).fetchall()
+    return {(row.is_unique, row.definition): row.name for row in rows}
+
+
+def _keep_index_names(live_indexes, shadow_table):
+    """
+    Rename the indexes of the swapped-in ``shadow_table`` to the names they
+    had on the live table.
+    """
+    for key, shadow_name in _index_definitions(shadow_table).items():
+        live_name = live_indexes.get(key)
+        if live_name and live_name != shadow_name:
+            db.session.execute(text(f'ALTER INDEX "{shadow_name}" RENAME TO "{live_name}"'))
+
+
+def swap_in(job):
+    """
+    Replace documentindex with the shadow table in one transaction.
+
+    Writes to documentindex are blocked first. Documents deleted since the
+    job started are dropped from the shadow table, and anything indexed
+    through /index since then is copied over so it is not lost (including
+    documents deleted and indexed again).
+    """
+    db.session.execute(text(f"LOCK TABLE {LIVE_TABLE}, {CHUNKS_TABLE} IN SHARE ROW EXCLUSIVE MODE"))
+    # Their chunks go with them (ON DELETE CASCADE)
+    dropped = db.session.execute(text(f"""
+        DELETE FROM {SHADOW_TABLE}
+        WHERE doc_id IN (SELECT doc_id FROM reindex_deletions WHERE job_id = :job_id)
+    """), {'job_id': job.job_id}).rowcount
+    db.session.execute(text("DELETE FROM reindex_deletions WHERE job_id = :job_id"), {'job_id': job.job_id})
+    caught_up = db.session.execute(text(f"""
+        INSERT INTO {SHADOW_TABLE} (doc_id, content_text, doc_metadata, owner_id,
+                                    file_type, file_family, upload_date, chunk_count, last_indexed)
+        SELECT doc_id, content_text, doc_metadata, owner_id,
+               file_type, file_family, upload_date, chunk_count, last_indexed
+        FROM {LIVE_TABLE}
+        WHERE last_indexed >= :started_at
+        ON CONFLICT (doc_id) DO UPDATE SET
+            content_text = EXCLUDED.content_text,
+            doc_metadata = EXCLUDED.doc_metadata,
+            owner_id = EXCLUDED.owner_id,
+            file_type = EXCLUDED.file_type,
+            file_family = EXCLUDED.file_family,
+            upload_date = EXCLUDED.upload_date,
+            chunk_count = EXCLUDED.chunk_count,
+            last_indexed = EXCLUDED.last_indexed
+    """), {'started_at': job.started_at}).rowcount
+    db.session.execute(text(f"""
+        DELETE FROM {CHUNKS_SHADOW_TABLE}
+        WHERE doc_id IN (SELECT doc_id FROM {LIVE_TABLE} WHERE last_indexed >= :started_at)
+    """), {'started_at': job.started_at})
+    db.session.execute(text(f"""
+        INSERT INTO {CHUNKS_SHADOW_TABLE} (doc_id, chunk_no, page, content)
+        SELECT c.doc_id, c.chunk_no, c.page, c.content
+        FROM {CHUNKS_TABLE} c
+        JOIN {LIVE_TABLE} di ON di.doc_id = c.doc_id
+        WHERE di.last_indexed >= :started_at
+    """), {'started_at': job.started_at})
+    logger.info('Dropped %s documents deleted and copied %s indexed during the rebuild', dropped, caught_up)
+
+    live_indexes = _index_definitions(LIVE_TABLE)
+    live_chunk_indexes = _index_definitions(CHUNKS_TABLE)
+
+    # The shadow table shares the index_id sequence; hand it over before the
+    # old table (which owns it) is dropped
+    db.session.execute(text(f"ALTER SEQUENCE {INDEX_ID_SEQUENCE} OWNED BY {SHADOW_TABLE}.index_id"))
+    db.session.execute(text(f"ALTER TABLE {LIVE_TABLE} RENAME TO {OLD_TABLE}"))
+    db.session.execute(text(f"ALTER TABLE {SHADOW_TABLE} RENAME TO {LIVE_TABLE}"))
+    db.session.execute(text(f"ALTER TABLE {CHUNKS_TABLE} RENAME TO {CHUNKS_OLD_TABLE}"))
+    db.session.execute(text(f"ALTER TABLE {CHUNKS_SHADOW_TABLE} RENAME TO {CHUNKS_TABLE}"))
+    # The old chunks reference the old table, so they go first
+    db.session.execute(text(f"DROP TABLE {CHUNKS_OLD_TABLE}"))
+    db.session.execute(text(f"DROP TABLE {OLD_TABLE}"))
+
+    # Keep the original index and constraint names
+    _keep_index_names(live_indexes, LIVE_TABLE)
+    _keep_index_names(live_chunk_indexes, CHUNKS_TABLE)
+
+    job.status = 'completed'
+    job.finished_at = job.updated_at = _db_now()
+    db.session.commit()
+    index_changed()
+
+    # The dictionary still holds terms of documents the rebuild dropped
+    try:
+        rebuild_terms()
+    except Exception as e:
+        logger.error('Search terms rebuild after reindex failed: %s', e)
+        db.session.rollback()
+
+
+def _index_batch(job, batch, pool, workers, storage_path):
+    rows, failed = extract_rows(batch, storage_path, pool=pool, workers=workers)
+
+    # Batch and checkpoint commit together
+    write_rows(rows, table=shadow_table, chunks_table=CHUNKS_SHADOW_TABLE)
+    job.processed += len(rows)
+    job.failed += failed
+    job.last_doc_id = batch[-1].doc_id
+    job.updated_at = _db_now()
+    db.session.commit()
+    logger.info('Reindex job %s: %s/%s documents (%s extraction failures)', job.job_id, job.processed, job.total, job.failed)
+
+
+def run_job(job_id, storage_path, batch_size=200, workers=None):
+    """
+    Run (or continue) reindex job ``job_id`` to completion in this thread.
+    Needs an application context.
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise ReindexInProgress('A reindex is already running in this process')
+
+    pool = None
+    try:
+        job = db.session.get(ReindexJob, job_id)
+        workers = os.cpu_count() if workers is None else workers
+        if workers > 0:
+            # spawn, not fork: this usually runs in a thread of a threaded server
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+        with db.engines['doc_db'].connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                DOCUMENTS_QUERY, {'last_doc_id': job.last_doc_id}
+            )
+            for batch in result.partitions():
+                _index_batch(job, batch, pool, workers, storage_path)
+
+        swap_in(job)
+        logger.info('Reindex job %s completed: %s documents, %s extraction failures', job.job_id, job.processed, job.failed)
+        return job
+
+    except Exception as e:
+        logger.exception('Reindex job %s failed: %s', job_id, e)
+        db.session.rollback()
+        job = db.session.get(ReindexJob, job_id)
+        if job:
+            job.status = 'failed'
+            job.error = str(e)
+            job.updated_at = _db_now()
+            db.session.commit()
+        raise
+
+    finally:
+        if pool:
+            pool.shutdown()
+        _run_lock.release()
+
+
+def run_in_background(app, job_id, **kwargs):
+    """
+    Run a reindex job on a daemon thread with its own application context.
+    """
+    def target():
+        with app.app_context():
+            try:
+                run_job(job_id, **kwargs)
+            except Exception:
+                pass  # Already recorded on the job
+            finally:
+                db.session.remove()
+
+    thread = threading.Thread(target=target, name=f'reindex-{job_id}', daemon=True)
+    thread.start()
+    return thread
@@ -2,12 +2,23 @@ from flask import Blueprint, request, jsonify, current_app
 from ..models.document_index import DocumentIndex
 from .. import db
 from ..utils.auth import require_auth, get_forwarded_headers
-import traceback
+from ..backends import get_backend
+from ..models.reindex_job import ReindexJob
+from .. import fuzzy, reindex, similarity, sync
+from ..search_query import parse_filters, ranking_params, DEFAULT_PER_PAGE, MAX_PER_PAGE
+from ..shares import get_shared_doc_map
+from ..suggest import suggest
+from ..events import index_changed
+from ..cache import query_cache, search_cache_key
+import time
 from sqlalchemy import text
 import jwt
 import json
 import os
 import requests
+import logging
+
+logger = logging.getLogger(__name__)
 
 search_bp = Blueprint('search', __name__)
 
@@ -15,167 +26,296 @@ search_bp = Blueprint('search', __name__)
 def index_document():
     try:
         data = request.get_json()
-        print(f"\nIndexing request for doc_id: {data.get('doc_id')}")
+        logger.debug('Indexing request for doc_id: %s', data.get('doc_id') if data else None)
         
         if not data or 'doc_id' not in data:
             return jsonify({'error': 'Invalid request data'}), 400
 
-        # Extract metadata and content
-        metadata = data.get('doc_metadata', {})
-        content = data.get('content_text', '')
-        
-        # Create or update document index WITHOUT setting search_vector
-        doc_index = DocumentIndex(
-            doc_id=data['doc_id'],
-            content_text=content,
-            doc_metadata=metadata
-            # Remove search_vector - it will be generated automatically
-        )
-        
-        print(f"Created index for document {data['doc_id']}")
-        print(f"Metadata: {metadata}")
-        
-        db.session.merge(doc_index)
-        db.session.commit()
+        result = get_backend().index([data])[0]
+        logger.debug('Index result for document %s: %s', data['doc_id'], result)
+
+        if result['status'] == 'error':
+            return jsonify({'error': result.get('error', 'Indexing failed')}), 400
         
-        return jsonify({'message': 'Document indexed successfully'})
+        return jsonify({'message': 'Document indexed successfully', 'status': result['status']})
         
     except Exception as e:
-        print(f"Indexing error: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception('Indexing error: %s', e)
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@search_bp.route('/index/bulk', methods=['POST'])
+def index_documents_bulk():
+    """
+    Index a batch of documents with one multi-row upsert per batch and
+    report a status for each document.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        documents = data.get('documents')
+        if not isinstance(documents, list):
+            return jsonify({'error': 'Invalid request data'}), 400
+
+        logger.debug('Bulk indexing request for %s documents', len(documents))
+        results = get_backend().index(documents)
+
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        logger.debug('Bulk indexing results: %s', counts)
+
+        return jsonify({
+            'message': f"Indexed {counts.get('inserted', 0) + counts.get('updated', 0)} documents",
+            'counts': counts,
+            'results': results
+        })
+
+    except Exception as e:
+        logger.exception('Bulk indexing error: %s', e)
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@search_bp.route('/index/sync', methods=['POST'])
+def sync_index():
+    """
+    Index documents changed since the last sync and drop deleted ones.
+    """
+    try:
+        if get_backend().name != 'postgres':
+            return jsonify({'error': 'Index sync only applies to the postgres search backend'}), 400
+        summary = sync.sync_once(current_app.config['DOCUMENT_STORAGE_PATH'])
+        if summary is None:
+            return jsonify({'error': 'An index sync is already running'}), 409
+        return jsonify(summary)
+    except Exception as e:
+        logger.exception('Index sync error: %s', e)
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/index/stats', methods=['GET'])
+def index_stats():
+    """
+    Which search backend is active and how large its index is.
+    """
+    try:
+        return jsonify(get_backend().stats())
+    except Exception as e:
+        logger.error('Index stats error: %s', e)
+        return jsonify({'error': str(e)}), 500
+
+@search_bp.route('/index/terms', methods=['POST'])
+def rebuild_search_terms():
+    """
+    Rebuild the typo-correction dictionary from the whole index, dropping
+    terms only deleted documents had.
+    """
+    try:
+        if get_backend().name != 'postgres':
+            return jsonify({'error': 'Search terms only apply to the postgres search backend'}), 400
+        return jsonify({'terms': fuzzy.rebuild_terms()})
+    except Exception as e:
+        logger.error('Search terms rebuild error: %s', e)
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@search_bp.route('/index/sync', methods=['GET'])
+def sync_index_status():
+    try:
+        return jsonify(sync.get_state().to_dict())
+    except Exception as e:
+        logger.error('Index sync status error: %s', e)
+        return jsonify({'error': str(e)}), 500
+
 @search_bp.route('/search', methods=['GET'])
 @require_auth
 def search_documents(current_user):
+    query = request.args.get('q', '').strip()
+    user_id = current_user.get('user_id')
     try:
-        # Normalize query by replacing spaces with underscores and vice versa
-        query = request.args.get('q', '').strip()
-        normalized_query = query.replace(' ', '_').lower()
-        space_query = query.replace('_', ' ').lower()
+        page = max(request.args.get('page', 1, type=int) or 1, 1)
+        per_page = min(max(request.args.get('per_page', DEFAULT_PER_PAGE, type=int) or DEFAULT_PER_PAGE, 1), MAX_PER_PAGE)
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        user_id = current_user['user_id']
-        
-        print(f"\n=== Search Debug ===")
-        print(f"User ID: {user_id}")
-        print(f"Raw query: '{query}'")
+        logger.debug('Search by user %s for %r', user_id, query)
 
         if not query:
-            return jsonify({'results': [], 'count': 0})
+            return jsonify({
+                'results': [], 'count': 0, 'total': 0, 'page': page, 'per_page': per_page,
+                'facets': {'file_type': {}, 'upload_month': {}}, 'corrections': {}
+            })
 
-        # Initialize empty dictionary for shared docs
-        shared_doc_map = {}
+        # Cached response, skipping both the share lookup and the search
+        cache_key = search_cache_key(user_id, query, filters, page, per_page)
+        if query_cache.ttl > 0:
+            cached = query_cache.get(cache_key)
+            if cached is not None:
+                logger.debug('Search cache hit')
+                return current_app.response_class(cached, mimetype='application/json', headers={'X-Cache': 'HIT'})
+        # Read before searching, so an invalidation that lands meanwhile
+        # keeps this (possibly stale) response out of the cache
+        generation = query_cache.generation(cache_key[0])
 
-        # Get shared documents
-        share_engine = db.get_engine(bind='share_db')
-        shared_docs_query = text("""
-            SELECT doc_id, share_id, owner_id as shared_by, shared_date
-            FROM shareddocuments
-            WHERE recipient_id = :user_id AND status = 'active'
-        """)
+        # Documents shared with this user
+        shared_doc_map = get_shared_doc_map(user_id)
 
-        with share_engine.connect() as conn:
-            shared_docs = conn.execute(shared_docs_query, {'user_id': user_id}).fetchall()
-            
-            # Safely convert shared docs to dictionary
-            shared_doc_map = {
-                doc.doc_id: {
-                    'share_id': doc.share_id,
-                    'shared_by': doc.shared_by,
-                    'shared_date': doc.shared_date
-                } for doc in shared_docs
-            } if shared_docs else {}
-
-        print(f"Found {len(shared_doc_map)} shared documents")
-
-        # Modified search query
-        search_query = text("""
-            SELECT DISTINCT ON (di.doc_id)
-                di.doc_id,
-                di.doc_metadata,
-                di.content_text
-            FROM documentindex di
-            WHERE
-                (
-                    LOWER(di.doc_metadata->>'original_filename') LIKE :underscore_query
-                    OR LOWER(di.doc_metadata->>'original_filename') LIKE :space_query
-                    OR LOWER(di.doc_metadata->>'filename') LIKE :underscore_query
-                    OR LOWER(di.doc_metadata->>'filename') LIKE :space_query
-                )
-                AND (
-                    di.doc_metadata->>'user_id' = :user_id
-                    OR di.doc_id = ANY(:shared_ids)
-                )
-            ORDER BY di.doc_id
-        """)
+        logger.debug('Found %s shared documents', len(shared_doc_map))
 
-        results = db.session.execute(
-            search_query,
-            {
-                'underscore_query': f'%{normalized_query}%',
-                'space_query': f'%{space_query}%',
-                'user_id': str(user_id),
-                'shared_ids': list(shared_doc_map.keys()) or [-1]
-            }
-        ).fetchall()
-
-        print(f"Found {len(results) if results else 0} matching documents")
+        found = get_backend().search(
+            query, user_id, shared_doc_map.keys(), page=page, per_page=per_page, filters=filters
+        )
+        total = found['total']
+        facets = {
+            'file_type': found['facets']['file_type'],
+            'upload_month': dict(sorted(found['facets']['upload_month'].items(), reverse=True))
+        }
+        logger.debug('Found %s matching documents, returning %s', total, len(found['results']))
 
-                # Format results
+        # Format results
         formatted_results = []
-        seen_keys = set()
-        
-        for row in results:
-            # Create a unique key for each result using doc_id and share_id
-            unique_key = (row.doc_id, shared_doc_map.get(row.doc_id, {}).get('share_id', None))
-            
-            if unique_key not in seen_keys:
-                seen_keys.add(unique_key)
-                
-                # Safely access metadata and share info
-                metadata = row.doc_metadata or {}
-                share_info = shared_doc_map.get(row.doc_id, {})
-                
-                formatted_results.append({
-                    'doc_id': row.doc_id,
-                    'original_filename': metadata.get('original_filename'),
-                    'upload_date': metadata.get('upload_date'),
-                    'file_type': metadata.get('file_type'),
-                    'content': row.content_text[:200] if row.content_text else None,
-                    'is_shared': row.doc_id in shared_doc_map,
-                    'shared_by': share_info.get('shared_by'),
-                    'share_id': share_info.get('share_id')
-                })
-
-
-        # Split query into words and check if all words are in filename
-        query_words = query.lower().split()
-        filtered_results = [
-            result for result in formatted_results
-            if result['original_filename'] and all(
-                word in result['original_filename'].lower().replace('_', ' ')
-                for word in query_words
-            )
-        ]
+        for row in found['results']:
+            # Safely access metadata and share info
+            metadata = row['doc_metadata']
+            share_info = shared_doc_map.get(row['doc_id'], {})
+
+            formatted_results.append({
+                'doc_id': row['doc_id'],
+                'original_filename': metadata.get('original_filename'),
+                'upload_date': metadata.get('upload_date'),
+                'file_type': metadata.get('file_type'),
+                'content': row['snippet'] or None,
+                'snippet': row['snippet'],
+                'highlights': row['highlights'],
+                'filename_match': row['filename_match'],
+                'page': row.get('page'),
+                'rank': row['rank'],
+                'is_shared': row['doc_id'] in shared_doc_map,
+                'shared_by': share_info.get('shared_by'),
+                'share_id': share_info.get('share_id')
+            })
+
+        body = json.dumps({
+            'results': formatted_results,
+            'count': len(formatted_results),
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'facets': facets,
+            'corrections': found.get('corrections', {})
+        }).encode('utf-8')
+        if query_cache.ttl > 0:
+            query_cache.set(cache_key, body, generation=generation)
+        return current_app.response_class(body, mimetype='application/json', headers={'X-Cache': 'MISS'})
+
+    except Exception as e:
+        logger.exception('Search by user %s for %r failed: %s', user_id, query, e)
+        return jsonify({'error': str(e)}), 500
+
+
 
-        print(f"Filtered Results: {filtered_results}")
 
+@search_bp.route('/search/suggest', methods=['GET'])
+@require_auth
+def suggest_completions(current_user):
+    """
+    Type-ahead completions for a filename prefix, answered from memory.
+    """
+    try:
+        started = time.perf_counter()
+        prefix = request.args.get('q', '')
+        limit = min(max(request.args.get('limit', 10, type=int) or 10, 1), 50)
+
+        completions = suggest(current_user['user_id'], prefix, limit=limit)
         return jsonify({
-            'results': filtered_results,
-            'count': len(filtered_results)
+            'query': prefix,
+            **completions,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
         })
+    except Exception as e:
+        logger.exception('Suggest error: %s', e)
+        return jsonify({'error': str(e)}), 500
+
+@search_bp.route('/search/similar/<int:doc_id>', methods=['GET'])
+@require_auth
+def similar_documents(current_user, doc_id):
+    """
+    Documents the user can access whose content is most like doc_id's, by
+    TF-IDF cosine similarity.
+    """
+    user_id = current_user.get('user_id')
+    try:
+        started = time.perf_counter()
+        if get_backend().name != 'postgres':
+            return jsonify({'error': 'Similar documents need the postgres search backend'}), 400
+        limit = min(max(request.args.get('limit', 10, type=int) or 10, 1), 50)
+
+        shared_doc_map = get_shared_doc_map(user_id)
+        source = similarity.get_source(doc_id)
+        if source is None or (source.owner_id != int(user_id) and doc_id not in shared_doc_map):
+            return jsonify({'error': 'Document not found'}), 404
+
+        try:
+            matches = similarity.similar_documents(
+                source,
+                user_id,
+                shared_doc_map.keys(),
+                k=limit
+            )
+        except similarity.SimilarityUnavailable as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
 
+        metadata = similarity.result_metadata(match_id for match_id, _ in matches)
+        results = []
+        for match_id, score in matches:
+            doc_metadata = metadata.get(match_id, {})
+            share_info = shared_doc_map.get(match_id, {})
+            results.append({
+                'doc_id': match_id,
+                'original_filename': doc_metadata.get('original_filename'),
+                'upload_date': doc_metadata.get('upload_date'),
+                'file_type': doc_metadata.get('file_type'),
+                'score': round(score, 4),
+                'is_shared': match_id in shared_doc_map,
+                'shared_by': share_info.get('shared_by'),
+                'share_id': share_info.get('share_id')
+            })
+
+        return jsonify({
+            'doc_id': doc_id,
+            'results': results,
+            'count': len(results),
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
     except Exception as e:
-        print(f"\n=== Search Error ===")
-        print(f"User ID: {user_id}")
-        print(f"Query: '{query}'")
-        print(f"Error: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception('Similar documents error: %s', e)
         return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """
+    Drop cached search results for the given users (all users when
+    user_ids is omitted). Called by the share service when shares change.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get('user_ids')
+        if user_ids is not None and not isinstance(user_ids, list):
+            return jsonify({'error': 'user_ids must be a list'}), 400
 
+        index_changed(user_ids)
+        return jsonify({'message': 'Search cache invalidated', 'user_ids': user_ids})
+    except Exception as e:
+        logger.error('Cache invalidation error: %s', e)
+        return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit ratio, size and eviction counts of this process's search cache.
+    """
+    return jsonify(query_cache.stats())
 
 @search_bp.route('/vectors', methods=['GET'])
 def debug_vectors():
@@ -197,21 +337,16 @@ def debug_vectors():
 @search_bp.route('/delete/<int:doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
     try:
-        print(f"Search service: Attempting to delete document {doc_id}")
-        doc = DocumentIndex.query.filter_by(doc_id=doc_id).first()
-        
-        if doc:
-            db.session.delete(doc)
-            db.session.commit()
-            print(f"Search service: Successfully deleted document {doc_id}")
+        logger.debug('Attempting to delete document %s', doc_id)
+        if get_backend().delete(doc_id):
+            logger.debug('Successfully deleted document %s', doc_id)
             return jsonify({'message': 'Document removed from search index'})
         else:
-            print(f"Search service: Document {doc_id} not found in index")
+            logger.debug('Document %s not found in index', doc_id)
             return jsonify({'message': 'Document not found in search index'}), 404
             
     except Exception as e:
-        print(f"Search service error: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception('Error in delete_document: %s', e)
         db.session.rollback()
         return jsonify({'error': 'Failed to delete document from search index'}), 500
 
@@ -224,12 +359,12 @@ def debug_index():
         """)
         results = db.session.execute(all_docs).fetchall()
         
-        print("\nAll indexed documents:")
+        logger.debug('All indexed documents:')
         for row in results:
-            print(f"Doc ID: {row.doc_id}")
-            print(f"Metadata: {row.doc_metadata}")
-            print(f"Content: {row.content_text[:100]}...")
-            print("---")
+            logger.debug('Doc ID: %s', row.doc_id)
+            logger.debug('Metadata: %s', row.doc_metadata)
+            logger.debug('Content: %s...', row.content_text[:100])
+            logger.debug('---')
             
         return jsonify([{
             'doc_id': row.doc_id,
@@ -237,70 +372,70 @@ def debug_index():
             'content_preview': row.content_text[:100] if row.content_text else None
         } for row in results])
     except Exception as e:
-        print(f"Debug index error: {str(e)}")
+        logger.error('Debug index error: %s', e)
         return jsonify({'error': str(e)}), 500
 
 @search_bp.route('/reindex', methods=['POST'])
 def reindex_all():
+    """
+    Start a background rebuild of the index into a shadow table, or resume
+    the last unfinished one with {"resume": true}.
+    """
     try:
-        # Get engine for doc_db
-        doc_engine = db.get_engine(bind='doc_db')
-        print(f"Starting reindex of all documents")
+        if get_backend().name != 'postgres':
+            return jsonify({'error': 'Reindexing only applies to the postgres search backend'}), 400
 
-        # First, clear existing index
-        db.session.execute(text("TRUNCATE TABLE documentindex"))
-        db.session.commit()
-        
-        # Get all documents
-        all_docs_query = text("""
-            SELECT doc_id, filename, original_filename, upload_date, 
-                   file_type, description, user_id, last_modified
-            FROM documents
-        """)
-        
-        with doc_engine.connect() as conn:
-            documents = conn.execute(all_docs_query).fetchall()
-            
-        print(f"Found {len(documents)} documents to reindex")
-            
-        for doc in documents:
-            # Create document index without search_vector
-            doc_index = DocumentIndex(
-                doc_id=doc.doc_id,
-                doc_metadata={
-                    'filename': doc.filename,
-                    'original_filename': doc.original_filename,
-                    'upload_date': doc.upload_date.isoformat() if doc.upload_date else None,
-                    'file_type': doc.file_type,
-                    'description': doc.description,
-                    'user_id': doc.user_id,
-                    'last_modified': doc.last_modified.isoformat() if doc.last_modified else None
-                },
-                content_text=f"File: {doc.filename}"  # Basic content text
-            )
-            db.session.add(doc_index)  # Using add instead of merge
-            print(f"Indexed document {doc.doc_id}: {doc.filename}")
-            
-        db.session.commit()
-        return jsonify({'message': f'Reindexed {len(documents)} documents'})
+        data = request.get_json(silent=True) or {}
+        resume = bool(data.get('resume')) or request.args.get('resume') == 'true'
+
+        try:
+            job = reindex.start_job(resume=resume)
+        except reindex.ReindexInProgress as e:
+            return jsonify({'error': str(e)}), 409
+
+        reindex.run_in_background(
+            current_app._get_current_object(),
+            job.job_id,
+            storage_path=current_app.config['DOCUMENT_STORAGE_PATH'],
+            batch_size=int(data.get('batch_size') or current_app.config['REINDEX_BATCH_SIZE']),
+            workers=current_app.config['REINDEX_WORKERS']
+        )
+        return jsonify({
+            'message': f"Reindex job {job.job_id} {'resumed' if job.last_doc_id else 'started'}",
+            'job': job.to_dict()
+        }), 202
         
     except Exception as e:
-        print(f"Reindex error: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception('Reindex error: %s', e)
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/reindex', methods=['GET'])
+@search_bp.route('/reindex/<int:job_id>', methods=['GET'])
+def reindex_status(job_id=None):
+    """
+    Progress of a reindex job (the latest one by default).
+    """
+    try:
+        job = db.session.get(ReindexJob, job_id) if job_id else reindex.latest_job()
+        if not job:
+            return jsonify({'error': 'Reindex job not found'}), 404
+        return jsonify(job.to_dict())
+    except Exception as e:
+        logger.error('Reindex status error: %s', e)
+        return jsonify({'error': str(e)}), 500
+
 @search_bp.route('/debug/search/<term>', methods=['GET'])
 def debug_search(term):
     try:
-        print(f"\nDebug search for term: '{term}'")
+        logger.debug("Debug search for term: '%s'", term)
         debug_query = text("""
             SELECT 
                 doc_id,
                 doc_metadata,
                 content_text,
                 search_vector,
-                ts_rank_cd(search_vector, to_tsquery('english', :query)) as rank
+                ts_rank_cd(CAST(:rank_weights AS float4[]), search_vector, to_tsquery('english', :query), 32) as rank
             FROM documentindex
             WHERE search_vector @@ to_tsquery('english', :query)
             ORDER BY rank DESC
@@ -308,15 +443,15 @@ def debug_search(term):
         
         results = db.session.execute(
             debug_query,
-            {'query': term + ':*'}
+            {'query': term + ':*', **ranking_params(current_app.config['SEARCH_RANKING'])}
         ).fetchall()
         
-        print(f"Found {len(results)} matches in index")
+        logger.debug('Found %s matches in index', len(results))
         for idx, row in enumerate(results):
-            print(f"\nMatch {idx + 1}:")
-            print(f"Doc ID: {row.doc_id}")
-            print(f"Metadata: {row.doc_metadata}")
-            print(f"Rank: {row.rank}")
+            logger.debug('Match %s:', idx + 1)
+            logger.debug('Doc ID: %s', row.doc_id)
+            logger.debug('Metadata: %s', row.doc_metadata)
+            logger.debug('Rank: %s', row.rank)
         
         return jsonify({
             'query': term,
@@ -330,6 +465,5 @@ def debug_search(term):
         })
         
     except Exception as e:
-        print(f"Debug search error: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception('Debug search error: %s', e)
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
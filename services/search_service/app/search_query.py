@@ -0,0 +1,302 @@
+"""
+SQL for the /search endpoint.
+
+Documents match when every query word appears in the filename or the
+query matches search_vector, narrowed by the optional filters. Matches are
+scored, ranked and paginated in Postgres, and ts_headline runs only for the rows on
+the returned page, so only a bounded snippet of each document's content
+leaves the database. Facet counts (per MIME family, per upload month) come
+from the same statement through GROUPING SETS over the filtered matches.
+
+search_vector weights filename words A, description B and content C, so
+ts_rank_cd can weigh each field separately. The score is
+
+    (ts_rank_cd(weights, search_vector, query, 32)
+     + filename_boost if every query word is in the filename)
+    * recency factor
+
+where the recency factor decays from 1 for a document uploaded today
+towards 1 - recency_weight, halving the remainder every half_life_days.
+
+With ``fuzzy`` (see fuzzy.py), misspelled words also match their
+dictionary corrections, and filename words match by trigram
+word_similarity. Matches that rely on a correction have their text rank or
+filename boost multiplied by fuzzy_penalty, so exact matches stay on top.
+
+Long documents keep their text in documentindex_chunks (see chunks.py).
+Their chunks are searched separately; a document's text rank adds the rank
+of its best matching chunk, whose page and snippet it reports. The words of
+a query must then occur within one chunk.
+"""
+import re
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from .fuzzy import tsquery_literal
+from .utils.highlight import headline_options
+from .utils.metadata import MIME_FAMILIES
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+SCOPES = ('all', 'owned', 'shared')
+
+DEFAULT_RANKING = {
+    'weight_filename': 1.0,
+    'weight_description': 0.4,
+    'weight_content': 0.2,
+    'filename_boost': 1.0,
+    'recency_weight': 0.2,
+    'recency_half_life_days': 180.0
+}
+
+# ts_rank_cd normalization 32 maps a rank into [0, 1) so the boosts add up sensibly
+RANK_EXPR = "ts_rank_cd(CAST(:rank_weights AS float4[]), di.search_vector, q.tsq, 32)"
+CHUNK_RANK_EXPR = "ts_rank_cd(CAST(:rank_weights AS float4[]), c.search_vector, q.tsq, 32)"
+RECENCY_EXPR = """(1 - :recency_weight + :recency_weight * power(0.5,
+    GREATEST(EXTRACT(EPOCH FROM LOCALTIMESTAMP - COALESCE(upload_date, LOCALTIMESTAMP)), 0)
+    / 86400.0 / :recency_half_life))"""
+
+# Normalized filename the LIKE conditions run against
+FILENAME_EXPR = "replace(lower(COALESCE(di.doc_metadata->>'original_filename', '')), '_', ' ')"
+
+
+def parse_filters(args):
+    """
+    Read search filters from request args. Raises ValueError for bad values.
+
+    - file_type: comma-separated MIME families (pdf, document, image, text,
+      other) and/or full MIME types
+    - date_from, date_to: inclusive upload dates (YYYY-MM-DD)
+    - scope: all (default), owned or shared
+    """
+    families, file_types = [], []
+    for value in filter(None, (v.strip().lower() for v in args.get('file_type', '').split(','))):
+        if value in MIME_FAMILIES:
+            families.append(value)
+        elif '/' in value:
+            file_types.append(value)
+        else:
+            raise ValueError(f"Unknown file_type: {value}")
+
+    def parse_date(name):
+        value = args.get(name)
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+    date_from = parse_date('date_from')
+    date_to = parse_date('date_to')
+    if date_from and date_to and date_from > date_to:
+        raise ValueError('date_from is after date_to')
+
+    scope = args.get('scope', 'all').lower()
+    if scope not in SCOPES:
+        raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+
+    return {
+        'families': families,
+        'file_types': file_types,
+        'date_from': date_from,
+        'date_to': date_to,
+        'scope': scope
+    }
+
+
+def ranking_params(ranking=None):
+    """
+    Bind parameters for RANK_EXPR and RECENCY_EXPR. ``ranking`` overrides
+    any of DEFAULT_RANKING.
+    """
+    ranking = {**DEFAULT_RANKING, **(ranking or {})}
+    return {
+        # ts_rank_cd takes weights in {D, C, B, A} order; D is unused
+        'rank_weights': [0.0, ranking['weight_content'], ranking['weight_description'], ranking['weight_filename']],
+        'filename_boost': ranking['filename_boost'],
+        'recency_weight': ranking['recency_weight'],
+        'recency_half_life': max(ranking['recency_half_life_days'], 1.0)
+    }
+
+
+def fuzzy_tsquery(query, expansions, params):
+    """
+    SQL for ``query`` with each corrected word ORed with its corrections,
+    or None without corrections.
+    """
+    if not expansions:
+        return None
+    groups = []
+    for position, word in enumerate(dict.fromkeys(re.findall(r'[^\W_]+', query.lower()))):
+        params[f'fuzzy_word_{position}'] = word
+        group = f"plainto_tsquery('english', :fuzzy_word_{position})"
+        if word in expansions:
+            params[f'fuzzy_terms_{position}'] = tsquery_literal(expansions[word])
+            group = f"({group} || to_tsquery('simple', :fuzzy_terms_{position}))"
+        groups.append(group)
+    return ' && '.join(groups)
+
+
+def build_search(query, user_id, shared_ids, page=1, per_page=DEFAULT_PER_PAGE, filters=None, ranking=None,
+                 fuzzy=None):
+    """
+    Return the statement and parameters for one page of search results.
+    The statement always returns at least one row carrying the facets; on
+    an empty page its doc_id is NULL.
+
+    ``fuzzy`` is {'words': [...], 'expansions': {word: [terms]},
+    'penalty': float} from fuzzy.py, or None to match exactly.
+    """
+    filters = filters or parse_filters({})
+    words = query.lower().replace('_', ' ').split()
+    params = {
+        'query': query,
+        'user_id': int(user_id),
+        'shared_ids': list(shared_ids) or [-1],
+        'limit': per_page,
+        'offset': (page - 1) * per_page,
+        'headline_options': headline_options(),
+        'fuzzy_penalty': fuzzy['penalty'] if fuzzy else 1.0,
+        **ranking_params(ranking)
+    }
+    fuzzy_words = set(fuzzy['words']) if fuzzy else set()
+
+    filename_conditions = []
+    fuzzy_filename_conditions = []
+    for position, word in enumerate(words):
+        params[f'word_{position}'] = '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        condition = f"{FILENAME_EXPR} LIKE :word_{position}"
+        filename_conditions.append(condition)
+        if word in fuzzy_words:
+            params[f'filename_word_{position}'] = word
+            condition = f"({condition} OR :filename_word_{position} <% {FILENAME_EXPR})"
+        fuzzy_filename_conditions.append(condition)
+    filename_match = ' AND '.join(filename_conditions) or 'FALSE'
+    filename_fuzzy = ' AND '.join(fuzzy_filename_conditions) if fuzzy_words else 'FALSE'
+    corrected = fuzzy_tsquery(query, fuzzy['expansions'], params) if fuzzy else None
+    tsq = f"exact_tsq || ({corrected})" if corrected else 'exact_tsq'
+
+    if filters['scope'] == 'owned':
+        conditions = ["di.owner_id = :user_id"]
+    elif filters['scope'] == 'shared':
+        conditions = ["di.doc_id = ANY(:shared_ids)"]
+    else:
+        conditions = ["(di.owner_id = :user_id OR di.doc_id = ANY(:shared_ids))"]
+
+    type_conditions = []
+    if filters['families']:
+        params['families'] = filters['families']
+        type_conditions.append("di.file_family = ANY(:families)")
+    if filters['file_types']:
+        params['file_types'] = filters['file_types']
+        type_conditions.append("di.file_type = ANY(:file_types)")
+    if type_conditions:
+        conditions.append(f"({' OR '.join(type_conditions)})")
+    if filters['date_from']:
+        params['date_from'] = filters['date_from']
+        conditions.append("di.upload_date >= :date_from")
+    if filters['date_to']:
+        params['date_to'] = filters['date_to'] + timedelta(days=1)
+        conditions.append("di.upload_date < :date_to")
+
+    where = '\n                  AND '.join(conditions)
+
+    statement = text(f"""
+        WITH q AS (
+            SELECT exact_tsq, {tsq} AS tsq
+            FROM websearch_to_tsquery('english', :query) AS exact_tsq
+        ),
+        chunk_hits AS (
+            SELECT DISTINCT ON (c.doc_id)
+                c.doc_id,
+                c.chunk_no,
+                c.page,
+                {CHUNK_RANK_EXPR} AS chunk_rank,
+                bool_or(c.search_vector @@ q.exact_tsq) OVER (PARTITION BY c.doc_id) AS chunk_exact,
+                COUNT(*) OVER (PARTITION BY c.doc_id) AS chunk_matches
+            FROM documentindex_chunks c
+            JOIN documentindex di ON di.doc_id = c.doc_id
+            CROSS JOIN q
+            WHERE {where}
+                  AND c.search_vector @@ q.tsq
+            ORDER BY c.doc_id, chunk_rank DESC, c.chunk_no
+        ),
+        matched AS MATERIALIZED (
+            SELECT
+                di.doc_id,
+                di.doc_metadata,
+                di.file_family,
+                date_trunc('month', di.upload_date) AS upload_month,
+                di.upload_date,
+                ({filename_match}) AS filename_match,
+                ({filename_fuzzy}) AS filename_fuzzy,
+                di.search_vector @@ q.exact_tsq OR COALESCE(ch.chunk_exact, FALSE) AS exact,
+                {RANK_EXPR} + COALESCE(ch.chunk_rank, 0) AS text_rank,
+                ch.chunk_no,
+                ch.page AS matched_page,
+                COALESCE(ch.chunk_matches, 0) AS matched_chunks
+            FROM documentindex di
+            CROSS JOIN q
+            LEFT JOIN chunk_hits ch ON ch.doc_id = di.doc_id
+            WHERE {where}
+                  AND (({filename_match}) OR ({filename_fuzzy})
+                       OR di.search_vector @@ q.tsq OR ch.doc_id IS NOT NULL)
+        ),
+        facet_counts AS (
+            SELECT
+                GROUPING(file_family) AS by_family,
+                GROUPING(upload_month) AS by_month,
+                file_family,
+                upload_month,
+                COUNT(*) AS n
+            FROM matched
+            GROUP BY GROUPING SETS ((file_family), (upload_month), ())
+        ),
+        facets AS (
+            SELECT
+                COALESCE(SUM(n) FILTER (WHERE by_family = 1 AND by_month = 1), 0) AS total,
+                COALESCE(json_object_agg(COALESCE(file_family, 'other'), n)
+                    FILTER (WHERE by_family = 0), '{{}}'::json) AS family_counts,
+                COALESCE(json_object_agg(COALESCE(to_char(upload_month, 'YYYY-MM'), 'unknown'), n)
+                    FILTER (WHERE by_month = 0), '{{}}'::json) AS month_counts
+            FROM facet_counts
+        ),
+        page AS (
+            SELECT
+                doc_id,
+                doc_metadata,
+                filename_match,
+                chunk_no,
+                matched_page,
+                matched_chunks,
+                (text_rank * CASE WHEN exact THEN 1 ELSE :fuzzy_penalty END
+                 + CASE WHEN filename_match THEN :filename_boost
+                        WHEN filename_fuzzy THEN :filename_boost * :fuzzy_penalty
+                        ELSE 0 END)
+                    * {RECENCY_EXPR} AS rank
+            FROM matched
+            ORDER BY rank DESC, doc_id
+            LIMIT :limit OFFSET :offset
+        )
+        SELECT
+            facets.total,
+            facets.family_counts,
+            facets.month_counts,
+            page.doc_id,
+            page.doc_metadata,
+            page.filename_match,
+            page.matched_page,
+            page.matched_chunks,
+            page.rank,
+            ts_headline('english', COALESCE(dc.content, di.content_text), q.tsq, :headline_options) AS headline
+        FROM facets
+        CROSS JOIN q
+        LEFT JOIN page ON TRUE
+        LEFT JOIN documentindex di ON di.doc_id = page.doc_id
+        -- Long documents: the best matching chunk, or the first one
+        LEFT JOIN documentindex_chunks dc ON dc.doc_id = page.doc_id AND dc.chunk_no = COALESCE(page.chunk_no, 0)
+        ORDER BY page.rank DESC, page.doc_id
+    """)
+    return statement, params
@@ -0,0 +1,44 @@
+"""
+Documents shared with a user, read from the share service database.
+"""
+from sqlalchemy import text
+
+from . import db
+
+SHARED_DOCS_QUERY = text("""
+    SELECT doc_id, share_id, owner_id as shared_by, shared_date
+    FROM shareddocuments
+    WHERE recipient_id = :user_id AND status = 'active'
+""")
+
+
+def get_shared_doc_map(user_id):
+    """
+    Map doc_id to share info for every active share the user received.
+    """
+    with db.engines['share_db'].connect() as conn:
+        shared_docs = conn.execute(SHARED_DOCS_QUERY, {'user_id': user_id}).fetchall()
+
+    return {
+        doc.doc_id: {
+            'share_id': doc.share_id,
+            'shared_by': doc.shared_by,
+            'shared_date': doc.shared_date
+        } for doc in shared_docs
+    }
+
+
+SHARE_RECIPIENTS_QUERY = text("""
+    SELECT DISTINCT recipient_id
+    FROM shareddocuments
+    WHERE doc_id = ANY(:doc_ids) AND status = 'active'
+""")
+
+
+def get_share_recipients(doc_ids):
+    """
+    Users the given documents are actively shared with.
+    """
+    with db.engines['share_db'].connect() as conn:
+        rows = conn.execute(SHARE_RECIPIENTS_QUERY, {'doc_ids': [int(doc_id) for doc_id in doc_ids]})
+        return {row.recipient_id for row in rows}
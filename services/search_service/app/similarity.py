@@ -0,0 +1,214 @@
+"""
+"More like this" for /search/similar/<doc_id>.
+
+Each process keeps a SimilarityIndex (utils/tfidf.py) of documentindex
+content and pulls changes into it: rows whose (last_indexed, doc_id) is
+past the index watermark are re-vectorized, and doc_ids no longer in
+documentindex are dropped. Every process reads and writes the same on-disk
+matrix; replaying a change twice is harmless, so workers do not need to
+coordinate.
+
+Chunked documents (see chunks.py) are vectorized from their first
+SOURCE_CHUNKS chunks, which bounds the text read per document.
+
+The index is built and refreshed on a background thread, which the first
+/search/similar request in each process starts (so the CLIs, which create
+the app too, never load it). Until the first build is done, and without
+numpy and scipy installed, the endpoint answers 503.
+"""
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+try:
+    from .utils.tfidf import SimilarityIndex, vectorize_documents
+except ImportError:
+    SimilarityIndex = None
+
+BATCH_SIZE = 1000
+# Delta rows folded into a new base file once there are this many
+COMPACT_AFTER_ROWS = 5000
+# last_indexed is the writing transaction's start time, so a row can commit
+# with a timestamp older than rows already read; rows newer than this are
+# left for the next refresh so a slow commit cannot slip under the watermark
+SETTLE_SECONDS = 60
+SOURCE_CHUNKS = 10
+WATERMARK_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+CONTENT_EXPR = f"""CASE WHEN di.chunk_count > 0 THEN (
+        SELECT string_agg(c.content, ' ' ORDER BY c.chunk_no)
+        FROM documentindex_chunks c
+        WHERE c.doc_id = di.doc_id AND c.chunk_no < {SOURCE_CHUNKS}
+    ) ELSE di.content_text END"""
+
+CHANGED_DOCUMENTS_QUERY = text(f"""
+    SELECT di.doc_id, di.owner_id, {CONTENT_EXPR} AS content_text, di.last_indexed
+    FROM documentindex di
+    WHERE (di.last_indexed, di.doc_id) > (:last_indexed, :last_doc_id)
+      AND di.last_indexed <= LOCALTIMESTAMP - :settle_seconds * INTERVAL '1 second'
+    ORDER BY di.last_indexed, di.doc_id
+""")
+
+SOURCE_DOCUMENT_QUERY = text(f"""
+    SELECT di.doc_id, di.owner_id, {CONTENT_EXPR} AS content_text
+    FROM documentindex di
+    WHERE di.doc_id = :doc_id
+""")
+
+RESULT_METADATA_QUERY = text("""
+    SELECT doc_id, doc_metadata
+    FROM documentindex
+    WHERE doc_id = ANY(:doc_ids)
+""")
+
+
+class SimilarityUnavailable(Exception):
+    pass
+
+
+# Published by the refresher thread once the first build is done
+_index = None
+# Held while the refresher applies changes and while a query reads the index
+_lock = threading.Lock()
+_refresher = None
+# The id scan for deleted documents reads all of documentindex; do it less often
+DELETION_CHECK_SECONDS = 600
+
+
+def format_watermark(last_indexed, doc_id):
+    """
+    Fixed width, so watermarks compare as strings in (last_indexed, doc_id)
+    order.
+    """
+    return f"{last_indexed.strftime(WATERMARK_FORMAT)}/{doc_id:012d}"
+
+
+def parse_watermark(watermark):
+    """
+    (last_indexed, doc_id) from a watermark; an index written before
+    watermarks carried the doc_id restarts at its timestamp.
+    """
+    if not watermark:
+        return datetime(1970, 1, 1), 0
+    last_indexed, _, doc_id = watermark.partition('/')
+    return datetime.fromisoformat(last_indexed), int(doc_id or 0)
+
+
+def refresh(index, lock=None, check_deletions=True):
+    """
+    Bring ``index`` up to date with documentindex. Returns how many rows
+    were re-vectorized and how many removed. ``lock`` is held only while
+    changes are applied, so queries on a live index wait for that and not
+    for the database or the vectorizing.
+    """
+    lock = lock or nullcontext()
+    last_indexed, last_doc_id = parse_watermark(index.watermark)
+    updated = 0
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+            CHANGED_DOCUMENTS_QUERY,
+            {'last_indexed': last_indexed, 'last_doc_id': last_doc_id, 'settle_seconds': SETTLE_SECONDS}
+        )
+        for batch in result.partitions():
+            vectorized = vectorize_documents((row.doc_id, row.owner_id, row.content_text) for row in batch)
+            with lock:
+                index.apply(vectorized, watermark=format_watermark(batch[-1].last_indexed, batch[-1].doc_id))
+            updated += len(batch)
+
+        removed = []
+        if check_deletions:
+            current = set(conn.execute(text("SELECT doc_id FROM documentindex")).scalars())
+            removed = [doc_id for doc_id in index.doc_ids() if doc_id not in current]
+
+    with lock:
+        index.update([], removed=removed, watermark=index.watermark)
+        if index.delta_rows > COMPACT_AFTER_ROWS:
+            index.compact()
+    if updated or removed:
+        logger.info('Similarity index: %s documents vectorized, %s removed', updated, len(removed))
+    return updated, len(removed)
+
+
+def get_source(doc_id):
+    """
+    The documentindex row (doc_id, owner_id, content_text) to find
+    documents like, or None.
+    """
+    return db.session.execute(SOURCE_DOCUMENT_QUERY, {'doc_id': doc_id}).first()
+
+
+def start_refresher(app):
+    """
+    Build the index on a daemon thread, then keep it up to date every
+    SIMILARITY_REFRESH_SECONDS. Only the first call in a process starts it.
+    """
+    global _refresher
+    with _lock:
+        if _refresher is not None:
+            return _refresher
+        _refresher = threading.Thread(target=_refresh_loop, args=(app,), name='similarity-refresh', daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+def _refresh_loop(app):
+    global _index
+    index = None
+    last_deletion_check = None
+    while True:
+        with app.app_context():
+            try:
+                if index is None:
+                    index = SimilarityIndex(app.config['SIMILARITY_INDEX_PATH'])
+                check_deletions = (
+                    last_deletion_check is None
+                    or time.monotonic() - last_deletion_check >= DELETION_CHECK_SECONDS
+                )
+                # Nothing reads the index before it is published, so the first build needs no lock
+                refresh(index, _lock if _index is not None else None, check_deletions=check_deletions)
+                if check_deletions:
+                    last_deletion_check = time.monotonic()
+                if _index is None:
+                    _index = index
+                    logger.info('Similarity index ready: %s documents', len(index))
+            except Exception as e:
+                logger.exception('Similarity index refresh failed: %s', e)
+            finally:
+                db.session.remove()
+        time.sleep(app.config['SIMILARITY_REFRESH_SECONDS'])
+
+
+def similar_documents(source, user_id, shared_ids, k=10):
+    """
+    Up to ``k`` (doc_id, score) pairs most similar to the ``source`` row
+    among the documents the user owns or has been shared. Raises
+    SimilarityUnavailable until the first build is done.
+    """
+    if SimilarityIndex is None:
+        raise SimilarityUnavailable('Similarity search needs numpy and scipy installed')
+    if _index is None:
+        start_refresher(current_app._get_current_object())
+        raise SimilarityUnavailable('Similarity index is being built, try again shortly')
+
+    with _lock:
+        return _index.similar(
+            source.content_text,
+            k=k,
+            owner_id=int(user_id),
+            allowed_doc_ids=shared_ids,
+            exclude_doc_id=source.doc_id
+        )
+
+
+def result_metadata(doc_ids):
+    rows = db.session.execute(RESULT_METADATA_QUERY, {'doc_ids': list(doc_ids) or [-1]}).fetchall()
+    return {row.doc_id: row.doc_metadata or {} for row in rows}
@@ -0,0 +1,141 @@
+"""
+Type-ahead suggestions for /search/suggest.
+
+Each user's filenames (owned and shared with them) are loaded once into an
+in-memory SuggestionIndex and kept in a bounded LRU map. An entry is
+rebuilt when it is older than SUGGEST_TTL or when an index change names
+the user. Users with more than SUGGEST_MAX_DOCS documents are answered
+from Postgres instead, through the text_pattern_ops index on normalized
+filenames.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from . import db
+from .events import on_index_changed
+from .shares import get_shared_doc_map
+from .utils.suggest_index import SuggestionIndex, normalize
+
+SUGGEST_TTL = 300
+SUGGEST_MAX_USERS = 1000
+SUGGEST_MAX_DOCS = 50000
+
+# Matches idx_documentindex_filename_prefix in SearchServiceDDL.sql
+NORMALIZED_FILENAME = "replace(lower(doc_metadata->>'original_filename'), '_', ' ')"
+
+USER_DOCUMENTS_QUERY = text("""
+    SELECT doc_id, doc_metadata->>'original_filename' AS filename
+    FROM documentindex
+    WHERE owner_id = :user_id OR doc_id = ANY(:shared_ids)
+    LIMIT :limit
+""")
+
+PREFIX_QUERY = text(f"""
+    SELECT doc_id, doc_metadata->>'original_filename' AS filename
+    FROM documentindex
+    WHERE owner_id = :user_id
+      AND {NORMALIZED_FILENAME} LIKE :prefix
+    UNION
+    SELECT doc_id, doc_metadata->>'original_filename' AS filename
+    FROM documentindex
+    WHERE doc_id = ANY(:shared_ids)
+      AND {NORMALIZED_FILENAME} LIKE :prefix
+    ORDER BY filename
+    LIMIT :limit
+""")
+
+
+class SuggestionStore:
+    """
+    Bounded, thread-safe map of user_id to (built_at, SuggestionIndex or None).
+    None marks a user with too many documents to keep in memory. As in
+    QueryCache, a generation counter keeps an index built before an
+    invalidation from being stored after it.
+    """
+
+    def __init__(self, ttl=SUGGEST_TTL, max_users=SUGGEST_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0  # bumped by invalidating everyone
+        self._lock = threading.Lock()
+
+    def get(self, user_id, build):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+            generation = (self._epoch, self._generations.get(user_id, 0))
+
+        # Built outside the lock so one slow load doesn't block other users
+        index = build(user_id)
+        with self._lock:
+            if generation != (self._epoch, self._generations.get(user_id, 0)):
+                # Invalidated while building; this index may already be stale
+                return index
+            self._entries[user_id] = (now, index)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                self._epoch += 1
+                self._generations.clear()
+                self._entries.clear()
+            else:
+                for user_id in user_ids:
+                    self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                    self._entries.pop(user_id, None)
+
+
+store = SuggestionStore()
+
+
+@on_index_changed
+def _invalidate(user_ids):
+    store.invalidate(user_ids)
+
+
+def build_user_index(user_id):
+    shared_ids = list(get_shared_doc_map(user_id)) or [-1]
+    rows = db.session.execute(
+        USER_DOCUMENTS_QUERY,
+        {'user_id': int(user_id), 'shared_ids': shared_ids, 'limit': SUGGEST_MAX_DOCS + 1}
+    ).fetchall()
+    if len(rows) > SUGGEST_MAX_DOCS:
+        return None
+    return SuggestionIndex((row.doc_id, row.filename) for row in rows)
+
+
+def suggest(user_id, prefix, limit=10):
+    """
+    Filename and term completions for ``prefix``.
+    """
+    index = store.get(int(user_id), build_user_index)
+    if index is not None:
+        return index.complete(prefix, limit=limit)
+
+    # Too many documents to hold in memory: prefix scan on the B-tree index
+    normalized = normalize(prefix)
+    if not normalized:
+        return {'filenames': [], 'terms': []}
+    escaped = normalized.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    rows = db.session.execute(PREFIX_QUERY, {
+        'user_id': int(user_id),
+        'shared_ids': list(get_shared_doc_map(user_id)) or [-1],
+        'prefix': escaped + '%',
+        'limit': limit
+    }).fetchall()
+    return {
+        'filenames': [{'doc_id': row.doc_id, 'filename': row.filename} for row in rows],
+        'terms': []
+    }
@@ -0,0 +1,198 @@
+"""
+Incremental index sync.
+
+Instead of reprocessing the whole corpus, each run picks up only documents
+whose (last_modified, doc_id) is past the high-water mark stored in
+index_sync_state, re-extracts and upserts them, and advances the mark in the
+same transaction as each batch. Deleted documents are found with an
+anti-join of documentindex against the current doc_ids, loaded into a
+temporary table.
+
+Runs are serialized across processes with a Postgres advisory lock, so the
+CLI and any number of in-service schedulers can run side by side.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from . import db
+from .events import index_changed
+from .fuzzy import add_terms
+from .indexing import extract_rows, write_rows
+from .models.index_sync_state import IndexSyncState
+from .reindex import record_deletions
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = 'documents'
+SYNC_LOCK_KEY = 730033  # pg_try_advisory_lock key for index sync
+ID_BATCH_SIZE = 5000
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# The docs service stamps last_modified before its commit; rows newer than
+# this are left for the next run so a slow commit cannot slip under the mark
+SETTLE_SECONDS = 5
+
+CHANGED_DOCUMENTS_QUERY = text("""
+    SELECT doc_id, filename, original_filename, upload_date, file_type,
+           description, user_id, last_modified, file_path
+    FROM documents
+    WHERE (last_modified, doc_id) > (:last_modified, :last_doc_id)
+      AND last_modified <= :settled_before
+    ORDER BY last_modified, doc_id
+""")
+
+
+def get_state():
+    IndexSyncState.__table__.create(bind=db.engine, checkfirst=True)
+    state = db.session.get(IndexSyncState, STATE_NAME)
+    if state is None:
+        state = IndexSyncState(name=STATE_NAME, last_doc_id=0)
+        db.session.add(state)
+        db.session.commit()
+    return state
+
+
+def sync_changes(state, storage_path, batch_size=500, settle_seconds=SETTLE_SECONDS):
+    """
+    Index documents changed since the watermark. Returns how many were indexed.
+    """
+    settled_before = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    indexed = 0
+
+    with db.engines['doc_db'].connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            CHANGED_DOCUMENTS_QUERY,
+            {
+                'last_modified': state.last_modified or datetime(1970, 1, 1),
+                'last_doc_id': state.last_doc_id,
+                'settled_before': settled_before
+            }
+        )
+        for batch in result.partitions():
+            rows, failed = extract_rows(batch, storage_path)
+            write_rows(rows)
+            add_terms([row['doc_id'] for row in rows])
+            # Watermark moves in the same transaction as the rows it covers
+            state.last_modified = batch[-1].last_modified
+            state.last_doc_id = batch[-1].doc_id
+            db.session.commit()
+            index_changed((row.user_id for row in batch), doc_ids=[row.doc_id for row in batch])
+            indexed += len(rows)
+            logger.info('Index sync: indexed %s changed documents (%s extraction failures in last batch)', indexed, failed)
+
+    return indexed
+
+
+def sync_deletions():
+    """
+    Remove index entries whose document no longer exists. Returns the
+    removed doc_ids.
+    """
+    # Anything indexed after this point may belong to a document created
+    # after the id scan, so it is never treated as deleted
+    scan_started = db.session.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+    db.session.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS sync_doc_ids (doc_id INTEGER PRIMARY KEY) ON COMMIT DROP"
+    ))
+
+    seen = 0
+    with db.engines['doc_db'].connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=ID_BATCH_SIZE).execute(
+            text("SELECT doc_id FROM documents")
+        )
+        for batch in result.partitions():
+            db.session.execute(
+                text("INSERT INTO sync_doc_ids (doc_id) VALUES (:doc_id)"),
+                [{'doc_id': row.doc_id} for row in batch]
+            )
+            seen += len(batch)
+
+    if not seen:
+        # An empty documents table is far more likely a misconfigured DOC_DB_URL
+        # than every document being deleted; don't wipe the index over it
+        db.session.rollback()
+        logger.info('Index sync: documents table is empty, skipping deletion check')
+        return []
+
+    db.session.execute(text("ANALYZE sync_doc_ids"))
+    deleted = db.session.execute(text("""
+        DELETE FROM documentindex di
+        WHERE di.last_indexed < :scan_started
+          AND NOT EXISTS (SELECT 1 FROM sync_doc_ids s WHERE s.doc_id = di.doc_id)
+        RETURNING di.doc_id
+    """), {'scan_started': scan_started}).scalars().all()
+    record_deletions(deleted)
+    db.session.commit()
+    if deleted:
+        index_changed()
+    return deleted
+
+
+def sync_once(storage_path, batch_size=500, detect_deletions=True):
+    """
+    Run one incremental sync. Returns a summary, or None if another sync
+    holds the lock. Needs an application context.
+    """
+    with db.engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': SYNC_LOCK_KEY}).scalar():
+            logger.info('Index sync: another sync is running, skipping')
+            return None
+        try:
+            started = time.perf_counter()
+            state = get_state()
+            indexed = sync_changes(state, storage_path, batch_size=batch_size)
+            deleted = sync_deletions() if detect_deletions else []
+
+            state.last_run_at = datetime.utcnow()
+            state.last_indexed_count = indexed
+            state.last_deleted_count = len(deleted)
+            db.session.commit()
+
+            summary = {
+                'indexed': indexed,
+                'deleted': len(deleted),
+                'deleted_doc_ids': deleted[:100],
+                'seconds': round(time.perf_counter() - started, 3),
+                'state': state.to_dict()
+            }
+            logger.info('Index sync: %s indexed, %s deleted in %ss', indexed, len(deleted), summary['seconds'])
+            return summary
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': SYNC_LOCK_KEY})
+
+
+def start_scheduler(app, interval):
+    """
+    Run sync_once every ``interval`` seconds on a daemon thread. Only the
+    first call in a process starts it.
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    def loop():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    sync_once(app.config['DOCUMENT_STORAGE_PATH'])
+                except Exception as e:
+                    logger.exception('Index sync error: %s', e)
+                finally:
+                    db.session.remove()
+
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return _scheduler
+        _scheduler = threading.Thread(target=loop, name='index-sync', daemon=True)
+    _scheduler.start()
+    logger.info('Index sync scheduled every %ss', interval)
+    return _scheduler
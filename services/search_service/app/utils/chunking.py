@@ -0,0 +1,40 @@
+"""
+Splitting long extracted text into chunks for documentindex_chunks.
+
+Extraction separates PDF pages with form feeds, so a chunk never spans a
+page break and carries the page it came from. Pages (or whole texts
+without page breaks) longer than the chunk size are cut at whitespace.
+"""
+
+PAGE_BREAK = '\f'
+
+
+def split_text(text, max_chars):
+    """
+    Cut ``text`` into pieces of at most ``max_chars``, preferring to cut
+    at whitespace.
+    """
+    pieces = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = start + max_chars
+        cut = max(text.rfind(' ', start, end), text.rfind('\n', start, end))
+        if cut <= start:
+            cut = end
+        pieces.append(text[start:cut])
+        start = cut
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece.strip()]
+
+
+def chunk_text(text, max_chars):
+    """
+    Split ``text`` into (page, chunk) pairs. Pages are numbered from 1 when
+    the text has page breaks, otherwise page is None.
+    """
+    if PAGE_BREAK not in text:
+        return [(None, piece) for piece in split_text(text, max_chars)]
+    chunks = []
+    for page, page_text in enumerate(text.split(PAGE_BREAK), start=1):
+        chunks.extend((page, piece) for piece in split_text(page_text, max_chars))
+    return chunks
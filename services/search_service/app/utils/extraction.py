@@ -0,0 +1,23 @@
+"""
+Reindex workers' text extraction, shared with uploads through
+common.extraction so a reindex produces the same content an upload does.
+"""
+import os
+
+from common.extraction import extract_content_text
+
+
+def extract_document(task):
+    """
+    Worker entry point for reindexing: ``task`` is (doc_id, file_path,
+    file_type, original_filename, description). Returns (doc_id,
+    content_text, error). A file that cannot be read still gets its
+    filename indexed.
+    """
+    doc_id, file_path, file_type, original_filename, description = task
+    try:
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(file_path)
+        return doc_id, extract_content_text(file_path, file_type, original_filename, description), None
+    except Exception as e:
+        return doc_id, f"{original_filename} ", f"{type(e).__name__}: {str(e)}"
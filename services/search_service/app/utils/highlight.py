@@ -0,0 +1,46 @@
+"""
+Turning ts_headline output into a plain snippet plus match offsets.
+
+ts_headline is asked to wrap matches in control characters that cannot
+appear in extracted text, so the markers can be stripped reliably and the
+frontend gets offsets instead of HTML it would have to sanitize.
+"""
+START_SEL = '\x02'
+STOP_SEL = '\x03'
+FRAGMENT_DELIMITER = ' … '
+
+
+def headline_options(max_words=35, min_words=15, max_fragments=2):
+    """
+    Options string for ts_headline using the markers parse_headline expects.
+    """
+    return (
+        f'StartSel="{START_SEL}", StopSel="{STOP_SEL}", '
+        f'MaxWords={int(max_words)}, MinWords={int(min_words)}, '
+        f'MaxFragments={int(max_fragments)}, FragmentDelimiter="{FRAGMENT_DELIMITER}"'
+    )
+
+
+def parse_headline(headline):
+    """
+    Split a marked-up headline into the plain snippet and a list of
+    [start, end) character offsets of the highlighted matches.
+    """
+    if not headline:
+        return '', []
+
+    snippet = []
+    highlights = []
+    length = 0
+    start = None
+    for char in headline:
+        if char == START_SEL:
+            start = length
+        elif char == STOP_SEL:
+            if start is not None and length > start:
+                highlights.append([start, length])
+            start = None
+        else:
+            snippet.append(char)
+            length += 1
+    return ''.join(snippet), highlights
@@ -0,0 +1,769 @@
+"""
+Embedded inverted index, an alternative to Postgres full-text search for
+small deployments, tests and benchmarks.
+
+The index is a set of immutable segment files plus a manifest listing the
+live segments and the documents deleted from each. Every write produces a
+new segment; updates delete the old copy, and a background merge folds
+small segments together, dropping deleted documents.
+
+A segment is memory-mapped and laid out as sections described by a JSON
+directory at the end of the file:
+
+- per-document columns (doc id, length, owner, family, MIME type, upload
+  date) as arrays, plus stored JSON for content and metadata
+- a sorted term list, and per term its document frequency and offsets
+- postings: segment-local document numbers and term frequencies as
+  array('I'), and offsets into a positions blob where each document's
+  positions are delta-encoded varints
+
+Queries are ANDed words, quoted phrases (checked against positions) and
+-excluded words, scored with BM25. Filename words are indexed as separate
+terms so a document whose name contains every query word matches even if
+its content does not, and ranks first, as with the Postgres backend.
+
+Words are lowercased but not stemmed.
+"""
+import fcntl
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import namedtuple
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+# Prefix keeping filename terms apart from content terms
+FILENAME_PREFIX = '\x01'
+
+MAGIC = b'DSX1'
+FOOTER = struct.Struct('<Q4s')  # directory offset, magic
+MANIFEST = 'manifest.json'
+# Held with flock for as long as an InvertedIndex has the directory open
+LOCK_FILE = 'LOCK'
+SEGMENT_SUFFIX = '.seg'
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+SNIPPET_WORDS = 35
+SNIPPET_LEAD = 5
+
+if array('I').itemsize != 4:
+    raise ImportError("array('I') must be 4 bytes wide for the segment format")
+
+Postings = namedtuple('Postings', 'ords freqs positions')
+
+
+def tokenize(text):
+    return [match.group().lower() for match in TOKEN_RE.finditer(text or '')]
+
+
+def encode_varints(values, out):
+    """
+    Append ``values`` (non-negative ints) to ``out`` as LEB128 varints.
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+    return out
+
+
+def decode_varints(buf, offset, count):
+    """
+    Read ``count`` varints from ``buf`` starting at ``offset``.
+    """
+    values = []
+    for _ in range(count):
+        value = shift = 0
+        while True:
+            byte = buf[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        values.append(value)
+    return values
+
+
+def encode_positions(positions):
+    """
+    Delta-encode ascending positions as varints.
+    """
+    deltas = [positions[0]] + [b - a for a, b in zip(positions, positions[1:])]
+    return bytes(encode_varints(deltas, bytearray()))
+
+
+def decode_positions(buf, offset, count):
+    positions = decode_varints(buf, offset, count)
+    for i in range(1, count):
+        positions[i] += positions[i - 1]
+    return positions
+
+
+def parse_query(query):
+    """
+    Split a query into required and excluded phrases (lists of terms).
+    A word that tokenizes into several terms (q3-report) is a phrase.
+    """
+    required, excluded = [], []
+    for match in re.finditer(r'(-?)"([^"]*)"?|(-?)(\S+)', query or ''):
+        negate = bool(match.group(1) or match.group(3))
+        text = match.group(2) if match.group(2) is not None else match.group(4)
+        terms = tokenize(text)
+        if not terms or (match.group(4) is not None and text.lower() == 'or'):
+            continue
+        (excluded if negate else required).append(terms)
+    return required, excluded
+
+
+class SegmentBuilder:
+    """
+    Accumulates documents and postings in memory and writes one segment.
+    Postings must be added in ascending document order for each term.
+    """
+
+    def __init__(self):
+        self.doc_ids = array('I')
+        self.lengths = array('I')
+        self.owners = array('i')
+        self.dates = array('I')
+        self.families = array('B')
+        self.file_types = array('H')
+        self.stored = []
+        self.postings = {}
+        self._family_codes = {}
+        self._type_codes = {}
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @staticmethod
+    def _code(codes, value):
+        return codes.setdefault(value or '', len(codes))
+
+    def add_row(self, doc_id, length, owner_id, file_family, file_type, upload_ordinal, stored):
+        ord_ = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.lengths.append(length)
+        self.owners.append(-1 if owner_id is None else owner_id)
+        self.dates.append(upload_ordinal or 0)
+        self.families.append(self._code(self._family_codes, file_family))
+        self.file_types.append(self._code(self._type_codes, file_type))
+        self.stored.append(stored)
+        return ord_
+
+    def add_posting(self, term, ord_, freq, positions):
+        entry = self.postings.get(term)
+        if entry is None:
+            entry = self.postings[term] = (array('I'), array('I'), [])
+        entry[0].append(ord_)
+        entry[1].append(freq)
+        entry[2].append(positions)
+
+    def add_document(self, document):
+        """
+        Tokenize and add one document: doc_id, content_text, doc_metadata,
+        owner_id, file_family, file_type, upload_date.
+        """
+        content = document.get('content_text') or ''
+        metadata = document.get('doc_metadata') or {}
+        upload_date = document.get('upload_date')
+        terms = tokenize(content)
+        ord_ = self.add_row(
+            document['doc_id'],
+            len(terms),
+            document.get('owner_id'),
+            document.get('file_family'),
+            document.get('file_type'),
+            upload_date.toordinal() if upload_date else 0,
+            json.dumps({'content_text': content, 'doc_metadata': metadata}).encode('utf-8')
+        )
+
+        positions = {}
+        for position, term in enumerate(terms):
+            positions.setdefault(term, []).append(position)
+        filename = (metadata.get('original_filename') or '').replace('_', ' ')
+        for position, term in enumerate(tokenize(filename)):
+            positions.setdefault(FILENAME_PREFIX + term, []).append(position)
+        for term in sorted(positions):
+            self.add_posting(term, ord_, len(positions[term]), encode_positions(positions[term]))
+        return ord_
+
+    def write(self, path):
+        terms = sorted(self.postings)
+        directory = {
+            'doc_count': len(self.doc_ids),
+            'total_length': sum(self.lengths),
+            'families': list(self._family_codes),
+            'file_types': list(self._type_codes),
+            'sections': {}
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+
+            def section(name, data):
+                directory['sections'][name] = [f.tell(), len(data)]
+                f.write(data)
+
+            for name in ('doc_ids', 'lengths', 'owners', 'dates', 'families', 'file_types'):
+                section(name, getattr(self, name).tobytes())
+
+            stored_offsets = array('Q', [0])
+            for blob in self.stored:
+                stored_offsets.append(stored_offsets[-1] + len(blob))
+            section('stored_offsets', stored_offsets.tobytes())
+            section('stored', b''.join(self.stored))
+
+            term_df = array('I')
+            term_postings = array('Q')
+            positions_blob = bytearray()
+            postings_blob = bytearray()
+            for term in terms:
+                ords, freqs, positions = self.postings[term]
+                offsets = array('I')
+                for blob in positions:
+                    offsets.append(len(positions_blob))
+                    positions_blob += blob
+                offsets.append(len(positions_blob))
+                term_df.append(len(ords))
+                term_postings.append(len(postings_blob))
+                postings_blob += ords.tobytes() + freqs.tobytes() + offsets.tobytes()
+
+            section('terms', '\n'.join(terms).encode('utf-8'))
+            section('term_df', term_df.tobytes())
+            section('term_postings', term_postings.tobytes())
+            section('postings', bytes(postings_blob))
+            section('positions', bytes(positions_blob))
+
+            directory_offset = f.tell()
+            f.write(json.dumps(directory).encode('utf-8'))
+            f.write(FOOTER.pack(directory_offset, MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class Segment:
+    """
+    Read side of one segment file. Columns and the term dictionary are
+    loaded at open; postings, positions and stored fields are read from
+    the mapping on demand.
+    """
+
+    def __init__(self, path, deleted=()):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        directory_offset, magic = FOOTER.unpack(self._mm[-FOOTER.size:])
+        if magic != MAGIC or self._mm[:4] != MAGIC:
+            raise ValueError(f"{path} is not an index segment")
+        directory = json.loads(self._mm[directory_offset:-FOOTER.size])
+        self._sections = directory['sections']
+
+        self.doc_ids = self._array('I', 'doc_ids')
+        self.lengths = self._array('I', 'lengths')
+        self.owners = self._array('i', 'owners')
+        self.dates = self._array('I', 'dates')
+        self.families = self._array('B', 'families')
+        self.file_types = self._array('H', 'file_types')
+        self.family_names = directory['families']
+        self.file_type_names = directory['file_types']
+        self._stored_offsets = self._array('Q', 'stored_offsets')
+
+        terms = self._bytes('terms').decode('utf-8')
+        self.terms = terms.split('\n') if terms else []
+        self._term_index = {term: i for i, term in enumerate(self.terms)}
+        self._term_df = self._array('I', 'term_df')
+        self._term_postings = self._array('Q', 'term_postings')
+        self._postings_start = self._sections['postings'][0]
+        self._positions_start = self._sections['positions'][0]
+
+        self.total_length = directory['total_length']
+        self.ords = {doc_id: ord_ for ord_, doc_id in enumerate(self.doc_ids)}
+        self.deleted = set()
+        self.deleted_length = 0
+        for ord_ in deleted:
+            self.delete(ord_)
+
+    def _bytes(self, name):
+        offset, length = self._sections[name]
+        return self._mm[offset:offset + length]
+
+    def _array(self, typecode, name):
+        values = array(typecode)
+        values.frombytes(self._bytes(name))
+        return values
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def live_count(self):
+        return len(self.doc_ids) - len(self.deleted)
+
+    def delete(self, ord_):
+        if ord_ not in self.deleted:
+            self.deleted.add(ord_)
+            self.deleted_length += self.lengths[ord_]
+
+    def doc_freq(self, term):
+        i = self._term_index.get(term)
+        return 0 if i is None else self._term_df[i]
+
+    def postings(self, term):
+        i = self._term_index.get(term)
+        return None if i is None else self.postings_at(i)
+
+    def postings_at(self, i):
+        df = self._term_df[i]
+        offset = self._postings_start + self._term_postings[i]
+        ords, freqs, positions = array('I'), array('I'), array('I')
+        ords.frombytes(self._mm[offset:offset + 4 * df])
+        freqs.frombytes(self._mm[offset + 4 * df:offset + 8 * df])
+        positions.frombytes(self._mm[offset + 8 * df:offset + 12 * df + 4])
+        return Postings(ords, freqs, positions)
+
+    def positions(self, postings, i):
+        return decode_positions(self._mm, self._positions_start + postings.positions[i], postings.freqs[i])
+
+    def raw_positions(self, postings, i):
+        start = self._positions_start
+        return self._mm[start + postings.positions[i]:start + postings.positions[i + 1]]
+
+    def raw_stored(self, ord_):
+        start = self._sections['stored'][0]
+        return self._mm[start + self._stored_offsets[ord_]:start + self._stored_offsets[ord_ + 1]]
+
+    def stored(self, ord_):
+        return json.loads(self.raw_stored(ord_))
+
+    def size(self):
+        return len(self._mm)
+
+    def close(self):
+        self._mm.close()
+
+
+class _SegmentMatcher:
+    """
+    Evaluates parsed phrases against one segment.
+    """
+
+    def __init__(self, segment):
+        self.segment = segment
+        self._postings = {}
+
+    def postings(self, term):
+        if term not in self._postings:
+            postings = self.segment.postings(term)
+            index = dict(zip(postings.ords, range(len(postings.ords)))) if postings else {}
+            self._postings[term] = (postings, index)
+        return self._postings[term]
+
+    def all_of(self, terms):
+        """
+        Documents containing every term, or an empty set.
+        """
+        lists = [self.postings(term) for term in set(terms)]
+        if not lists or any(postings is None for postings, _ in lists):
+            return set()
+        lists.sort(key=lambda entry: len(entry[0].ords))
+        matched = set(lists[0][0].ords)
+        for _, index in lists[1:]:
+            matched.intersection_update(index)
+            if not matched:
+                break
+        return matched
+
+    def has_phrase(self, ord_, terms):
+        if len(terms) == 1:
+            return True
+        positions = []
+        for term in terms:
+            postings, index = self.postings(term)
+            positions.append(set(self.segment.positions(postings, index[ord_])))
+        return any(
+            all(start + offset in positions[offset] for offset in range(1, len(terms)))
+            for start in positions[0]
+        )
+
+    def phrase_matches(self, phrase):
+        return {ord_ for ord_ in self.all_of(phrase) if self.has_phrase(ord_, phrase)}
+
+    def term_freq(self, ord_, term):
+        postings, index = self.postings(term)
+        return postings.freqs[index[ord_]]
+
+
+def make_snippet(content, terms, max_words=SNIPPET_WORDS):
+    """
+    A window of about ``max_words`` words around the first matched term,
+    and [start, end) offsets of matched terms within it.
+    """
+    tokens = list(TOKEN_RE.finditer(content or ''))
+    if not tokens:
+        return '', []
+    first = next((i for i, token in enumerate(tokens) if token.group().lower() in terms), 0)
+    start = max(0, min(first - SNIPPET_LEAD, len(tokens) - max_words))
+    window = tokens[start:start + max_words]
+    begin = window[0].start()
+    snippet = re.sub(r'\s', ' ', content[begin:window[-1].end()])
+    highlights = [
+        [token.start() - begin, token.end() - begin]
+        for token in window if token.group().lower() in terms
+    ]
+    return snippet, highlights
+
+
+class IndexLocked(RuntimeError):
+    """Raised when another process already has the index directory open"""
+
+
+class InvertedIndex:
+    """
+    Segmented on-disk inverted index in ``path``. Safe to use from several
+    threads of one process; only one process may open a given path, which
+    an exclusive flock on ``path``/LOCK enforces (IndexLocked otherwise).
+    """
+
+    def __init__(self, path, merge_factor=8, background_merge=True):
+        self.path = path
+        self.merge_factor = max(2, merge_factor)
+        self.background_merge = background_merge
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread = None
+        os.makedirs(path, exist_ok=True)
+
+        self._lock_file = open(os.path.join(path, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise IndexLocked(
+                f"{path} is open in another process; the inverted index "
+                f"allows one process (run the search service with one worker)"
+            ) from None
+
+        manifest_path = os.path.join(path, MANIFEST)
+        manifest = {'next_segment': 0, 'segments': []}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        self._next_segment = manifest['next_segment']
+        self._segments = [
+            Segment(os.path.join(path, entry['name']), entry['deleted'])
+            for entry in manifest['segments']
+        ]
+
+        # Segments written or merged but never committed to the manifest
+        listed = {segment.name for segment in self._segments}
+        for name in os.listdir(path):
+            if (name.endswith(SEGMENT_SUFFIX) or name.endswith('.tmp')) and name not in listed:
+                os.remove(os.path.join(path, name))
+
+        self._locations = {}
+        for segment in self._segments:
+            for ord_, doc_id in enumerate(segment.doc_ids):
+                if ord_ not in segment.deleted:
+                    self._locations[doc_id] = segment
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _allocate_segment(self):
+        with self._lock:
+            name = f"seg_{self._next_segment:06d}{SEGMENT_SUFFIX}"
+            self._next_segment += 1
+            return os.path.join(self.path, name)
+
+    def _commit(self):
+        manifest = {
+            'version': 1,
+            'next_segment': self._next_segment,
+            'segments': [
+                {'name': segment.name, 'deleted': sorted(segment.deleted)}
+                for segment in self._segments
+            ]
+        }
+        tmp_path = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+    def _delete_locked(self, doc_id):
+        segment = self._locations.pop(doc_id, None)
+        if segment is None:
+            return None
+        ord_ = segment.ords[doc_id]
+        segment.delete(ord_)
+        return segment, ord_
+
+    def add_documents(self, documents):
+        """
+        Insert or replace documents (see SegmentBuilder.add_document) as one
+        new segment. Returns {doc_id: 'inserted' | 'updated'}.
+        """
+        latest = {document['doc_id']: document for document in documents}
+        if not latest:
+            return {}
+        builder = SegmentBuilder()
+        for document in latest.values():
+            builder.add_document(document)
+        path = self._allocate_segment()
+        builder.write(path)
+        segment = Segment(path)
+
+        statuses = {}
+        with self._lock:
+            for doc_id in segment.doc_ids:
+                statuses[doc_id] = 'updated' if self._delete_locked(doc_id) else 'inserted'
+                self._locations[doc_id] = segment
+            self._segments.append(segment)
+            self._commit()
+        self.maybe_merge()
+        return statuses
+
+    def delete_documents(self, doc_ids):
+        """
+        Remove documents. Returns {doc_id: owner_id} for those that existed.
+        """
+        removed = {}
+        with self._lock:
+            for doc_id in doc_ids:
+                location = self._delete_locked(doc_id)
+                if location:
+                    owner_id = location[0].owners[location[1]]
+                    removed[doc_id] = None if owner_id < 0 else owner_id
+            if removed:
+                self._commit()
+        return removed
+
+    def get(self, doc_id):
+        with self._lock:
+            segment = self._locations.get(doc_id)
+        return segment.stored(segment.ords[doc_id]) if segment else None
+
+    def search(self, query, user_id=None, shared_ids=(), page=1, per_page=50,
+               families=(), file_types=(), date_from=None, date_to=None, scope='all'):
+        """
+        One page of matches with facet counts over all of them. ``user_id``
+        None searches every document (benchmarks, tests).
+        """
+        required, excluded = parse_query(query)
+        empty = {'total': 0, 'facets': {'file_type': {}, 'upload_month': {}}, 'results': []}
+        words = [term for phrase in required for term in phrase]
+        if not words:
+            return empty
+
+        with self._lock:
+            segments = [(segment, set(segment.deleted)) for segment in self._segments]
+        live_docs = sum(len(segment) - len(deleted) for segment, deleted in segments)
+        if not live_docs:
+            return empty
+        total_length = sum(segment.total_length - segment.deleted_length for segment, _ in segments)
+        avg_length = max(total_length / live_docs, 1.0)
+        unique_words = set(words)
+        idf = {}
+        for term in unique_words:
+            df = sum(segment.doc_freq(term) for segment, _ in segments)
+            idf[term] = math.log(1 + (live_docs - df + 0.5) / (df + 0.5))
+
+        shared_ids = set(shared_ids)
+        from_ordinal = date_from.toordinal() if date_from else None
+        to_ordinal = date_to.toordinal() if date_to else None
+        family_counts, month_counts = {}, {}
+        matches = []
+
+        for segment, deleted in segments:
+            matcher = _SegmentMatcher(segment)
+            content = matcher.all_of(words)
+            for phrase in required:
+                if len(phrase) > 1 and content:
+                    content &= matcher.phrase_matches(phrase)
+            in_filename = matcher.all_of([FILENAME_PREFIX + term for term in words])
+            candidates = (content | in_filename) - deleted
+            for phrase in excluded:
+                candidates -= matcher.phrase_matches(phrase)
+
+            family_ok = {i for i, name in enumerate(segment.family_names) if name in families}
+            type_ok = {i for i, name in enumerate(segment.file_type_names) if name in file_types}
+            for ord_ in candidates:
+                doc_id = segment.doc_ids[ord_]
+                if user_id is not None:
+                    owned = segment.owners[ord_] == user_id
+                    shared = doc_id in shared_ids
+                    if not (owned if scope == 'owned' else shared if scope == 'shared' else owned or shared):
+                        continue
+                if (families or file_types) and not (
+                    segment.families[ord_] in family_ok or segment.file_types[ord_] in type_ok
+                ):
+                    continue
+                upload_ordinal = segment.dates[ord_]
+                if from_ordinal and not (upload_ordinal and upload_ordinal >= from_ordinal):
+                    continue
+                if to_ordinal and not (upload_ordinal and upload_ordinal <= to_ordinal):
+                    continue
+
+                score = 0.0
+                if ord_ in content:
+                    norm = K1 * (1 - B + B * segment.lengths[ord_] / avg_length)
+                    for term in unique_words:
+                        tf = matcher.term_freq(ord_, term)
+                        score += idf[term] * tf * (K1 + 1) / (tf + norm)
+                matches.append((ord_ in in_filename, score, doc_id, segment, ord_))
+
+                family = segment.family_names[segment.families[ord_]] or 'other'
+                family_counts[family] = family_counts.get(family, 0) + 1
+                month = date.fromordinal(upload_ordinal).strftime('%Y-%m') if upload_ordinal else 'unknown'
+                month_counts[month] = month_counts.get(month, 0) + 1
+
+        offset = (page - 1) * per_page
+        top = heapq.nsmallest(offset + per_page, matches, key=lambda m: (not m[0], -m[1], m[2]))[offset:]
+        results = []
+        for filename_match, score, doc_id, segment, ord_ in top:
+            stored = segment.stored(ord_)
+            snippet, highlights = make_snippet(stored['content_text'], unique_words)
+            results.append({
+                'doc_id': doc_id,
+                'doc_metadata': stored['doc_metadata'],
+                'filename_match': filename_match,
+                'rank': score,
+                'snippet': snippet,
+                'highlights': highlights
+            })
+        return {
+            'total': len(matches),
+            'facets': {'file_type': family_counts, 'upload_month': month_counts},
+            'results': results
+        }
+
+    def maybe_merge(self):
+        """
+        Merge segments if there are more than merge_factor, in a background
+        thread unless background_merge is off.
+        """
+        if not self.background_merge:
+            while self.merge_once():
+                pass
+            return
+        with self._lock:
+            if self._merge_thread and self._merge_thread.is_alive():
+                return
+            if len(self._segments) <= self.merge_factor:
+                return
+
+            def run():
+                try:
+                    while self.merge_once():
+                        pass
+                except Exception as e:
+                    logger.error('Inverted index merge failed: %s', e)
+
+            self._merge_thread = threading.Thread(target=run, name='index-merge', daemon=True)
+            self._merge_thread.start()
+
+    def merge_once(self, force=False):
+        """
+        Merge the smallest segments into one. Returns False when nothing
+        needed merging.
+        """
+        with self._merge_lock:
+            with self._lock:
+                if len(self._segments) <= (1 if force else self.merge_factor):
+                    return False
+                count = len(self._segments) if force else self.merge_factor
+                sources = sorted(self._segments, key=lambda segment: segment.live_count)[:count]
+                # Keep the original order so postings stay in ascending document order
+                sources = [segment for segment in self._segments if segment in sources]
+                snapshot = {segment.name: set(segment.deleted) for segment in sources}
+            path = self._allocate_segment()
+
+            builder = SegmentBuilder()
+            remaps = []
+            for segment in sources:
+                remap = {}
+                for ord_ in range(len(segment)):
+                    if ord_ in snapshot[segment.name]:
+                        continue
+                    remap[ord_] = builder.add_row(
+                        segment.doc_ids[ord_],
+                        segment.lengths[ord_],
+                        None if segment.owners[ord_] < 0 else segment.owners[ord_],
+                        segment.family_names[segment.families[ord_]],
+                        segment.file_type_names[segment.file_types[ord_]],
+                        segment.dates[ord_],
+                        segment.raw_stored(ord_)
+                    )
+                remaps.append(remap)
+            for segment, remap in zip(sources, remaps):
+                for i, term in enumerate(segment.terms):
+                    postings = segment.postings_at(i)
+                    for j, ord_ in enumerate(postings.ords):
+                        if ord_ in remap:
+                            builder.add_posting(
+                                term, remap[ord_], postings.freqs[j], segment.raw_positions(postings, j)
+                            )
+            builder.write(path)
+            merged = Segment(path)
+
+            with self._lock:
+                for segment, remap in zip(sources, remaps):
+                    # Deleted or replaced while the merge ran
+                    for ord_ in segment.deleted - snapshot[segment.name]:
+                        merged.delete(remap[ord_])
+                for ord_, doc_id in enumerate(merged.doc_ids):
+                    if ord_ not in merged.deleted:
+                        self._locations[doc_id] = merged
+                self._segments = [segment for segment in self._segments if segment not in sources] + [merged]
+                self._commit()
+
+            # Open mappings stay readable after unlink; searches holding a
+            # source segment finish normally
+            for segment in sources:
+                try:
+                    os.remove(segment.path)
+                except OSError:
+                    pass
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self._locations),
+                'segments': len(self._segments),
+                'deleted': sum(len(segment.deleted) for segment in self._segments),
+                'terms': sum(len(segment.terms) for segment in self._segments),
+                'bytes': sum(segment.size() for segment in self._segments),
+                'merging': bool(self._merge_thread and self._merge_thread.is_alive())
+            }
+
+    def close(self):
+        if self._merge_thread:
+            self._merge_thread.join()
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._locations = {}
+            if not self._lock_file.closed:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                self._lock_file.close()
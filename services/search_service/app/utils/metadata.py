@@ -0,0 +1,56 @@
+"""
+Metadata fields promoted out of doc_metadata into their own documentindex
+columns, so filters and facets can use ordinary B-tree indexes.
+"""
+from datetime import datetime
+
+WORD_TYPES = (
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+)
+
+MIME_FAMILIES = ('pdf', 'document', 'image', 'text', 'other')
+
+
+def mime_family(file_type):
+    """
+    Group a MIME type into the families the search filters and facets use.
+    Keep in sync with the backfill in database/SearchServiceDDL.sql.
+    """
+    if not file_type:
+        return 'other'
+    if file_type == 'application/pdf':
+        return 'pdf'
+    if file_type in WORD_TYPES:
+        return 'document'
+    if file_type.startswith('image/'):
+        return 'image'
+    if file_type.startswith('text/'):
+        return 'text'
+    return 'other'
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def promoted_columns(doc_metadata):
+    """
+    Values for the promoted columns of a documentindex row.
+    """
+    try:
+        owner_id = int(doc_metadata.get('user_id'))
+    except (TypeError, ValueError):
+        owner_id = None
+    file_type = doc_metadata.get('file_type') or None
+    return {
+        'owner_id': owner_id,
+        'file_type': file_type[:100] if file_type else None,
+        'file_family': mime_family(file_type),
+        'upload_date': _parse_datetime(doc_metadata.get('upload_date'))
+    }
@@ -0,0 +1,120 @@
+"""
+Bounded in-process cache for serialized search responses.
+
+Entries are keyed by (user_id, ...) and evicted by TTL, by LRU order once
+max_entries or max_bytes is exceeded, and explicitly per user when an index
+or share change affects them. A per-user generation counter keeps a
+response computed before an invalidation from being stored after it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry overhead (key tuple, OrderedDict node, bookkeeping)
+ENTRY_OVERHEAD = 200
+
+
+class QueryCache:
+    def __init__(self, max_entries=2000, max_bytes=64 * 1024 * 1024, ttl=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._user_keys = {}
+        self._generations = {}
+        self._epoch = 0  # bumped by clear()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value) + ENTRY_OVERHEAD
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def generation(self, user_id):
+        """
+        Current generation for ``user_id``; pass it back to set().
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(user_id, 0)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation=None):
+        """
+        Store ``value`` (bytes). Skipped if the user was invalidated since
+        ``generation`` was read, or if the value alone exceeds max_bytes.
+        """
+        size = len(value) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key[0], 0)):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate_users(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                for key in list(self._user_keys.get(user_id, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._user_keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'users': len(self._user_keys),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,94 @@
+"""
+In-memory prefix index over one user's filenames for type-ahead.
+
+Normalized filenames and the words in them are kept in sorted lists, so a
+prefix lookup is two bisects and a short scan, with no database round trip.
+"""
+import re
+from bisect import bisect_left
+
+WORD_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+# Upper bound on terms scanned for one prefix before ranking them
+MAX_TERM_SCAN = 500
+
+
+def normalize(value):
+    """
+    Lowercase and treat underscores like spaces, as /search does.
+    """
+    return ' '.join((value or '').lower().replace('_', ' ').split())
+
+
+def _prefix_range(keys, prefix):
+    start = bisect_left(keys, prefix)
+    # Every key starting with prefix sorts before prefix + the highest code point
+    end = bisect_left(keys, prefix + '\U0010ffff', start)
+    return start, end
+
+
+class SuggestionIndex:
+    """
+    Filename and term completions for one user's documents.
+
+    ``documents`` is an iterable of (doc_id, original_filename).
+    """
+
+    def __init__(self, documents):
+        names = []
+        term_docs = {}
+        for doc_id, filename in documents:
+            if not filename:
+                continue
+            normalized = normalize(filename)
+            names.append((normalized, filename, doc_id))
+            for term in set(WORD_RE.findall(normalized)):
+                term_docs.setdefault(term, []).append(doc_id)
+
+        names.sort()
+        self._name_keys = [name[0] for name in names]
+        self._names = names
+        self._filenames = {doc_id: (normalized, filename) for normalized, filename, doc_id in names}
+        self._terms = sorted(term_docs)
+        self._term_docs = term_docs
+
+    def __len__(self):
+        return len(self._names)
+
+    def complete(self, prefix, limit=10):
+        """
+        Return up to ``limit`` filename completions (whole-name prefix
+        matches first, then names with a word starting with the prefix) and
+        up to ``limit`` term completions, most common first.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return {'filenames': [], 'terms': []}
+
+        filenames = []
+        seen = set()
+        start, end = _prefix_range(self._name_keys, prefix)
+        for _, filename, doc_id in self._names[start:min(end, start + limit)]:
+            filenames.append({'doc_id': doc_id, 'filename': filename})
+            seen.add(doc_id)
+
+        # The last word of the prefix is what is being typed; earlier words
+        # must appear in the filename too
+        *earlier_words, last_word = prefix.split(' ')
+        start, end = _prefix_range(self._terms, last_word)
+        terms = self._terms[start:min(end, start + MAX_TERM_SCAN)]
+
+        if len(filenames) < limit:
+            for term in terms:
+                for doc_id in self._term_docs[term]:
+                    normalized, filename = self._filenames[doc_id]
+                    if doc_id not in seen and all(word in normalized for word in earlier_words):
+                        seen.add(doc_id)
+                        filenames.append({'doc_id': doc_id, 'filename': filename})
+                        if len(filenames) >= limit:
+                            break
+                if len(filenames) >= limit:
+                    break
+
+        ranked_terms = sorted(terms, key=lambda term: (-len(self._term_docs[term]), term))[:limit]
+        return {'filenames': filenames, 'terms': ranked_terms}
@@ -0,0 +1,276 @@
+"""
+Sparse TF-IDF vectors for "more like this" queries.
+
+Terms are hashed into a fixed number of columns, so vectors can be added
+one document at a time without a global vocabulary. Rows hold sublinear
+term frequencies (1 + log tf); IDF is applied at query time from document
+frequencies kept up to date as rows come and go, so adding documents never
+requires re-weighting stored rows.
+
+Rows live in two blocks: a large base matrix in CSC form, so a query only
+touches the columns of its own terms, and a small CSR delta that new rows
+are appended to. Each change is also written as a delta file next to the
+base, and compact() folds the delta into a new base.
+
+Needs numpy and scipy.
+"""
+import math
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+N_FEATURES = 2 ** 20
+TOKEN_RE = re.compile(r'[^\W\d_]{2,}', re.UNICODE)
+# Only the strongest terms of the source document are used to find similar ones
+MAX_QUERY_TERMS = 50
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my
+myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with you your
+yours yourself yourselves
+""".split())
+
+BASE_FILE = 'base.npz'
+DELTA_PREFIX = 'delta_'
+
+
+def vectorize(text):
+    """
+    Hashed sublinear term frequencies of ``text`` as (columns, values).
+    """
+    counts = {}
+    for match in TOKEN_RE.finditer(text or ''):
+        term = match.group().lower()
+        if term not in STOP_WORDS:
+            column = zlib.crc32(term.encode('utf-8')) & (N_FEATURES - 1)
+            counts[column] = counts.get(column, 0) + 1
+    columns = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = np.fromiter((1.0 + math.log(tf) for tf in counts.values()), dtype=np.float32, count=len(counts))
+    order = np.argsort(columns)
+    return columns[order], values[order]
+
+
+def rows_to_csr(vectors):
+    """
+    Stack (columns, values) pairs into a CSR matrix.
+    """
+    indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+    for i, (columns, _) in enumerate(vectors):
+        indptr[i + 1] = indptr[i] + len(columns)
+    indices = np.concatenate([columns for columns, _ in vectors]) if vectors else np.zeros(0, np.int32)
+    data = np.concatenate([values for _, values in vectors]) if vectors else np.zeros(0, np.float32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(vectors), N_FEATURES))
+
+
+def vectorize_documents(documents):
+    """
+    (CSR matrix, doc_ids, owners) for (doc_id, owner_id, content_text) rows.
+    """
+    documents = list(documents)
+    matrix = rows_to_csr([vectorize(content) for _, _, content in documents])
+    doc_ids = [doc_id for doc_id, _, _ in documents]
+    owners = [-1 if owner_id is None else owner_id for _, owner_id, _ in documents]
+    return matrix, doc_ids, owners
+
+
+def _save(path, matrix, doc_ids, owners, removed=None, watermark=''):
+    matrix = matrix.tocsr()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+            doc_ids=np.asarray(doc_ids, dtype=np.int64),
+            owners=np.asarray(owners, dtype=np.int64),
+            removed=np.asarray(removed if removed is not None else [], dtype=np.int64),
+            watermark=np.array(watermark)
+        )
+    os.replace(tmp_path, path)
+
+
+def _load(path):
+    with np.load(path) as f:
+        matrix = sparse.csr_matrix(
+            (f['data'], f['indices'], f['indptr']), shape=(len(f['indptr']) - 1, N_FEATURES)
+        )
+        return matrix, f['doc_ids'], f['owners'], f['removed'], str(f['watermark'])
+
+
+class SimilarityIndex:
+    """
+    TF-IDF matrix over documents, persisted in ``path``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.watermark = ''
+        self._set_base(sparse.csr_matrix((0, N_FEATURES), dtype=np.float32), [], [])
+
+        base_path = os.path.join(path, BASE_FILE)
+        if os.path.exists(base_path):
+            matrix, doc_ids, owners, _, self.watermark = _load(base_path)
+            self._set_base(matrix, doc_ids, owners)
+        for name in self._delta_files():
+            matrix, doc_ids, owners, removed, watermark = _load(os.path.join(path, name))
+            # Replaying a change twice is harmless, so ties are replayed
+            if watermark >= self.watermark:
+                self._apply(matrix, doc_ids, owners, removed)
+                self.watermark = max(self.watermark, watermark)
+
+    def _delta_files(self):
+        return sorted(name for name in os.listdir(self.path) if name.startswith(DELTA_PREFIX) and name.endswith('.npz'))
+
+    def _set_base(self, matrix, doc_ids, owners):
+        self._base = matrix.tocsc().astype(np.float32)
+        self._delta = sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self._doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        self._owners = np.asarray(owners, dtype=np.int64)
+        self._live = np.ones(len(self._doc_ids), dtype=bool)
+        self._rows = {int(doc_id): row for row, doc_id in enumerate(self._doc_ids)}
+        # Non-zeros per column of the CSC base
+        self._df = np.diff(self._base.indptr).astype(np.int64)
+        self._norms = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _remove_rows(self, rows):
+        rows = np.asarray(sorted(rows), dtype=np.int64)
+        self._live[rows] = False
+        n_base = self._base.shape[0]
+
+        base_rows = rows[rows < n_base]
+        if len(base_rows):
+            # Per-column count of removed rows, without slicing rows out of CSC
+            removed = np.zeros(n_base, dtype=bool)
+            removed[base_rows] = True
+            counts = np.concatenate([[0], np.cumsum(removed[self._base.indices], dtype=np.int32)])
+            self._df -= counts[self._base.indptr[1:]] - counts[self._base.indptr[:-1]]
+
+        indptr = self._delta.indptr
+        for row in rows[rows >= n_base] - n_base:
+            np.subtract.at(self._df, self._delta.indices[indptr[row]:indptr[row + 1]], 1)
+
+    def _apply(self, matrix, doc_ids, owners, removed):
+        stale = []
+        for doc_id in list(removed) + [int(doc_id) for doc_id in doc_ids]:
+            row = self._rows.pop(int(doc_id), None)
+            if row is not None:
+                stale.append(row)
+        if stale:
+            self._remove_rows(stale)
+        if len(doc_ids):
+            start = len(self._doc_ids)
+            self._delta = sparse.vstack([self._delta, matrix.astype(np.float32)], format='csr')
+            self._doc_ids = np.concatenate([self._doc_ids, np.asarray(doc_ids, dtype=np.int64)])
+            self._owners = np.concatenate([self._owners, np.asarray(owners, dtype=np.int64)])
+            self._live = np.concatenate([self._live, np.ones(len(doc_ids), dtype=bool)])
+            for offset, doc_id in enumerate(doc_ids):
+                self._rows[int(doc_id)] = start + offset
+            self._df += np.bincount(matrix.indices, minlength=N_FEATURES)
+        self._norms = None
+
+    def update(self, documents, removed=(), watermark=''):
+        """
+        Add or replace documents, given as (doc_id, owner_id, content_text),
+        and drop ``removed`` doc_ids. The change is written as a delta file.
+        """
+        self.apply(vectorize_documents(documents), removed, watermark)
+
+    def apply(self, vectorized, removed=(), watermark=''):
+        """
+        update() with documents already run through vectorize_documents(),
+        so callers can vectorize without holding a lock around the index.
+        """
+        matrix, doc_ids, owners = vectorized
+        removed = [int(doc_id) for doc_id in removed]
+        if not doc_ids and not removed:
+            return
+        self._apply(matrix, doc_ids, owners, removed)
+        self.watermark = max(self.watermark, watermark)
+        # Named by watermark for replay order; the time keeps names unique
+        name = f"{DELTA_PREFIX}{re.sub(r'[^0-9A-Za-z]', '', watermark)}_{time.time_ns()}_{os.getpid()}.npz"
+        _save(os.path.join(self.path, name), matrix, doc_ids, owners, removed, watermark)
+
+    def doc_ids(self):
+        return list(self._rows)
+
+    @property
+    def delta_rows(self):
+        return self._delta.shape[0]
+
+    def compact(self):
+        """
+        Fold the delta and removed rows into a new base file.
+        """
+        live = np.flatnonzero(self._live)
+        stacked = sparse.vstack([self._base.tocsr(), self._delta], format='csr')[live]
+        _save(os.path.join(self.path, BASE_FILE), stacked, self._doc_ids[live], self._owners[live], watermark=self.watermark)
+        for name in self._delta_files():
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+        self._set_base(stacked, self._doc_ids[live], self._owners[live])
+
+    def _idf(self):
+        n = max(len(self._rows), 1)
+        return (np.log((1 + n) / (1 + self._df)) + 1).astype(np.float32)
+
+    def _row_norms(self, idf):
+        if self._norms is None:
+            squared_idf = idf ** 2
+            base = self._base.power(2) @ squared_idf
+            delta = self._delta.power(2) @ squared_idf
+            self._norms = np.sqrt(np.concatenate([base, delta])).astype(np.float32)
+        return self._norms
+
+    def similar(self, text, k=10, owner_id=None, allowed_doc_ids=(), exclude_doc_id=None):
+        """
+        Top ``k`` (doc_id, score) by cosine similarity to ``text``, among
+        documents owned by ``owner_id`` or listed in ``allowed_doc_ids``
+        (any document when owner_id is None).
+        """
+        columns, values = vectorize(text)
+        if not len(columns) or not len(self._rows):
+            return []
+        idf = self._idf()
+        weights = values * idf[columns]
+        if len(columns) > MAX_QUERY_TERMS:
+            keep = np.argpartition(weights, -MAX_QUERY_TERMS)[-MAX_QUERY_TERMS:]
+            columns, weights = columns[keep], weights[keep]
+        query_norm = float(np.linalg.norm(weights))
+        # Row weights are tf * idf, so the dot product takes idf once more
+        weights = weights * idf[columns]
+
+        scores = np.concatenate([
+            self._base[:, columns] @ weights,
+            self._delta[:, columns] @ weights
+        ])
+        norms = self._row_norms(idf)
+
+        mask = self._live & (scores > 0)
+        if owner_id is not None:
+            mask &= (self._owners == owner_id) | np.isin(self._doc_ids, np.fromiter(allowed_doc_ids, dtype=np.int64))
+        if exclude_doc_id is not None and exclude_doc_id in self._rows:
+            mask[self._rows[exclude_doc_id]] = False
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        cosine = scores[candidates] / (norms[candidates] * query_norm)
+        if len(candidates) > k:
+            top = np.argpartition(cosine, -k)[-k:]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-cosine[top], kind='stable')]
+        return [(int(self._doc_ids[candidates[i]]), float(cosine[i])) for i in top]
@@ -0,0 +1,43 @@
+"""
+Rebuild the search index from the documents table.
+
+    python reindex.py                 # full rebuild into a shadow table, then swap
+    python reindex.py --resume        # continue the last interrupted rebuild
+    python reindex.py --status        # show progress of the latest job
+"""
+import argparse
+import json
+
+from app import create_app, db
+from app import reindex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resume', action='store_true', help='resume the last unfinished job')
+    parser.add_argument('--status', action='store_true', help='print the latest job and exit')
+    parser.add_argument('--batch-size', type=int, help='documents per batch (default REINDEX_BATCH_SIZE)')
+    parser.add_argument('--workers', type=int, help='extraction processes (default REINDEX_WORKERS)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.status:
+            job = reindex.latest_job()
+            print(json.dumps(job.to_dict() if job else None, indent=2))
+            return
+
+        try:
+            job = reindex.start_job(resume=args.resume)
+            reindex.run_job(
+                job.job_id,
+                storage_path=app.config['DOCUMENT_STORAGE_PATH'],
+                batch_size=args.batch_size or app.config['REINDEX_BATCH_SIZE'],
+                workers=app.config['REINDEX_WORKERS'] if args.workers is None else args.workers
+            )
+        finally:
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
+import os
 from app import create_app
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3003) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.getenv('SEARCH_SERVICE_PORT', 3003))) 
\ No newline at end of file
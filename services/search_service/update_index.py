@@ -1,57 +1,55 @@
-from app import create_app, db
-import psycopg2
+"""
+Incrementally sync the search index with the documents table.
+
+Only documents changed since the last run (by last_modified, doc_id) are
+re-indexed, and index entries for deleted documents are removed. Database
+URLs come from the same environment as the service.
+
+    python update_index.py                  # one sync
+    python update_index.py --loop 60        # sync every 60 seconds
+    python update_index.py --rebuild-terms  # also rebuild the typo-correction dictionary
+"""
+import argparse
 import json
+import time
+
+from app import create_app, db
+from app.fuzzy import rebuild_terms
+from app.sync import sync_once
 
-app = create_app()
-
-def update_index():
-    try:
-        # Connect to document service database
-        doc_conn = psycopg2.connect(
-            dbname='dSDocMgmtService',
-            user='emac',
-            host='localhost',
-            port='5432'
-        )
-        
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loop', type=int, metavar='SECONDS', help='keep running, syncing every SECONDS')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--skip-deletions', action='store_true', help='do not check for deleted documents')
+    parser.add_argument('--rebuild-terms', action='store_true', help='rebuild search_terms after each sync')
+    args = parser.parse_args()
+
+    app = create_app()
+    while True:
         with app.app_context():
-            with doc_conn.cursor() as cur:
-                # Get all documents
-                cur.execute("""
-                    SELECT doc_id, original_filename, file_type, file_path
-                    FROM documents
-                """)
-                
-                for doc in cur.fetchall():
-                    doc_id, original_filename, file_type, file_path = doc
-                    
-                    # Update or insert into search index
-                    db.session.execute("""
-                        INSERT INTO documentindex (doc_id, content_text, doc_metadata)
-                        VALUES (:doc_id, :content_text, :metadata)
-                        ON CONFLICT (doc_id) DO UPDATE SET
-                            content_text = :content_text,
-                            doc_metadata = :metadata,
-                            last_indexed = CURRENT_TIMESTAMP
-                    """, {
-                        'doc_id': doc_id,
-                        'content_text': original_filename,  # You might want to add actual file content here
-                        'metadata': json.dumps({
-                            'filename': original_filename,
-                            'file_type': file_type,
-                            'file_path': file_path
-                        })
-                    })
-                
-                db.session.commit()
-                print("Search index updated successfully")
-                
-    except Exception as e:
-        print(f"Error updating index: {str(e)}")
-        db.session.rollback()
-        raise
-    finally:
-        doc_conn.close()
+            try:
+                summary = sync_once(
+                    app.config['DOCUMENT_STORAGE_PATH'],
+                    batch_size=args.batch_size,
+                    detect_deletions=not args.skip_deletions
+                )
+                if summary is not None:
+                    print(json.dumps(summary, indent=2))
+                if args.rebuild_terms:
+                    rebuild_terms()
+            except Exception as e:
+                print(f"Error updating index: {str(e)}")
+                if not args.loop:
+                    raise
+            finally:
+                db.session.remove()
+
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
 
 if __name__ == "__main__":
-    update_index() 
\ No newline at end of file
+    main()
@@ -3,8 +3,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 import os
+import sys
 from dotenv import load_dotenv
 
+# The repository root, for the shared common/ package
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from common.health import health_blueprint, database_check, disk_check
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.logs import setup_logging
+from common.profiling import init_profiling
+
 # Load environment variables
 load_dotenv()
 
@@ -12,6 +24,7 @@ db = SQLAlchemy()
 jwt = JWTManager()
 
 def create_app():
+    setup_logging('share')
     app = Flask(__name__)
     
     # Configure database
@@ -28,6 +41,14 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False  # Tokens don't expire
     app.config['JWT_ERROR_MESSAGE_KEY'] = 'error'
+
+    # Signed download URLs (verified without a database lookup)
+    app.config['SIGNED_URL_SECRET'] = os.getenv('SIGNED_URL_SECRET') or os.getenv('SECRET_KEY')
+    app.config['SIGNED_URL_TTL'] = int(os.getenv('SIGNED_URL_TTL', 300))
+
+    # File serving: 'python', 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+    app.config['FILE_SERVING_MODE'] = os.getenv('FILE_SERVING_MODE', 'python')
+    app.config['X_ACCEL_PREFIX'] = os.getenv('X_ACCEL_PREFIX', '/_protected/shared')
     
     # CORS Configuration
     CORS(app, resources={
@@ -45,6 +66,11 @@ def create_app():
     
     # Register blueprints
     from app.routes import share_bp
+    from app.routes.shares import STORAGE_PATH
     app.register_blueprint(share_bp)
+    app.register_blueprint(health_blueprint('share', checks=[database_check(), disk_check(STORAGE_PATH)]))
+    init_metrics(app)
+    init_tracing(app, 'share')
+    init_profiling(app, 'share')
     
     return app
@@ -15,6 +15,7 @@ class SharedDocument(db.Model):
     expiry_date = db.Column(db.DateTime)
     status = db.Column(db.String(20), nullable=False, default='active')
     file_path = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64))  # SHA-256 of the shared copy
 
     def to_dict(self):
         return {
@@ -28,7 +29,8 @@ class SharedDocument(db.Model):
             'last_accessed': self.last_accessed.isoformat() if self.last_accessed else None,
             'expiry_date': self.expiry_date.isoformat() if self.expiry_date else None,
             'status': self.status,
-            'file_path': self.file_path
+            'file_path': self.file_path,
+            'content_hash': self.content_hash
         }
 
     def is_active(self):
@@ -2,29 +2,55 @@ from flask import request, jsonify, current_app, send_file, make_response
 from app import db
 from app.models.share import SharedDocument
 from app.utils.auth import require_auth
+from common.signing import (
+    sign_download, verify_download, parse_byte_range, InvalidSignature, SignatureExpired
+)
+from common.file_serving import OutsideStorageRoot, send_stored_file, send_signed_file
+from common.tracing import outgoing_headers
 from app.routes import share_bp
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 import logging
 import os
 import requests
 import traceback
-from sqlalchemy import text
 from pathlib import Path
 import shutil
 import mimetypes
+from datetime import datetime
 from flask_cors import cross_origin
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
 
 # Get storage path from environment variable, with a default fallback
 STORAGE_PATH = Path(os.getenv('STORAGE_PATH', 'DocStorageDocuments')).resolve()
 
+# Search service, told directly when shares change so cached results for the
+# affected users are dropped (it is not exposed through the gateway)
+SEARCH_SERVICE_URL = os.getenv('SEARCH_SERVICE_URL', f"http://127.0.0.1:{os.getenv('SEARCH_SERVICE_PORT', 3003)}")
+
+def invalidate_search_cache(user_ids):
+    """
+    Best effort: the search cache TTL bounds staleness if this fails.
+    """
+    try:
+        requests.post(
+            f"{SEARCH_SERVICE_URL}/cache/invalidate",
+            json={'user_ids': list(user_ids)},
+            headers=outgoing_headers(),
+            timeout=1
+        )
+    except requests.RequestException as e:
+        logger.error('Search cache invalidation failed: %s', e)
+
 @share_bp.route('/share', methods=['POST'])
 @require_auth
 def create_share(current_user):
     try:
-        print("Share Service: Starting share creation...")
+        logger.debug('Starting share creation...')
         
         data = request.get_json()
-        print(f"Share Service: Parsed JSON data: {data}")
+        logger.debug('Share request for document %s', data.get('doc_id'))
         
         # Check if share already exists
         existing_share = SharedDocument.query.filter_by(
@@ -35,7 +61,7 @@ def create_share(current_user):
         ).first()
         
         if existing_share:
-            print("Share Service: Share already exists, returning existing share")
+            logger.debug('Share already exists, returning existing share')
             return jsonify({
                 'message': 'Document is already shared with this user',
                 'share': existing_share.to_dict()
@@ -64,9 +90,9 @@ def create_share(current_user):
         # Copy the file
         try:
             shutil.copy2(source_path, shared_file_path)
-            print(f"Share Service: File copied from {source_path} to {shared_file_path}")
+            logger.debug('File copied from %s to %s', source_path, shared_file_path)
         except Exception as copy_error:
-            print(f"Share Service: Error copying file: {str(copy_error)}")
+            logger.error('Error copying file: %s', copy_error)
             return jsonify({'error': f'File copy failed: {str(copy_error)}'}), 500
         
         try:
@@ -79,25 +105,27 @@ def create_share(current_user):
                     display_name=data.get('display_name', original_filename),
                     original_filename=original_filename,
                     file_path=str(shared_file_path),  # Convert PosixPath to string
+                    content_hash=doc_metadata.get('content_hash'),
                     expiry_date=data.get('expiry_date'),
                     status='active'
                 )
                 
                 db.session.add(share)
                 db.session.commit()
+                invalidate_search_cache([share.owner_id, share.recipient_id])
                 
                 result = share.to_dict()
-                print(f"Share Service: Successfully created share: {result}")
+                logger.debug('Successfully created share: %s', result)
                 return jsonify(result), 201
                 
         except Exception as db_error:
-            print(f"Share Service: Database error: {str(db_error)}")
+            logger.error('Database error: %s', db_error)
             db.session.rollback()
             traceback.print_exc()
             return jsonify({'error': f'Database error: {str(db_error)}'}), 500
             
     except Exception as e:
-        print(f"Share Service Error: {str(e)}")
+        logger.error('Error in create_share: %s', e)
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -106,7 +134,7 @@ def create_share(current_user):
 def get_shared_with_me(current_user):
     try:
         recipient_id = current_user['user_id']
-        print(f"Share Service: Fetching shares for recipient ID: {recipient_id}")
+        logger.debug('Fetching shares for recipient ID: %s', recipient_id)
         
         shares = SharedDocument.query.filter_by(
             recipient_id=recipient_id,
@@ -128,11 +156,11 @@ def get_shared_with_me(current_user):
             }
             share_list.append(share_dict)
             
-        print(f"Share Service: Found {len(share_list)} shares")
+        logger.debug('Found %s shares', len(share_list))
         return jsonify({'shares': share_list}), 200
         
     except Exception as e:
-        print(f"Share Service Error: {str(e)}")
+        logger.error('Error in get_shared_with_me: %s', e)
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -141,7 +169,7 @@ def get_shared_with_me(current_user):
 def get_shared_by_me(current_user):
     try:
         owner_id = current_user['user_id']
-        print(f"Share Service: Fetching shares by owner ID: {owner_id}")
+        logger.debug('Fetching shares by owner ID: %s', owner_id)
         
         shares = SharedDocument.query.filter_by(
             owner_id=owner_id,
@@ -163,11 +191,11 @@ def get_shared_by_me(current_user):
             }
             share_list.append(share_dict)
             
-        print(f"Share Service: Found {len(share_list)} shares")
+        logger.debug('Found %s shares', len(share_list))
         return jsonify({'shares': share_list}), 200
         
     except Exception as e:
-        print(f"Share Service Error: {str(e)}")
+        logger.error('Error in get_shared_by_me: %s', e)
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -185,18 +213,6 @@ def update_share(share_id):
     db.session.commit()
     return jsonify(share.to_dict()) 
 
-@share_bp.route('/health', methods=['GET'])
-def health_check():
-    try:
-        # Test database connection with proper SQL text handling
-        with current_app.app_context():
-            db.session.execute(text('SELECT 1'))
-            db.session.commit()
-        return jsonify({'status': 'healthy'}), 200
-    except Exception as e:
-        print(f"Health check failed: {str(e)}")
-        return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
-
 @share_bp.route('/test', methods=['GET'])
 def test_endpoint():
     return jsonify({'status': 'Share service is running'}), 200 
@@ -205,7 +221,7 @@ def test_endpoint():
 @require_auth
 def get_shared_content(current_user, share_id):
     try:
-        print(f"Share Service: Accessing content for share_id {share_id} by user {current_user['user_id']}")
+        logger.debug('Accessing content for share_id %s by user %s', share_id, current_user['user_id'])
         
         # Get the share record
         share = SharedDocument.query.filter_by(
@@ -213,16 +229,15 @@ def get_shared_content(current_user, share_id):
             status='active'  # Only allow access to active shares
         ).first_or_404()
         
-        print(f"Share Service: Found share record: owner_id={share.owner_id}, recipient_id={share.recipient_id}")
+        logger.debug('Found share record: owner_id=%s, recipient_id=%s', share.owner_id, share.recipient_id)
         
         # Check access rights
         user_id = int(current_user['user_id'])  # Ensure integer comparison
         has_access = (int(share.owner_id) == user_id or int(share.recipient_id) == user_id)
-        print(f"Share Service: User {user_id} access check: {has_access}")
-        print(f"Share Service: Types - user_id: {type(user_id)}, owner_id: {type(share.owner_id)}, recipient_id: {type(share.recipient_id)}")
+        logger.debug('User %s access check: %s', user_id, has_access)
         
         if not has_access:
-            print(f"Share Service: Access denied for user {user_id}")
+            logger.debug('Access denied for user %s', user_id)
             return jsonify({
                 'error': 'Access denied',
                 'details': {
@@ -238,10 +253,10 @@ def get_shared_content(current_user, share_id):
         if not file_path.is_absolute():
             file_path = STORAGE_PATH / 'shared' / str(share.owner_id) / str(share.recipient_id) / f"{share.doc_id}_{share.original_filename}"
         
-        print(f"Share Service: Attempting to serve file from: {file_path}")
+        logger.debug('Attempting to serve file from: %s', file_path)
         
         if not file_path.exists():
-            print(f"Share Service: File not found at path: {file_path}")
+            logger.debug('File not found at path: %s', file_path)
             return jsonify({'error': 'File not found'}), 404
 
         # Get the file's mime type
@@ -249,19 +264,108 @@ def get_shared_content(current_user, share_id):
         if not mime_type:
             mime_type = 'application/octet-stream'
 
-        print(f"Share Service: Serving file with mime type: {mime_type}")
-        return send_file(
+        logger.debug('Serving file with mime type: %s', mime_type)
+        # Conditional so viewers get 206/304 for Range, If-None-Match and
+        # If-Modified-Since requests; the strong ETag is the owner's content
+        # hash copied at share time, Last-Modified the time of the copy.
+        # Offloaded to the front web server when FILE_SERVING_MODE is set.
+        return send_stored_file(
             file_path,
+            STORAGE_PATH,
             mimetype=mime_type,
             as_attachment=False,
-            download_name=share.original_filename
+            download_name=share.original_filename,
+            etag=share.content_hash or True,
+            last_modified=file_path.stat().st_mtime
         )
 
+    except OutsideStorageRoot as e:
+        # Shares copied before STORAGE_PATH moved can't be offloaded
+        logger.warning('Shared file %s: %s', share_id, e)
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
-        print(f"Share Service Error: {str(e)}")
+        logger.error('Error in get_shared_content: %s', e)
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@share_bp.route('/share/preview/<int:share_id>/signed-url', methods=['GET'])
+@require_auth
+def get_shared_signed_url(current_user, share_id):
+    """
+    Mint a short-lived signed URL for a shared file, so the client can fetch it
+    without another access check per request.
+    """
+    try:
+        share = SharedDocument.query.filter_by(
+            share_id=share_id,
+            status='active'
+        ).first()
+        if not share:
+            return jsonify({'error': 'Share not found'}), 404
+
+        user_id = int(current_user['user_id'])
+        if user_id not in (int(share.owner_id), int(share.recipient_id)):
+            return jsonify({'error': 'Access denied'}), 403
+
+        # Signed paths are relative to STORAGE_PATH
+        file_path = Path(share.file_path)
+        if not file_path.is_absolute():
+            file_path = STORAGE_PATH / 'shared' / str(share.owner_id) / str(share.recipient_id) / f"{share.doc_id}_{share.original_filename}"
+        try:
+            relative_path = file_path.resolve().relative_to(STORAGE_PATH)
+        except ValueError:
+            return jsonify({'error': 'File is outside the share storage'}), 404
+
+        byte_range = None
+        if request.args.get('range'):
+            try:
+                byte_range = parse_byte_range(request.args['range'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        max_ttl = current_app.config['SIGNED_URL_TTL']
+        ttl = min(request.args.get('ttl', max_ttl, type=int), max_ttl)
+
+        token, expires = sign_download(
+            current_app.config['SIGNED_URL_SECRET'],
+            'share',
+            doc_id=share.doc_id,
+            path=str(relative_path),
+            ttl=ttl,
+            byte_range=byte_range,
+            filename=share.original_filename,
+            mimetype=mimetypes.guess_type(share.original_filename)[0],
+            attachment=request.args.get('disposition') == 'attachment'
+        )
+
+        return jsonify({
+            'url': f"/share/signed/{token}",
+            'expires_at': datetime.utcfromtimestamp(expires).isoformat()
+        }), 200
+
+    except Exception as e:
+        logger.error('Error in get_shared_signed_url: %s', e)
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@share_bp.route('/share/signed/<token>', methods=['GET'])
+def get_signed_shared_file(token):
+    """
+    Serve a shared file from a signed URL without a database lookup.
+    """
+    try:
+        claims = verify_download(current_app.config['SIGNED_URL_SECRET'], 'share', token)
+    except SignatureExpired:
+        return jsonify({'error': 'Link has expired'}), 410
+    except InvalidSignature:
+        return jsonify({'error': 'Invalid signature'}), 403
+
+    file_path = safe_join(str(STORAGE_PATH), claims['path'])
+    if not file_path or not os.path.exists(file_path):
+        return jsonify({'error': 'File not found'}), 404
+
+    return send_signed_file(file_path, claims, STORAGE_PATH)
+
 @share_bp.route('/share/check-access/<int:doc_id>', methods=['GET'])
 @require_auth
 def check_file_access(current_user, doc_id):
@@ -294,7 +398,7 @@ def check_file_access(current_user, doc_id):
         }), 200
 
     except Exception as e:
-        print(f"Error checking file access: {str(e)}")
+        logger.error('Error checking file access: %s', e)
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500 
 
@@ -330,7 +434,7 @@ def get_shared_thumbnail(current_user, share_id):
         )
 
     except Exception as e:
-        print(f"Error serving shared thumbnail: {str(e)}")
+        logger.error('Error serving shared thumbnail: %s', e)
         return jsonify({'error': str(e)}), 500 
 
 @share_bp.route('/share/file/<int:doc_id>/metadata', methods=['GET'])
@@ -369,7 +473,7 @@ def get_shared_file_metadata(current_user, doc_id):
         })
         
     except Exception as e:
-        print(f"Error retrieving shared document metadata: {str(e)}")
+        logger.error('Error retrieving shared document metadata: %s', e)
         traceback.print_exc()
         return jsonify({'error': 'Internal server error'}), 500 
 
@@ -412,7 +516,7 @@ def get_all_shared_file_metadata(current_user):
         }), 200
         
     except Exception as e:
-        print(f"Error retrieving shared files metadata: {str(e)}")
+        logger.error('Error retrieving shared files metadata: %s', e)
         traceback.print_exc()
         return jsonify({'error': 'Internal server error'}), 500 
 
@@ -436,6 +540,6 @@ def debug_list_all_shares(current_user):
             'shares': shares_data
         }), 200
     except Exception as e:
-        print(f"Error in debug list: {str(e)}")
+        logger.error('Error in debug list: %s', e)
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500 
\ No newline at end of file
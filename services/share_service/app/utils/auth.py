@@ -2,14 +2,15 @@ from functools import wraps
 from flask import request, jsonify
 import jwt
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         try:
-            print("DEBUG - Starting token verification")
             auth_header = request.headers.get('Authorization')
-            print("DEBUG - Authorization header:", auth_header)
             
             if not auth_header or not auth_header.startswith('Bearer '):
                 raise Exception("No valid authorization header")
@@ -19,11 +20,10 @@ def require_auth(f):
             
             # Manually decode the token
             decoded = jwt.decode(token, secret_key, algorithms=['HS256'])
-            print("DEBUG - Decoded token:", decoded)
             
             # Get user_id from either sub or user_id claim
             user_id = decoded.get('sub') or decoded.get('user_id')
-            print("DEBUG - Extracted user_id:", user_id)
+            logger.debug('Extracted user_id: %s', user_id)
             
             if not user_id:
                 raise Exception("No user identifier found in token")
@@ -32,11 +32,9 @@ def require_auth(f):
                 'user_id': user_id,
                 'email': decoded.get('email')
             }
-            print("DEBUG - Current user:", current_user)
             
             return f(current_user=current_user, *args, **kwargs)
         except Exception as e:
-            print(f"Authentication error: {str(e)}")
-            print(f"Error type: {type(e)}")
+            logger.warning('Authentication error: %s', e)
             return jsonify({'error': f'Authentication failed: {str(e)}'}), 401
     return decorated 
\ No newline at end of file
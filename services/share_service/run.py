@@ -22,4 +22,4 @@ with app.app_context():
 
 if __name__ == '__main__':
     # Run the application
-    app.run(host='0.0.0.0', port=3004, debug=True)
+    app.run(host='0.0.0.0', port=int(os.getenv('SHARE_SERVICE_PORT', 3004)), debug=True)
@@ -1,4 +1,11 @@
+import argparse
+import selectors
+import signal
+import socket
 import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 from pathlib import Path
@@ -7,6 +14,7 @@ from typing import Dict, Any
 import threading
 import random
 import re
+import tempfile
 import time
 
 # ANSI color codes for terminal output
@@ -35,6 +43,25 @@ SERVICE_COLORS = {
     'System': COLORS['HEADER']  # For system messages
 }
 
+BASE_DIR = Path(__file__).parent
+FRONTEND_PORT = int(os.getenv('FRONTEND_PORT', 3000))
+GUNICORN_CONFIG = BASE_DIR / "deploy" / "gunicorn.conf.py"
+SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')
+
+# Environment variable prefix and default port of each backend service;
+# <PREFIX>_PORT, <PREFIX>_WORKERS and <PREFIX>_THREADS override them
+SERVICE_PORTS = {
+    'API Gateway': ('GATEWAY', 5000),
+    'Auth Service': ('AUTH_SERVICE', 3001),
+    'Doc Management Service': ('DOC_SERVICE', 3002),
+    'Search Service': ('SEARCH_SERVICE', 3003),
+    'Share Service': ('SHARE_SERVICE', 3004)
+}
+
+def service_port(name: str) -> int:
+    prefix, default = SERVICE_PORTS[name]
+    return int(os.getenv(f"{prefix}_PORT", default))
+
 def log(message: str, level: str = 'INFO', service: str = None, details: Dict[str, Any] = None) -> None:
     """Print formatted log message with timestamp and optional details"""
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]  # Include milliseconds
@@ -117,12 +144,14 @@ class ServiceStatus:
         self.services = {}
         self.lock = threading.Lock()
 
-    def update(self, name: str, status: str, pid: int = None, port: int = None):
+    def update(self, name: str, status: str, pid: int = None, port: int = None, ready_in: float = None):
         with self.lock:
+            previous = self.services.get(name, {})
             self.services[name] = {
                 'status': status,
-                'pid': pid,
-                'port': port,
+                'pid': pid or previous.get('pid'),
+                'port': port or previous.get('port'),
+                'ready_in': ready_in if ready_in is not None else previous.get('ready_in'),
                 'last_update': datetime.now()
             }
 
@@ -145,167 +174,327 @@ class ServiceStatus:
                     'TERMINATED': COLORS['MAGENTA']
                 }.get(info['status'], COLORS['WHITE'])
                 
+                ready_in = f"{info['ready_in']:.2f}s" if info['ready_in'] is not None else 'N/A'
                 print(f"  {service_color}{name:<25}{COLORS['ENDC']} - "
                       f"{status_color}{info['status']:<12}{COLORS['ENDC']} "
                       f"PID: {info['pid'] or 'N/A':<8} "
-                      f"Port: {info['port'] or 'N/A':<6}")
+                      f"Port: {info['port'] or 'N/A':<6} "
+                      f"Ready in: {ready_in}")
             
             print(f"{COLORS['HEADER']}{'='*80}{COLORS['ENDC']}\n")
 
-def stream_output(process, name, status_tracker, working_dir):
-    """Stream the output of a process to the console and update status"""
+class OutputPump:
+    """
+    Drain the stdout and stderr of every service from one thread, reading
+    whatever is available on each pipe without blocking, so a chatty stream
+    can never fill its pipe and stall a service.
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        self.thread = threading.Thread(target=self.run, name='output-pump', daemon=True)
+        self.thread.start()
+
+    def add(self, process, name, working_dir):
+        streams = ((process.stdout, 'INFO'), (process.stderr, 'ERROR'))
+        for stream, level in streams:
+            if stream is None:
+                continue
+            context = (name, level, process, working_dir)
+            if sys.platform == "win32":
+                # Windows pipes can't be selected on; read each on its own thread
+                threading.Thread(target=self.drain_blocking, args=(stream, context), daemon=True).start()
+                continue
+            os.set_blocking(stream.fileno(), False)
+            self.buffers[stream.fileno()] = b''
+            self.selector.register(stream, selectors.EVENT_READ, context)
+
+    def run(self):
+        while True:
+            if not self.selector.get_map():
+                time.sleep(0.1)
+                continue
+            for key, _ in self.selector.select(timeout=0.5):
+                self.read(key)
+
+    def read(self, key):
+        fd = key.fileobj.fileno()
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            # EOF: the process closed the pipe
+            self.selector.unregister(key.fileobj)
+            rest = self.buffers.pop(fd, b'')
+            if rest.strip():
+                self.emit(rest, key.data)
+            return
+        lines = (self.buffers[fd] + data).split(b'\n')
+        self.buffers[fd] = lines.pop()
+        for line in lines:
+            self.emit(line, key.data)
+
+    def drain_blocking(self, stream, context):
+        for line in iter(stream.readline, b''):
+            self.emit(line, context)
+
+    def emit(self, line: bytes, context):
+        name, level, process, working_dir = context
+        text = line.decode('utf-8', errors='replace').strip()
+        if not text:
+            return
+        details = None
+        if level == 'INFO':
+            details = {
+                'pid': process.pid,
+                'command': process.args,
+                'working_dir': str(working_dir)
+            }
+        log(redact_sensitive_info(text), level, name, details=details)
+
+def probe(url: str, timeout: float = 2.0):
+    """HTTP status of a GET to url, or None if nothing answered"""
     try:
-        running = False  # Track if service is already marked as running
-        for line in iter(process.stdout.readline, ''):
-            stripped_line = line.strip()
-            log(redact_sensitive_info(stripped_line), 
-                "INFO", 
-                name,
-                details={
-                    'pid': process.pid,
-                    'command': process.args,
-                    'working_dir': str(working_dir)
-                }
-            )
-            
-            # Don't process startup messages if already running
-            if not running:
-                port = None
-                
-                # Check for Flask "Running on" message
-                if "Running on http://" in stripped_line:
-                    port_match = re.search(r":(\d+)", stripped_line)
-                    if port_match:
-                        port = int(port_match.group(1))
-                        running = True
-                
-                # Check for Next.js startup message
-                elif "Local:        http://localhost:" in stripped_line:
-                    port_match = re.search(r":(\d+)", stripped_line)
-                    if port_match:
-                        port = int(port_match.group(1))
-                        running = True
-                
-                # Check for Flask startup completion
-                elif any([
-                    "* Debug mode: on" in stripped_line,
-                    "* Debug mode: off" in stripped_line
-                ]):
-                    # For Flask apps, check if we have a predefined port
-                    if name == "API Gateway":
-                        port = 5000
-                    elif name == "Auth Service":
-                        port = 3001
-                    elif name == "Doc Management Service":
-                        port = 3002
-                    elif name == "Search Service":
-                        port = 3003
-                    elif name == "Share Service":
-                        port = 3004
-                    running = True
-                
-                if running:
-                    status_tracker.update(name, "RUNNING", process.pid, port)
-                    status_tracker.print_status()
-        
-        for line in iter(process.stderr.readline, ''):
-            log(redact_sensitive_info(line.strip()), "ERROR", name)
-            
-    except Exception as e:
-        log(f"Output stream error: {str(e)}", "ERROR", name)
-        status_tracker.update(name, "FAILED")
-        status_tracker.print_status()
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return None
 
-def start_services():
-    status_tracker = ServiceStatus()
-    base_dir = Path(__file__).parent
+def wait_until_ready(service, process, deadline: float) -> bool:
+    """
+    Poll the service's health URL with exponential backoff until it answers
+    with a ready status, the process exits or the deadline passes.
+    """
+    delay = 0.1
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        status = probe(service["health_url"])
+        if status is not None and status < service.get("ready_below", 400):
+            return True
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 2.0)
+    return False
+
+def wait_for_database(deadline: float) -> bool:
+    """Wait for Postgres at DB_HOST:DB_PORT to accept connections (skipped if DB_HOST is unset)"""
+    host = os.getenv('DB_HOST')
+    if not host:
+        return True
+    port = int(os.getenv('DB_PORT', 5432))
+    delay = 0.1
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+    return False
+
+def base_env() -> Dict[str, str]:
+    """Environment shared by all services: ports and the URLs they reach each other on"""
+    env = os.environ.copy()
+    for name, (prefix, _) in SERVICE_PORTS.items():
+        port = service_port(name)
+        env.setdefault(f"{prefix}_PORT", str(port))
+        if prefix != 'GATEWAY':
+            env.setdefault(f"{prefix}_URL", f"http://{SERVICE_HOST}:{port}")
+    return env
+
+def gunicorn_env(name: str, env: Dict[str, str]) -> Dict[str, str]:
+    """Settings read by deploy/gunicorn.conf.py for one service"""
+    prefix, _ = SERVICE_PORTS[name]
+    env = dict(env)
+    env['GUNICORN_BIND'] = f"{SERVICE_HOST}:{service_port(name)}"
+    env['GUNICORN_PROC_NAME'] = name.lower().replace(' ', '-')
+    # Where the workers leave their metrics for /metrics to merge; one per service
+    env['METRICS_DIR'] = os.path.join(
+        os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'docstorage-metrics'),
+        env['GUNICORN_PROC_NAME']
+    )
+    for setting in ('WORKERS', 'THREADS'):
+        if os.getenv(f"{prefix}_{setting}"):
+            env[f"GUNICORN_{setting}"] = os.environ[f"{prefix}_{setting}"]
+    # The embedded inverted index can only be open in one process
+    if prefix == 'SEARCH_SERVICE' and env.get('SEARCH_BACKEND') == 'inverted':
+        if env.get('GUNICORN_WORKERS', '1') != '1':
+            log("SEARCH_BACKEND=inverted runs a single worker", "WARNING", name)
+        env['GUNICORN_WORKERS'] = '1'
+    return env
 
-    # Service configurations with ports
+# Started in order, each stage concurrently once the previous one is ready
+# (the database is waited for before the first)
+STARTUP_STAGES = [
+    ['Auth Service'],
+    ['Doc Management Service', 'Search Service', 'Share Service', 'Frontend'],
+    ['API Gateway']
+]
+
+def build_services(prod: bool = False):
+    """Service configurations: dev servers, or gunicorn masters with prod"""
+    env = base_env()
     services = [
         {
             "name": "API Gateway",
-            "dir": base_dir,
-            "command": [get_venv_python(), "main.py"],
-            "env": os.environ.copy(),
-            "port": 5000
+            "dir": BASE_DIR,
+            "script": "main.py",
+            "app": "main:app"
         },
         {
             "name": "Frontend",
-            "dir": base_dir / "frontend",
-            "command": [get_venv_npm(), "run", "dev"],
-            "env": os.environ.copy()
+            "dir": BASE_DIR / "frontend",
+            # next start serves the output of `npm run build`
+            "command": [get_venv_npm(), "run", "start" if prod else "dev"],
+            "env": env
         },
         {
             "name": "Auth Service",
-            "dir": base_dir / "services" / "auth_service",
-            "command": [get_venv_python(), "run.py"],
-            "env": os.environ.copy()
+            "dir": BASE_DIR / "services" / "auth_service",
+            "script": "run.py",
+            "app": "run:app"
         },
         {
             "name": "Doc Management Service",
-            "dir": base_dir / "services" / "doc_mgmt_service",
-            "command": [get_venv_python(), "run.py"],
-            "env": os.environ.copy()
+            "dir": BASE_DIR / "services" / "doc_mgmt_service",
+            "script": "run.py",
+            "app": "run:app"
         },
         {
             "name": "Search Service",
-            "dir": base_dir / "services" / "search_service",
-            "command": [get_venv_python(), "run.py"],
-            "env": os.environ.copy()
+            "dir": BASE_DIR / "services" / "search_service",
+            "script": "run.py",
+            "app": "run:app"
         },
         {
             "name": "Share Service",
-            "dir": base_dir / "services" / "share_service",
-            "command": [get_venv_python(), "run.py"],
-            "env": os.environ.copy()
+            "dir": BASE_DIR / "services" / "share_service",
+            "script": "run.py",
+            "app": "run:app"
         }
     ]
 
+    for service in services:
+        if service["name"] not in SERVICE_PORTS:
+            service["port"] = FRONTEND_PORT
+            service["health_url"] = f"http://localhost:{FRONTEND_PORT}/"
+            # Any page the dev server renders, even an error page, means it is up
+            service["ready_below"] = 500
+            continue
+        service["port"] = service_port(service["name"])
+        service["health_url"] = f"http://{SERVICE_HOST}:{service['port']}/ready"
+        if prod:
+            service["command"] = [get_venv_python(), "-m", "gunicorn", "--config", str(GUNICORN_CONFIG), service["app"]]
+            service["env"] = gunicorn_env(service["name"], env)
+        else:
+            service["command"] = [get_venv_python(), service["script"]]
+            service["env"] = env
+    return services
+
+def reload_services(processes, status_tracker):
+    """Forward SIGHUP to the gunicorn masters: graceful worker restart"""
+    for name, process, _ in processes:
+        if name in SERVICE_PORTS and process.poll() is None:
+            process.send_signal(signal.SIGHUP)
+            log("Reloading workers", "INFO", name)
+    status_tracker.print_status()
+
+def start_services(prod: bool = False):
+    status_tracker = ServiceStatus()
+    services = build_services(prod)
+
+    if prod and sys.platform == "win32":
+        log("--prod needs gunicorn, which does not run on Windows", "ERROR", "System")
+        return
+
     processes = []
-    startup_timeout = 30  # seconds
+    startup_timeout = int(os.getenv('STARTUP_TIMEOUT', 60))  # seconds per stage
+    # gunicorn finishes in-flight requests on SIGTERM; give it time to
+    shutdown_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30)) + 5 if prod else 5
+    pump = OutputPump()
+    by_name = {service["name"]: service for service in services}
+    started_at = time.monotonic()
 
-    # Start all services
-    for service in services:
-        status_tracker.update(service["name"], "STARTING")
+    def abort(reason: str):
+        log(reason, "ERROR", "System")
+        log("Initiating shutdown due to startup failure", "ERROR", "System")
+        for name, proc, _ in processes:
+            try:
+                status_tracker.update(name, "TERMINATING")
+                proc.terminate()
+                proc.wait(timeout=shutdown_timeout)
+                status_tracker.update(name, "TERMINATED")
+            except Exception as term_e:
+                proc.kill()
+                log(f"Error terminating {name}: {str(term_e)}", "ERROR", "System")
+                status_tracker.update(name, "FAILED")
         status_tracker.print_status()
-        
-        try:
-            working_dir = service["dir"]  # Store the working directory
-            process = subprocess.Popen(
-                service["command"],
-                cwd=working_dir,
-                env=service["env"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
+
+    log("Waiting for the database", "INFO", "System")
+    if not wait_for_database(time.monotonic() + startup_timeout):
+        abort(f"Database at {os.getenv('DB_HOST')}:{os.getenv('DB_PORT', 5432)} is not accepting connections")
+        return
+
+    # Start each stage's services together, then wait for all of them to
+    # pass their health check before starting the next stage
+    for stage in STARTUP_STAGES:
+        stage_started = {}
+        for name in stage:
+            service = by_name[name]
+            status_tracker.update(name, "STARTING", port=service.get("port"))
+            try:
+                working_dir = service["dir"]  # Store the working directory
+                process = subprocess.Popen(
+                    service["command"],
+                    cwd=working_dir,
+                    env=service["env"],
+                    stdout=subprocess.PIPE,
+                    # gunicorn logs to stderr; merge it with its access log
+                    stderr=subprocess.STDOUT if prod else subprocess.PIPE
+                )
+            except Exception as e:
+                status_tracker.update(name, "FAILED")
+                abort(f"Failed to start {name}: {str(e)}")
+                return
             # Store working_dir along with the process
-            processes.append((service["name"], process, working_dir))
-            threading.Thread(
-                target=stream_output, 
-                args=(process, service["name"], status_tracker, working_dir)  # Pass working_dir
-            ).start()
-            
-        except Exception as e:
-            log(f"Failed to start {service['name']}: {str(e)}", "ERROR", "System")
-            status_tracker.update(service["name"], "FAILED")
-            status_tracker.print_status()
-            
-            # Terminate all running services if any fails to start
-            log("Initiating shutdown due to startup failure", "ERROR", "System")
-            for name, proc, _ in processes:  # Update to unpack 3 values
-                try:
-                    status_tracker.update(name, "TERMINATING")
-                    proc.terminate()
-                    proc.wait(timeout=5)
-                    status_tracker.update(name, "TERMINATED")
-                except Exception as term_e:
-                    log(f"Error terminating {name}: {str(term_e)}", "ERROR", "System")
+            processes.append((name, process, working_dir))
+            pump.add(process, name, working_dir)
+            status_tracker.update(name, "STARTING", process.pid)
+            stage_started[name] = (process, time.monotonic())
+        status_tracker.print_status()
+
+        deadline = time.monotonic() + startup_timeout
+        with ThreadPoolExecutor(max_workers=len(stage_started)) as executor:
+            futures = {
+                name: executor.submit(wait_until_ready, by_name[name], process, deadline)
+                for name, (process, _) in stage_started.items()
+            }
+            failed = []
+            for name, future in futures.items():
+                process, launched = stage_started[name]
+                if future.result():
+                    ready_in = time.monotonic() - launched
+                    status_tracker.update(name, "RUNNING", ready_in=ready_in)
+                    log(f"Ready in {ready_in:.2f}s", "SUCCESS", name)
+                else:
                     status_tracker.update(name, "FAILED")
-            
-            status_tracker.print_status()
+                    failed.append(name)
+        status_tracker.print_status()
+        if failed:
+            abort(f"Not ready within {startup_timeout}s: {', '.join(failed)}")
             return
 
+    log(f"All services ready in {time.monotonic() - started_at:.2f}s", "SUCCESS", "System")
+
+    if prod and hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_services(processes, status_tracker))
+        log(f"Production mode: kill -HUP {os.getpid()} reloads the service workers", "INFO", "System")
+
     # Monitor processes
     try:
         while True:
@@ -327,7 +516,7 @@ def start_services():
         for name, process, _ in processes:  # Update to unpack 3 values
             try:
                 process.terminate()
-                process.wait(timeout=5)  # Wait up to 5 seconds for graceful shutdown
+                process.wait(timeout=shutdown_timeout)  # Wait for graceful shutdown
                 terminated_services.append(name)
                 log(f"Successfully terminated {name}", "SUCCESS", "System")
             except subprocess.TimeoutExpired:
@@ -355,4 +544,8 @@ def start_services():
         print(f"{COLORS['HEADER']}{'='*80}{COLORS['ENDC']}")
 
 if __name__ == "__main__":
-    start_services()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Start the DocStorage services")
+    parser.add_argument('--prod', action='store_true',
+                        help='run the backend services under gunicorn (see deploy/gunicorn.conf.py)')
+    args = parser.parse_args()
+    start_services(prod=args.prod)
\ No newline at end of file
@@ -0,0 +1,21 @@
+import importlib.util
+import os
+import sys
+
+# The repository root, so tests import the shared common/ package normally
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def load_service_module(relpath):
+    """
+    Load a service module from its file, ``relpath`` being relative to the
+    repository root. Every service's package is named ``app``, so service
+    code cannot be imported by name side by side.
+    """
+    name = os.path.splitext(relpath)[0].replace('/', '_')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT_DIR, relpath))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,51 @@
+import pytest
+
+from common import breaker
+
+def fail():
+    raise ConnectionError('connection refused')
+
+def test_opens_after_failures_and_fails_fast():
+    circuit = breaker.CircuitBreaker('share', error_rate=0.5, min_calls=4, window=10, open_seconds=60)
+    calls = []
+
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            circuit.call(fail)
+    assert circuit.state == breaker.OPEN
+
+    # Open: the function is not called at all
+    with pytest.raises(breaker.CircuitOpen) as error:
+        circuit.call(calls.append, 1)
+    assert calls == []
+    assert 0 < error.value.retry_after <= 60
+
+def test_classified_and_slow_results_count_as_failures():
+    circuit = breaker.CircuitBreaker(
+        'search', error_rate=1.0, min_calls=2, window=2, slow_seconds=0,
+        is_failure=lambda status: status >= 500
+    )
+
+    # Exempt from the latency threshold
+    assert circuit.call(lambda: 200, slow_seconds=None) == 200
+    assert circuit.call(lambda: 503) == 503
+    assert circuit.state == breaker.CLOSED
+    circuit.call(lambda: 200)
+    assert circuit.state == breaker.OPEN
+
+def test_half_open_probe_closes_or_reopens():
+    circuit = breaker.CircuitBreaker('docs', min_calls=1, window=5, open_seconds=60)
+    with pytest.raises(ConnectionError):
+        circuit.call(fail)
+
+    # Once the open period is over one probe goes through
+    circuit.opened_at -= 60
+    with pytest.raises(ConnectionError):
+        circuit.call(fail)
+    assert circuit.state == breaker.OPEN
+    assert circuit.times_opened == 2
+
+    circuit.opened_at -= 60
+    assert circuit.call(lambda: 'ok') == 'ok'
+    assert circuit.state == breaker.CLOSED
+    assert circuit.snapshot()['recent_calls'] == 0
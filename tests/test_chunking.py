@@ -0,0 +1,19 @@
+from conftest import load_service_module
+
+chunking = load_service_module('services/search_service/app/utils/chunking.py')
+
+def test_chunks_follow_pages():
+    text = 'report.pdf first page\fsecond page\f\fforth page'
+    chunks = chunking.chunk_text(text, max_chars=100)
+
+    # Empty pages produce no chunk but still count
+    assert chunks == [(1, 'report.pdf first page'), (2, 'second page'), (4, 'forth page')]
+
+def test_long_text_is_cut_at_whitespace():
+    text = ' '.join(f'word{i}' for i in range(1000))
+    chunks = chunking.chunk_text(text, max_chars=50)
+
+    assert all(page is None for page, _ in chunks)
+    assert all(len(chunk) <= 50 for _, chunk in chunks)
+    assert ''.join(chunk for _, chunk in chunks) == text
+    assert all(not chunk.rstrip().endswith('word') for _, chunk in chunks)
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+from flask import Flask
+
+from common import file_serving, signing
+
+SECRET = 'test-secret'
+
+def make_app(mode='python'):
+    app = Flask(__name__)
+    app.config['FILE_SERVING_MODE'] = mode
+    app.config['X_ACCEL_PREFIX'] = '/_protected/documents/'
+    return app
+
+def write_blob(tmp_path):
+    user_dir = tmp_path / '3'
+    user_dir.mkdir()
+    file_path = user_dir / 'report.pdf'
+    file_path.write_bytes(bytes(range(100)))
+    return str(file_path)
+
+def test_python_mode_handles_ranges(tmp_path):
+    file_path = write_blob(tmp_path)
+    with make_app().test_request_context(headers={'Range': 'bytes=0-9'}):
+        response = file_serving.send_stored_file(file_path, str(tmp_path), etag='abc')
+        response.direct_passthrough = False
+
+        assert response.status_code == 206
+        assert response.get_data() == bytes(range(10))
+        assert response.headers['ETag'] == '"abc"'
+
+def test_x_accel_redirect_mode_sends_headers_only(tmp_path):
+    file_path = write_blob(tmp_path)
+    with make_app('x-accel-redirect').test_request_context():
+        response = file_serving.send_stored_file(
+            file_path, str(tmp_path), mimetype='application/pdf', download_name='My Report.pdf', etag='abc'
+        )
+
+        assert response.status_code == 200
+        assert response.get_data() == b''
+        assert response.headers['X-Accel-Redirect'] == '/_protected/documents/3/report.pdf'
+        assert response.headers['Content-Type'] == 'application/pdf'
+        assert 'My Report.pdf' in response.headers['Content-Disposition']
+
+def test_x_accel_redirect_answers_revalidation_itself(tmp_path):
+    file_path = write_blob(tmp_path)
+    with make_app('x-accel-redirect').test_request_context(headers={'If-None-Match': '"abc"'}):
+        response = file_serving.send_stored_file(file_path, str(tmp_path), etag='abc')
+
+        assert response.status_code == 304
+        assert 'X-Accel-Redirect' not in response.headers
+
+def test_x_accel_redirect_refuses_files_outside_the_root(tmp_path):
+    file_path = write_blob(tmp_path)
+    with make_app('x-accel-redirect').test_request_context():
+        with pytest.raises(file_serving.OutsideStorageRoot):
+            file_serving.send_stored_file(file_path, str(tmp_path / 'shared'))
+
+def test_x_sendfile_mode_uses_absolute_path(tmp_path):
+    file_path = write_blob(tmp_path)
+    with make_app('x-sendfile').test_request_context():
+        response = file_serving.send_stored_file(file_path, str(tmp_path))
+
+        assert response.headers['X-Sendfile'] == os.path.abspath(file_path)
+
+def test_signed_byte_range_is_served_partially(tmp_path):
+    file_path = write_blob(tmp_path)
+    token, _ = signing.sign_download(SECRET, 'docs', 1, '3/report.pdf', byte_range=(10, 19))
+    claims = signing.verify_download(SECRET, 'docs', token)
+
+    # Range-bound tokens stay in Python even when offloading is on
+    with make_app('x-accel-redirect').test_request_context():
+        response = file_serving.send_signed_file(file_path, claims, str(tmp_path))
+        body = b''.join(response.response)
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 10-19/100'
+    assert response.cache_control.private
+    assert body == bytes(range(10, 20))
+
+def test_signed_file_without_range_is_cached_until_expiry(tmp_path):
+    file_path = write_blob(tmp_path)
+    token, _ = signing.sign_download(SECRET, 'docs', 1, '3/report.pdf', ttl=120)
+    claims = signing.verify_download(SECRET, 'docs', token)
+
+    with make_app().test_request_context():
+        response = file_serving.send_signed_file(file_path, claims, str(tmp_path))
+        response.direct_passthrough = False
+
+        assert response.status_code == 200
+        assert response.get_data() == bytes(range(100))
+        assert response.cache_control.private
+        assert 0 < response.cache_control.max_age <= 180
+
+def test_offloaded_file_answers_if_modified_since(tmp_path):
+    file_path = write_blob(tmp_path)
+    mtime = os.stat(file_path).st_mtime
+    with make_app('x-accel-redirect').test_request_context():
+        response = file_serving.send_stored_file(file_path, str(tmp_path), last_modified=mtime)
+        last_modified = response.headers['Last-Modified']
+    with make_app('x-accel-redirect').test_request_context(headers={'If-Modified-Since': last_modified}):
+        response = file_serving.send_stored_file(file_path, str(tmp_path), last_modified=mtime)
+
+        assert response.status_code == 304
@@ -0,0 +1,34 @@
+from flask import Flask
+
+from common import health
+
+def make_client(checks):
+    app = Flask(__name__)
+    app.register_blueprint(health.health_blueprint('test', checks=checks))
+    return app.test_client()
+
+def test_ready_reports_each_check(tmp_path):
+    client = make_client([health.disk_check(str(tmp_path), min_free_bytes=0)])
+
+    assert client.get('/health').get_json()['status'] == 'healthy'
+    response = client.get('/ready')
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['checks']['disk']['ok']
+    assert body['checks']['requests']['in_flight'] == 0
+
+def test_failing_check_makes_service_unavailable(tmp_path):
+    def broken():
+        raise RuntimeError('connection refused')
+
+    client = make_client([
+        health.disk_check(str(tmp_path / 'missing'), min_free_bytes=0),
+        ('database', broken)
+    ])
+
+    response = client.get('/ready')
+    body = response.get_json()
+    assert response.status_code == 503
+    assert body['status'] == 'unavailable'
+    assert not body['checks']['disk']['ok']
+    assert body['checks']['database'] == {'ok': False, 'error': 'connection refused'}
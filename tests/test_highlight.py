@@ -0,0 +1,20 @@
+from conftest import load_service_module
+
+highlight = load_service_module('services/search_service/app/utils/highlight.py')
+
+def test_parse_headline_offsets():
+    marked = f"the {highlight.START_SEL}quarterly{highlight.STOP_SEL} report for {highlight.START_SEL}Q3{highlight.STOP_SEL}"
+    snippet, highlights = highlight.parse_headline(marked)
+
+    assert snippet == 'the quarterly report for Q3'
+    assert highlights == [[4, 13], [25, 27]]
+    assert [snippet[start:end] for start, end in highlights] == ['quarterly', 'Q3']
+
+def test_parse_headline_without_matches():
+    assert highlight.parse_headline(None) == ('', [])
+    assert highlight.parse_headline('plain text') == ('plain text', [])
+
+def test_headline_options_use_markers():
+    options = highlight.headline_options(max_fragments=3)
+    assert f'StartSel="{highlight.START_SEL}"' in options
+    assert 'MaxFragments=3' in options
@@ -0,0 +1,73 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import load_service_module
+
+inverted_index = load_service_module('services/search_service/app/utils/inverted_index.py')
+
+
+def make_doc(doc_id, content, filename, owner_id=1, file_family='pdf', month=1):
+    return {
+        'doc_id': doc_id,
+        'content_text': content,
+        'doc_metadata': {'original_filename': filename, 'user_id': owner_id},
+        'owner_id': owner_id,
+        'file_family': file_family,
+        'file_type': 'application/pdf' if file_family == 'pdf' else 'text/plain',
+        'upload_date': datetime(2024, month, 15)
+    }
+
+def test_varint_positions_round_trip():
+    positions = [0, 3, 127, 128, 20000, 3000000]
+    blob = inverted_index.encode_positions(positions)
+
+    assert inverted_index.decode_positions(blob, 0, len(positions)) == positions
+    assert len(blob) < 4 * len(positions)
+
+def test_phrases_exclusions_and_filename_matches(tmp_path):
+    index = inverted_index.InvertedIndex(str(tmp_path), background_merge=False)
+    index.add_documents([
+        make_doc(1, 'The quarterly revenue report grew', 'summary.pdf'),
+        make_doc(2, 'Revenue fell; the report was late', 'notes.txt', file_family='text', month=2),
+        make_doc(3, 'Nothing relevant here', 'revenue_report.pdf', owner_id=2)
+    ])
+
+    assert [r['doc_id'] for r in index.search('"revenue report"')['results']] == [3, 1]
+    assert [r['doc_id'] for r in index.search('revenue report -late')['results']] == [3, 1]
+
+    found = index.search('revenue report', user_id=1, families=['text'])
+    assert [r['doc_id'] for r in found['results']] == [2]
+    assert found['facets'] == {'file_type': {'text': 1}, 'upload_month': {'2024-02': 1}}
+
+    snippet = found['results'][0]
+    assert [snippet['snippet'][start:end] for start, end in snippet['highlights']] == ['Revenue', 'report']
+
+def test_updates_deletes_and_merges_survive_reopen(tmp_path):
+    index = inverted_index.InvertedIndex(str(tmp_path), merge_factor=2, background_merge=False)
+    for doc_id in range(1, 6):
+        index.add_documents([make_doc(doc_id, f'common word{doc_id}', f'file{doc_id}.pdf')])
+    assert index.add_documents([make_doc(2, 'rewritten', 'file2.pdf')]) == {2: 'updated'}
+    assert index.delete_documents([3, 99]) == {3: 1}
+    assert index.stats()['segments'] <= 2
+    index.close()
+
+    reopened = inverted_index.InvertedIndex(str(tmp_path), background_merge=False)
+    assert len(reopened) == 4
+    assert reopened.search('common')['total'] == 3
+    assert reopened.search('rewritten')['total'] == 1
+
+    reopened.merge_once(force=True)
+    stats = reopened.stats()
+    assert (stats['segments'], stats['deleted'], stats['documents']) == (1, 0, 4)
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.seg')]) == 1
+
+def test_second_process_cannot_open_the_directory(tmp_path):
+    index = inverted_index.InvertedIndex(str(tmp_path), background_merge=False)
+    # flock conflicts between separate opens of the file, as across processes
+    with pytest.raises(inverted_index.IndexLocked):
+        inverted_index.InvertedIndex(str(tmp_path), background_merge=False)
+
+    index.close()
+    inverted_index.InvertedIndex(str(tmp_path), background_merge=False).close()
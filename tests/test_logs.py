@@ -0,0 +1,71 @@
+import json
+import logging
+import queue
+
+from flask import Flask
+
+from common import logs, tracing
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_records_are_json_with_request_id_and_extra_fields():
+    handler = logs._QueueHandler(queue.SimpleQueue())
+    logger = logging.getLogger('test_logs.upload')
+    logger.addHandler(handler)
+    logger.propagate = False
+    app = Flask(__name__)
+
+    @app.route('/upload')
+    def upload():
+        logger.warning('Upload of %s failed', 'report.pdf', extra={'doc_id': 7})
+        try:
+            raise OSError('disk full')
+        except OSError:
+            logger.exception('Could not write %s', 'report.pdf')
+        return 'ok'
+
+    tracing.init_tracing(app, 'docs', sample_rate=0)
+    app.test_client().get('/upload', headers={'X-Request-ID': 'req-1'})
+    logger.removeHandler(handler)
+
+    formatter = logs.JsonFormatter('docs')
+    warning = json.loads(formatter.format(handler.queue.get_nowait()))
+    error = json.loads(formatter.format(handler.queue.get_nowait()))
+
+    assert warning['msg'] == 'Upload of report.pdf failed'
+    assert warning['level'] == 'WARNING'
+    assert warning['service'] == 'docs'
+    assert warning['request_id'] == 'req-1'
+    assert warning['doc_id'] == 7
+    assert 'exc' not in warning
+    assert error['request_id'] == 'req-1'
+    assert 'OSError: disk full' in error['exc']
+
+def test_debug_records_are_rate_limited_per_call_site():
+    clock = FakeClock()
+    sampler = logs.DebugSampler(rate=1.0, per_second=2, clock=clock)
+
+    def record(level, lineno=10):
+        return logging.LogRecord('app.routes.search', level, 'search.py', lineno, 'Found %s', (3,), None)
+
+    assert [sampler.filter(record(logging.DEBUG)) for _ in range(5)] == [True, True, False, False, False]
+    # Other call sites and levels are unaffected
+    assert sampler.filter(record(logging.DEBUG, lineno=20))
+    assert sampler.filter(record(logging.INFO))
+
+    clock.now = 1.0
+    allowed = record(logging.DEBUG)
+    assert sampler.filter(allowed)
+    assert allowed.suppressed == 3
+    assert logs.DebugSampler(rate=0, per_second=0).filter(record(logging.DEBUG)) is False
+
+def test_per_logger_levels_are_parsed():
+    assert logs.parse_levels('app.routes.search=debug, werkzeug=WARNING,,bad') == {
+        'app.routes.search': 'DEBUG',
+        'werkzeug': 'WARNING'
+    }
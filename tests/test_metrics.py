@@ -0,0 +1,73 @@
+import json
+
+from flask import Flask
+
+from common import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    latency = metrics.Histogram('job_seconds', 'Job time.', ['job'], buckets=(0.1, 1), registry=registry)
+    for value in (0.05, 0.5, 0.5, 3):
+        latency.observe(value, ('thumbnail',))
+    metrics.Gauge('cache_hit_ratio', 'Hit ratio.', callback=lambda: 0.75, registry=registry)
+
+    lines = registry.render().splitlines()
+    assert '# TYPE job_seconds histogram' in lines
+    assert 'job_seconds_bucket{job="thumbnail",le="0.1"} 1' in lines
+    assert 'job_seconds_bucket{job="thumbnail",le="1"} 3' in lines
+    assert 'job_seconds_bucket{job="thumbnail",le="+Inf"} 4' in lines
+    assert 'job_seconds_count{job="thumbnail"} 4' in lines
+    assert 'job_seconds_sum{job="thumbnail"} 4.05' in lines
+    assert 'cache_hit_ratio 0.75' in lines
+
+def test_requests_are_counted_per_route():
+    app = Flask(__name__)
+
+    @app.route('/docs/<int:doc_id>')
+    def get_doc(doc_id):
+        return 'ok'
+
+    metrics.init_metrics(app)
+    client = app.test_client()
+    client.get('/docs/1')
+    client.get('/docs/2')
+    client.get('/missing')
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{method="GET",route="/docs/<int:doc_id>",status="200"} 2' in body
+    assert 'http_requests_total{method="GET",route="<unmatched>",status="404"} 1' in body
+    # Only the /metrics request itself
+    assert 'http_requests_in_flight 1' in body
+
+def test_workers_are_merged_through_the_metrics_dir(tmp_path):
+    def worker_registry():
+        registry = metrics.Registry(str(tmp_path))
+        requests = metrics.Counter('requests_total', 'Requests.', ['route'], registry=registry)
+        in_flight = metrics.Gauge('in_flight', 'In flight.', registry=registry)
+        started = metrics.Gauge('started', 'Start time.', registry=registry, multiprocess_mode='min')
+        return registry, requests, in_flight, started
+
+    this, requests, in_flight, started = worker_registry()
+    requests.inc(('/docs',), 2)
+    in_flight.set(1)
+    started.set(200)
+
+    # Another worker of the same service, as its flush would leave it
+    other, other_requests, other_in_flight, other_started = worker_registry()
+    other_requests.inc(('/docs',), 3)
+    other_in_flight.set(4)
+    other_started.set(100)
+    (tmp_path / '99999.json').write_text(json.dumps(other.snapshot()))
+
+    lines = this.render().splitlines()
+    assert 'requests_total{route="/docs"} 5' in lines
+    assert 'in_flight 5' in lines
+    assert 'started 100' in lines
+
+    # Its counters outlive it, its gauges don't
+    metrics.mark_process_dead(99999, str(tmp_path))
+    assert not (tmp_path / '99999.json').exists()
+    lines = this.render().splitlines()
+    assert 'requests_total{route="/docs"} 5' in lines
+    assert 'in_flight 1' in lines
+    assert 'started 200' in lines
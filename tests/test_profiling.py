@@ -0,0 +1,69 @@
+import os
+import time
+
+from flask import Flask
+
+from common import profiling, tracing
+
+def slow_search(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+    return 'ok'
+
+def make_client(directory):
+    app = Flask(__name__)
+
+    @app.route('/search/<int:page>')
+    def search(page):
+        return slow_search(0.05)
+
+    tracing.init_tracing(app, 'search', sample_rate=0)
+    profiling.init_profiling(app, 'search', sample_rate=0, directory=str(directory))
+    return app.test_client()
+
+def test_admin_header_profiles_one_request(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'let-me-in')
+    client = make_client(tmp_path)
+
+    client.get('/search/1')
+    client.get('/search/1', headers={'X-Profile': 'wrong'})
+    assert list(tmp_path.iterdir()) == []
+
+    client.get('/search/2', headers={'X-Profile': 'let-me-in', 'X-Request-ID': 'req-1'})
+    client.get('/search/3', headers={'X-Profile': 'let-me-in', 'X-Profile-Mode': 'sample', 'X-Request-ID': 'req-2'})
+
+    names = sorted(path.name.split('ms-', 1)[1] for path in tmp_path.iterdir())
+    assert names == ['req-1.json', 'req-1.prof', 'req-2.json']
+    assert all(path.name.startswith('search-GET-search_int_page-') for path in tmp_path.iterdir())
+
+    profiles = {profile['request_id']: profile for profile in profiling.load_profiles([str(tmp_path)])}
+    assert profiles['req-1']['mode'] == 'cprofile'
+    assert profiles['req-2']['mode'] == 'sample'
+    for profile in profiles.values():
+        assert profile['route'] == '/search/<int:page>'
+        assert profile['duration'] >= 0.05
+        assert any('(slow_search)' in row['function'] for row in profile['functions'])
+
+    profiling.main([str(tmp_path), '--top', '3'])
+    out = capsys.readouterr().out
+    assert 'search GET /search/<int:page>: 2 profiles' in out
+
+def test_sampled_time_is_attributed_to_callers():
+    sampler = profiling.StackSampler(0, interval=0.01)
+    sampler.stacks[(('app.py', 1, 'search'), ('db.py', 5, 'execute'))] = 3
+    sampler.stacks[(('app.py', 1, 'search'), ('app.py', 9, 'rank'))] = 1
+
+    rows = {row['function']: row for row in sampler.functions()}
+    assert rows['app.py:1(search)']['self'] == 0
+    assert abs(rows['app.py:1(search)']['cumulative'] - 0.04) < 1e-9
+    assert abs(rows['db.py:5(execute)']['self'] - 0.03) < 1e-9
+
+def test_only_the_newest_profiles_are_kept(tmp_path):
+    for age, name in enumerate(['c', 'b', 'a']):
+        (tmp_path / f'{name}.json').write_text('{}')
+        os.utime(tmp_path / f'{name}.json', (1000 - age, 1000 - age))
+    (tmp_path / 'a.prof').write_bytes(b'')
+
+    profiling.prune_profiles(str(tmp_path), keep=1)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['c.json']
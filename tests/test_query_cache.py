@@ -0,0 +1,50 @@
+from conftest import load_service_module
+
+query_cache = load_service_module('services/search_service/app/utils/query_cache.py')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hits_expire_after_ttl():
+    clock = FakeClock()
+    cache = query_cache.QueryCache(ttl=10, clock=clock)
+    cache.set((1, 'report'), b'{}')
+
+    assert cache.get((1, 'report')) == b'{}'
+    clock.now = 11
+    assert cache.get((1, 'report')) is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+    assert stats['entries'] == 0 and stats['bytes'] == 0
+
+def test_evicts_least_recently_used():
+    cache = query_cache.QueryCache(max_entries=2)
+    cache.set((1, 'a'), b'a')
+    cache.set((1, 'b'), b'b')
+    cache.get((1, 'a'))
+    cache.set((1, 'c'), b'c')
+
+    assert cache.get((1, 'b')) is None
+    assert cache.get((1, 'a')) == b'a'
+    assert cache.stats()['evictions'] == 1
+
+def test_invalidation_is_per_user_and_blocks_stale_writes():
+    cache = query_cache.QueryCache()
+    cache.set((1, 'a'), b'a')
+    cache.set((2, 'a'), b'a')
+    generation = cache.generation(1)
+
+    cache.invalidate_users([1])
+    assert cache.get((1, 'a')) is None
+    assert cache.get((2, 'a')) == b'a'
+
+    # Computed before the invalidation, so it must not be stored
+    assert cache.set((1, 'a'), b'stale', generation=generation) is False
+    assert cache.set((1, 'a'), b'fresh', generation=cache.generation(1)) is True
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from conftest import load_service_module
+
+metadata = load_service_module('services/search_service/app/utils/metadata.py')
+
+def test_mime_family():
+    assert metadata.mime_family('application/pdf') == 'pdf'
+    assert metadata.mime_family('application/vnd.openxmlformats-officedocument.wordprocessingml.document') == 'document'
+    assert metadata.mime_family('image/png') == 'image'
+    assert metadata.mime_family('text/plain') == 'text'
+    assert metadata.mime_family('application/zip') == 'other'
+    assert metadata.mime_family(None) == 'other'
+
+def test_promoted_columns():
+    columns = metadata.promoted_columns({
+        'user_id': '7',
+        'file_type': 'application/pdf',
+        'upload_date': '2024-03-05T10:20:30.123456'
+    })
+    assert columns == {
+        'owner_id': 7,
+        'file_type': 'application/pdf',
+        'file_family': 'pdf',
+        'upload_date': datetime(2024, 3, 5, 10, 20, 30, 123456)
+    }
+
+def test_promoted_columns_tolerates_missing_values():
+    columns = metadata.promoted_columns({'upload_date': 'not a date'})
+    assert columns == {'owner_id': None, 'file_type': None, 'file_family': 'other', 'upload_date': None}
@@ -0,0 +1,53 @@
+import pytest
+
+from common import signing
+
+SECRET = 'test-secret'
+
+def test_round_trip():
+    token, expires = signing.sign_download(
+        SECRET, 'docs', doc_id=7, path='3/20240101_000000_report.pdf',
+        ttl=300, filename='report.pdf', mimetype='application/pdf', now=1000
+    )
+    claims = signing.verify_download(SECRET, 'docs', token, now=1000)
+
+    assert claims['doc_id'] == 7
+    assert claims['path'] == '3/20240101_000000_report.pdf'
+    assert claims['expires'] == expires
+    assert claims['byte_range'] is None
+    assert claims['attachment'] is False
+
+def test_expiry_is_bucketed_for_cacheable_urls():
+    first, _ = signing.sign_download(SECRET, 'docs', 1, '1/a.txt', ttl=300, now=1001)
+    second, _ = signing.sign_download(SECRET, 'docs', 1, '1/a.txt', ttl=300, now=1019)
+    assert first == second
+
+def test_tampered_token_is_rejected():
+    token, _ = signing.sign_download(SECRET, 'docs', 1, '1/a.txt', now=1000)
+    payload, signature = token.split('.')
+    forged, _ = signing.sign_download(SECRET, 'docs', 1, '2/b.txt', now=1000)
+
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify_download(SECRET, 'docs', f"{forged.split('.')[0]}.{signature}", now=1000)
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify_download('other-secret', 'docs', token, now=1000)
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify_download(SECRET, 'docs', 'not-a-token', now=1000)
+
+def test_token_for_another_service_is_rejected():
+    token, _ = signing.sign_download(SECRET, 'share', 1, '1/a.txt', now=1000)
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify_download(SECRET, 'docs', token, now=1000)
+    assert signing.verify_download(SECRET, 'share', token, now=1000)['path'] == '1/a.txt'
+
+def test_expired_token_is_rejected():
+    token, expires = signing.sign_download(SECRET, 'docs', 1, '1/a.txt', ttl=60, now=1000)
+    with pytest.raises(signing.SignatureExpired):
+        signing.verify_download(SECRET, 'docs', token, now=expires + 1)
+
+def test_parse_byte_range():
+    assert signing.parse_byte_range('0-99') == (0, 99)
+    with pytest.raises(ValueError):
+        signing.parse_byte_range('99-0')
+    with pytest.raises(ValueError):
+        signing.parse_byte_range('abc')
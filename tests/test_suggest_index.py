@@ -0,0 +1,36 @@
+from conftest import load_service_module
+
+suggest_index = load_service_module('services/search_service/app/utils/suggest_index.py')
+
+DOCUMENTS = [
+    (1, 'Quarterly_Report_Q3.pdf'),
+    (2, 'quarterly budget.xlsx'),
+    (3, 'Team photo.png'),
+    (4, 'annual report.docx'),
+    (5, None)
+]
+
+def test_whole_name_matches_come_first():
+    index = suggest_index.SuggestionIndex(DOCUMENTS)
+    result = index.complete('quar', limit=5)
+
+    assert [f['doc_id'] for f in result['filenames']] == [2, 1]
+    assert result['filenames'][1]['filename'] == 'Quarterly_Report_Q3.pdf'
+    assert result['terms'] == ['quarterly']
+
+def test_word_prefix_matches_and_term_ranking():
+    index = suggest_index.SuggestionIndex(DOCUMENTS)
+    result = index.complete('rep', limit=5)
+
+    assert {f['doc_id'] for f in result['filenames']} == {1, 4}
+    assert result['terms'] == ['report']
+
+    # Underscores and case are normalized like /search does
+    assert [f['doc_id'] for f in index.complete('QUARTERLY_REP')['filenames']] == [1]
+
+def test_limit_and_empty_prefix():
+    index = suggest_index.SuggestionIndex(DOCUMENTS)
+    assert len(index) == 4
+    assert len(index.complete('q', limit=1)['filenames']) == 1
+    assert index.complete('  ') == {'filenames': [], 'terms': []}
+    assert index.complete('zzz') == {'filenames': [], 'terms': []}
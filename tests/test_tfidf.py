@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import load_service_module
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+tfidf = load_service_module('services/search_service/app/utils/tfidf.py')
+
+DOCUMENTS = [
+    (1, 1, 'Quarterly revenue grew while operating costs fell in the third quarter'),
+    (2, 1, 'Revenue and operating costs for the quarter, with a revenue forecast'),
+    (3, 1, 'Team offsite photos from the mountain hiking trip'),
+    (4, 2, 'Quarterly revenue report with operating costs and forecast')
+]
+
+def test_ranks_by_cosine_within_accessible_documents(tmp_path):
+    index = tfidf.SimilarityIndex(str(tmp_path))
+    index.update(DOCUMENTS, watermark='2024-01-01T00:00:00')
+
+    results = index.similar(DOCUMENTS[0][2], k=5, owner_id=1, exclude_doc_id=1)
+    assert [doc_id for doc_id, _ in results] == [2]
+
+    results = index.similar(DOCUMENTS[0][2], k=5, owner_id=1, allowed_doc_ids=[4], exclude_doc_id=1)
+    assert [doc_id for doc_id, _ in results][0] in (2, 4)
+    assert all(0 < score <= 1 for _, score in results)
+
+def test_updates_survive_reload_and_compaction(tmp_path):
+    index = tfidf.SimilarityIndex(str(tmp_path))
+    index.update(DOCUMENTS, watermark='2024-01-01T00:00:00')
+    index.compact()
+    index.update([(2, 1, 'Mountain hiking trip photos')], removed=[4], watermark='2024-01-02T00:00:00')
+
+    reloaded = tfidf.SimilarityIndex(str(tmp_path))
+    assert sorted(reloaded.doc_ids()) == [1, 2, 3]
+    assert [doc_id for doc_id, _ in reloaded.similar(DOCUMENTS[2][2], owner_id=1, exclude_doc_id=3)] == [2]
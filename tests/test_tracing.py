@@ -0,0 +1,77 @@
+import os
+
+from flask import Flask, jsonify
+
+from common import tracing
+
+PARENT = '00-' + 'a' * 32 + '-' + 'b' * 16
+
+def make_client(sample_rate, edge=False):
+    app = Flask(__name__)
+
+    @app.route('/upload')
+    def upload():
+        with tracing.span('file.write', path='report.pdf'):
+            headers = tracing.outgoing_headers({'X-Request-Id': 'stale', 'Authorization': 'Bearer t'})
+        return jsonify(headers)
+
+    tracing.init_tracing(app, 'docs', sample_rate=sample_rate, edge=edge)
+    return app.test_client()
+
+def test_sampled_parent_is_followed_and_spans_exported(tmp_path):
+    tracing.exporter.directory = str(tmp_path)
+    client = make_client(sample_rate=0)
+
+    response = client.get('/upload', headers={'traceparent': PARENT + '-01', 'X-Request-ID': 'req-1'})
+    forwarded = response.get_json()
+    tracing.exporter.flush()
+
+    assert response.headers['X-Request-ID'] == 'req-1'
+    assert forwarded['X-Request-ID'] == 'req-1'
+    assert 'X-Request-Id' not in forwarded
+    assert forwarded['traceparent'].startswith('00-' + 'a' * 32 + '-')
+    assert forwarded['traceparent'].endswith('-01')
+
+    spans = {span['name']: span for span in tracing.load_spans([str(path) for path in tmp_path.iterdir()])}
+    assert set(spans) == {'GET /upload', 'file.write'}
+    assert spans['GET /upload']['parentSpanId'] == 'b' * 16
+    assert spans['file.write']['parentSpanId'] == spans['GET /upload']['spanId']
+    assert spans['file.write']['attributes'] == {'path': 'report.pdf'}
+    assert spans['file.write']['service'] == 'docs'
+
+def test_unsampled_requests_keep_a_request_id_but_record_nothing(tmp_path):
+    tracing.exporter.directory = str(tmp_path)
+    client = make_client(sample_rate=0)
+
+    response = client.get('/upload', headers={'X-Request-ID': 'bad id; drop'})
+    forwarded = response.get_json()
+    tracing.exporter.flush()
+
+    # An unusable incoming id is replaced
+    assert response.headers['X-Request-ID'] == forwarded['X-Request-ID'] != 'bad id; drop'
+    assert forwarded['traceparent'].endswith('-00')
+    assert list(tmp_path.iterdir()) == []
+
+def test_edge_ignores_a_client_traceparent(tmp_path):
+    tracing.exporter.directory = str(tmp_path)
+    client = make_client(sample_rate=0, edge=True)
+
+    forwarded = client.get('/upload', headers={'traceparent': PARENT + '-01'}).get_json()
+    tracing.exporter.flush()
+
+    assert 'a' * 32 not in forwarded['traceparent']
+    assert forwarded['traceparent'].endswith('-00')
+    assert list(tmp_path.iterdir()) == []
+
+def test_full_files_are_rotated_and_pruned(tmp_path):
+    exporter = tracing.Exporter(str(tmp_path), endpoint=None, max_bytes=1, max_files=2)
+    exporter.name = 'docs'
+    root = tracing.Span('docs', 'GET /upload', 'a' * 32, None, True, 'req-1')
+    root.end_ns = root.start_ns
+    for _ in range(4):
+        exporter._write([root])
+
+    files = list(tmp_path.iterdir())
+    assert len(files) == 2
+    assert all(path.name.startswith(f'docs.{os.getpid()}.') for path in files)
+    assert len(tracing.load_spans([str(path) for path in files])) == 2
@@ -0,0 +1,54 @@
+import io
+import os
+import zipfile
+from datetime import datetime
+
+from conftest import load_service_module
+
+zip_stream = load_service_module('services/doc_mgmt_service/app/utils/zip_stream.py')
+
+def test_stream_zip_round_trip(tmp_path):
+    text = tmp_path / 'notes.txt'
+    text.write_bytes(b'hello world\n' * 5000)
+    image = tmp_path / 'photo.png'
+    image.write_bytes(os.urandom(300 * 1024))
+
+    entries = [
+        {'path': str(text), 'name': 'notes.txt', 'mimetype': 'text/plain',
+         'modified': datetime(2024, 5, 1, 12, 30)},
+        {'path': str(image), 'name': 'photo.png', 'mimetype': 'image/png'},
+        {'path': str(text), 'name': 'notes.txt', 'mimetype': 'text/plain'}
+    ]
+    chunks = list(zip_stream.stream_zip(entries, chunk_size=64 * 1024))
+
+    # The archive arrives in pieces rather than as one buffered blob
+    assert len(chunks) > 3
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['notes.txt', 'photo.png', 'notes (2).txt']
+        assert archive.read('notes.txt') == text.read_bytes()
+        assert archive.read('photo.png') == image.read_bytes()
+        assert archive.getinfo('notes.txt').compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo('photo.png').compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo('notes.txt').date_time == (2024, 5, 1, 12, 30, 0)
+
+def test_stream_zip_reports_missing_files(tmp_path):
+    present = tmp_path / 'a.txt'
+    present.write_bytes(b'a')
+    entries = [
+        {'path': str(present), 'name': 'a.txt'},
+        {'path': str(tmp_path / 'gone.pdf'), 'name': 'gone.pdf'}
+    ]
+    data = b''.join(zip_stream.stream_zip(entries))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ['a.txt', 'EXPORT_ERRORS.txt']
+        assert b'gone.pdf' in archive.read('EXPORT_ERRORS.txt')
+
+def test_arcnames_cannot_leave_the_archive_folder():
+    used = set()
+    names = [
+        zip_stream.unique_arcname(name, used)
+        for name in ['../../etc/passwd', '..\\..\\boot.ini', 'C:evil.txt', '/abs/report.pdf', '..', 'passwd']
+    ]
+    assert names == ['passwd', 'boot.ini', 'evil.txt', 'report.pdf', 'file', 'passwd (2)']